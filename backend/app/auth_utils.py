@@ -1,13 +1,25 @@
+import asyncio
 import bcrypt
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from jose import jwt
 import os
-from typing import Optional
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
 
 # Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Usernames allowed to run operator actions that affect every user (comma-separated)
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
+
+# bcrypt threads (the library releases the GIL while hashing); 0 hashes inline on the event loop
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hash requests allowed to wait for a thread before new ones are turned away
+AUTH_HASH_QUEUE_SIZE = int(os.getenv("AUTH_HASH_QUEUE_SIZE", "32"))
 
 def verify_password(plain_password, hashed_password):
     # bcrypt requires bytes
@@ -33,3 +45,64 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+
+class HashPoolBusy(Exception):
+    """Raised when the bcrypt pool's queue is full; callers answer 503."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt off the event loop in a small dedicated thread pool.
+    A single hash costs hundreds of milliseconds of CPU, so doing it inline
+    stalls every other request on the worker. At most `workers + queue_size`
+    hashes are accepted at a time; a login storm beyond that gets
+    HashPoolBusy instead of an ever-growing queue.
+    """
+
+    def __init__(self, workers: int = AUTH_HASH_WORKERS, queue_size: int = AUTH_HASH_QUEUE_SIZE):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt") if workers > 0 else None
+        # Decremented from the pool threads
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _done(self, _future) -> None:
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        if self._executor is None:
+            self.completed += 1
+            return fn(*args)
+        with self._lock:
+            if self.pending >= self.capacity:
+                self.rejected += 1
+                raise HashPoolBusy()
+            self.pending += 1
+        # Counted until the thread finishes, even if the request is cancelled meanwhile
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    async def verify(self, plain_password, hashed_password) -> bool:
+        return await self.run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password) -> str:
+        return await self.run(get_password_hash, password)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+password_hasher = PasswordHasher()
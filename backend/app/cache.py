@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, List, Tuple
+
+from sqlalchemy import delete, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import LLMResultCache
+from .chains import PARSER_SCHEMA_VERSION, current_prompt_version
+from .preprocessing import preprocess_fingerprint
+from .llm import MODEL_NAME
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+_TRAILING_WS = re.compile(r"[ \t]+$", re.MULTILINE)
+_BLANK_RUNS = re.compile(r"\n{3,}")
+
+# Metadata keys that are actually sent to the chains. Anything else (e.g. Date)
+# does not change the LLM output and would only lower the hit rate.
+_KEY_METADATA_FIELDS = ("From", "To", "Subject")
+
+
+@dataclass
+class CachedResult:
+    is_privileged: bool
+    privilege_type: Optional[str]
+    reasoning: Optional[str]
+    log_description: Optional[str]
+    redaction_items: Optional[List[str]]
+    # The chains that produced it (routes.processing.result_stages), for the fingerprint of a hit
+    stages: Tuple[str, ...] = ()
+
+
+def normalize_body(text: str) -> str:
+    """
+    Canonical form of an email body for hashing.
+    Copies of the same message exported from different mailboxes differ in
+    line endings and trailing whitespace, not in content.
+    """
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = _TRAILING_WS.sub("", text)
+    text = _BLANK_RUNS.sub("\n\n", text)
+    return text.strip()
+
+
+def current_pipeline_version() -> str:
+    """
+    What besides the prompts and the model decides the result for a body:
+    the pre-processing settings and the output parser version.
+    """
+    return f"{preprocess_fingerprint()}-{PARSER_SCHEMA_VERSION}"
+
+
+def make_cache_key(
+    body: str,
+    metadata: dict,
+    prompt_version: Optional[str] = None,
+    model_name: str = MODEL_NAME,
+    pipeline_mode: str = "staged",
+) -> str:
+    prompt_version = prompt_version or current_prompt_version()
+    body_hash = hashlib.sha256(normalize_body(body).encode("utf-8")).hexdigest()
+    key_material = {
+        "body": body_hash,
+        "metadata": {k: (metadata.get(k) or "").strip() for k in _KEY_METADATA_FIELDS},
+        "prompt_version": prompt_version,
+        "pipeline_version": current_pipeline_version(),
+        "model": model_name,
+    }
+    # Fused results are cached separately; staged keys keep their old value
+    if pipeline_mode != "staged":
+        key_material["pipeline_mode"] = pipeline_mode
+    return hashlib.sha256(json.dumps(key_material, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Persistent, content-addressed cache of pipeline results stored in Postgres.
+    A hit replaces the judge, writer and redactor calls entirely.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, db: AsyncSession, key: str) -> Optional[CachedResult]:
+        if not self.enabled:
+            return None
+        row = await db.get(LLMResultCache, key)
+        # Entries written before stages were recorded cannot say which prompts they came from
+        if row is None or not row.stages:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return CachedResult(
+            is_privileged=row.is_privileged,
+            privilege_type=row.privilege_type,
+            reasoning=row.reasoning,
+            log_description=row.log_description,
+            redaction_items=row.redaction_items,
+            stages=tuple(row.stages),
+        )
+
+    async def put(self, db: AsyncSession, key: str, result: CachedResult) -> None:
+        """Stages the entry on the session; it is committed with the caller's transaction."""
+        await self.put_many(db, [(key, result)])
+
+    async def put_many(self, db: AsyncSession, entries: List[Tuple[str, CachedResult]]) -> None:
+        """Writes several entries with one multi-row INSERT, skipping keys that already exist."""
+        if not self.enabled or not entries:
+            return
+        prompt_version = current_prompt_version()
+        pipeline_version = current_pipeline_version()
+        stmt = pg_insert(LLMResultCache).values([
+            {
+                "cache_key": key,
+                "prompt_version": prompt_version,
+                "pipeline_version": pipeline_version,
+                "model_name": MODEL_NAME,
+                "is_privileged": result.is_privileged,
+                "privilege_type": result.privilege_type,
+                "reasoning": result.reasoning,
+                "log_description": result.log_description,
+                "redaction_items": result.redaction_items,
+                "stages": list(result.stages) or None,
+                "created_at": datetime.utcnow(),
+            }
+            for key, result in entries
+        ]).on_conflict_do_nothing(index_elements=["cache_key"])
+        await db.execute(stmt)
+
+    async def evict_stale(self, db: AsyncSession) -> int:
+        """
+        Deletes entries produced by a different prompt version, pre-processing
+        or parser version, or model, and entries that do not record their stages.
+        """
+        result = await db.execute(
+            delete(LLMResultCache).where(
+                or_(
+                    LLMResultCache.prompt_version != current_prompt_version(),
+                    # Entries written before the column existed are NULL: their keys no longer match either
+                    LLMResultCache.pipeline_version.is_distinct_from(current_pipeline_version()),
+                    LLMResultCache.model_name != MODEL_NAME,
+                    LLMResultCache.stages.is_(None),
+                )
+            )
+        )
+        await db.commit()
+        return result.rowcount or 0
+
+    async def clear(self, db: AsyncSession) -> int:
+        result = await db.execute(delete(LLMResultCache))
+        await db.commit()
+        return result.rowcount or 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "prompt_version": current_prompt_version(),
+            "pipeline_version": current_pipeline_version(),
+            "model_name": MODEL_NAME,
+        }
+
+
+result_cache = ResultCache(enabled=LLM_CACHE_ENABLED)
@@ -1,8 +1,15 @@
+import asyncio
+import hashlib
+import json
+import os
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.runnables import Runnable, RunnableConfig
 from pydantic import BaseModel, Field
-from typing import List, Optional
-from .llm import llm
+from typing import Any, AsyncIterator, Dict, List, Optional, Type
+from .llm import llm, MODEL_NAME
+from .metrics import span
+from .preprocessing import preprocess_fingerprint
 
 # --- Data Models for LLM Output ---
 
@@ -17,6 +24,14 @@ class PrivilegeDescription(BaseModel):
 class RedactionOutput(BaseModel):
     items: List[str] = Field(description="List of exact text strings from the email that contain privileged information")
 
+class FusedAnalysis(BaseModel):
+    """Judge, writer and redactor output from a single call (fused pipeline mode)."""
+    is_privileged: bool = Field(description="Whether the email is Attorney-Client Privileged or Work Product")
+    privilege_type: Optional[str] = Field(description="Type of privilege: 'Attorney-Client', 'Work Product', or None")
+    reasoning: str = Field(description="Brief legal reasoning for the classification")
+    log_description: Optional[str] = Field(description="If privileged: a neutral, professional log description that does not reveal sensitive info; otherwise null")
+    items: List[str] = Field(description="If privileged: exact text strings from the email that contain privileged information; otherwise an empty list")
+
 # --- Prompts ---
 
 judge_system_prompt = """You are a senior litigation attorney. Your task is to analyze email content and determine if it is privileged.
@@ -43,28 +58,196 @@ Return the EXACT text strings of the sensitive sentences or clauses from the pro
 If there is no sensitive text, return an empty list.
 """
 
+fused_system_prompt = """You are a senior litigation attorney. Your task is to review an email for privilege and, if it is privileged, prepare its privilege log entry and redactions.
+
+RULES:
+1. Identify if the document is Attorney-Client Privileged (ACP) or Attorney Work Product (AWP).
+2. ACP requires communication between client and counsel for the purpose of legal advice.
+3. AWP requires document prepared in anticipation of litigation.
+4. If NOT privileged, return is_privileged=False, log_description=null and an empty items list.
+5. Provide clear reasoning.
+6. The log description must be neutral and professional and must NOT reveal the confidential advice or specific sensitive details (dollar amounts, strategy). Use the format: "[Type of communication] regarding [General Topic]."
+7. items must be the EXACT text strings of the sensitive sentences or clauses from the email body.
+"""
+
+judge_user_template = "Sender: {sender}\nRecipient: {recipient}\nSubject: {subject}\n\nEmail Body:\n{body}\n\n{format_instructions}"
+writer_user_template = "Privilege Reason: {reasoning}\n\nEmail Body:\n{body}\n\n{format_instructions}"
+redactor_user_template = "Email Body:\n{body}\n\n{format_instructions}"
+fused_user_template = judge_user_template
+
+# Prompts can be overridden without a redeploy by dropping <name>.txt files
+# (e.g. judge_system.txt) into PROMPTS_DIR and reloading the registry.
+PROMPTS_DIR = os.getenv("PROMPTS_DIR")
+# Seconds between checks of PROMPTS_DIR for edits; 0 disables the watcher
+PROMPTS_WATCH_INTERVAL = float(os.getenv("PROMPTS_WATCH_INTERVAL", "0"))
+
+DEFAULT_PROMPTS = {
+    "judge_system": judge_system_prompt,
+    "judge_user": judge_user_template,
+    "writer_system": writer_system_prompt,
+    "writer_user": writer_user_template,
+    "redactor_system": redactor_system_prompt,
+    "redactor_user": redactor_user_template,
+    "fused_system": fused_system_prompt,
+    "fused_user": fused_user_template,
+}
+
+# Bump when the handling of chain output changes (parsing, merging chunk results)
+# without any prompt changing, so stored results are picked up by the re-review
+PARSER_SCHEMA_VERSION = "1"
+
+# chain name -> (output schema, system prompt key, user prompt key)
+CHAIN_SPECS = {
+    "judge": (PrivilegeClassification, "judge_system", "judge_user"),
+    "writer": (PrivilegeDescription, "writer_system", "writer_user"),
+    "redactor": (RedactionOutput, "redactor_system", "redactor_user"),
+    "fused": (FusedAnalysis, "fused_system", "fused_user"),
+}
+
+def load_prompts(prompts_dir: Optional[str] = PROMPTS_DIR) -> Dict[str, str]:
+    prompts = dict(DEFAULT_PROMPTS)
+    if prompts_dir:
+        for name in prompts:
+            path = os.path.join(prompts_dir, f"{name}.txt")
+            if os.path.isfile(path):
+                with open(path, encoding="utf-8") as f:
+                    prompts[name] = f.read()
+    return prompts
+
+def compute_prompt_version(prompts: Optional[Dict[str, str]] = None) -> str:
+    """
+    Short fingerprint of every prompt the pipeline sends.
+    Editing any prompt changes this value, which invalidates cached results.
+    """
+    prompts = prompts or DEFAULT_PROMPTS
+    digest = hashlib.sha256()
+    for name in sorted(prompts):
+        digest.update(name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(prompts[name].encode("utf-8"))
+        digest.update(b"\0")
+    # The output schemas feed the format instructions, so they are part of the prompt too
+    for schema, _, _ in CHAIN_SPECS.values():
+        digest.update(json.dumps(schema.model_json_schema(), sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+def compute_stage_fingerprints(prompts: Optional[Dict[str, str]] = None, model_name: str = MODEL_NAME) -> Dict[str, str]:
+    """
+    Per chain: a hash of its own prompts, output schema, the model and
+    PARSER_SCHEMA_VERSION. Unlike the prompt version, editing the writer
+    prompt changes only the writer's fingerprint.
+    """
+    prompts = prompts or DEFAULT_PROMPTS
+    fingerprints = {}
+    for name, (schema, system_key, user_key) in CHAIN_SPECS.items():
+        digest = hashlib.sha256()
+        for part in (model_name, PARSER_SCHEMA_VERSION, prompts[system_key], prompts[user_key], json.dumps(schema.model_json_schema(), sort_keys=True)):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        fingerprints[name] = digest.hexdigest()[:12]
+    return fingerprints
+
 # --- Chains ---
 
-def get_judge_chain():
-    parser = JsonOutputParser(pydantic_object=PrivilegeClassification)
+def build_chain(schema: Type[BaseModel], system_prompt: str, user_template: str):
+    parser = JsonOutputParser(pydantic_object=schema)
     prompt = ChatPromptTemplate.from_messages([
-        ("system", judge_system_prompt),
-        ("user", "Sender: {sender}\nRecipient: {recipient}\nSubject: {subject}\n\nEmail Body:\n{body}\n\n{format_instructions}")
+        ("system", system_prompt),
+        ("user", user_template)
     ]).partial(format_instructions=parser.get_format_instructions())
     return prompt | llm | parser
 
+class InstrumentedChain(Runnable):
+    """
+    A built chain plus a `chain.<name>` tracing span per call. The name also
+    goes into the run metadata, where GovernedLLM picks it up to label its
+    call and token metrics.
+    """
+
+    def __init__(self, name: str, chain: Runnable):
+        self.name = name
+        self.chain = chain.with_config(run_name=name, metadata={"chain": name})
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        with span(f"chain.{self.name}"):
+            return self.chain.invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        async with span(f"chain.{self.name}"):
+            return await self.chain.ainvoke(input, config, **kwargs)
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        async with span(f"chain.{self.name}", streamed=True):
+            async for output in self.chain.astream(input, config, **kwargs):
+                yield output
+
+class ChainRegistry:
+    """
+    Builds each chain once and hands the same object to every request.
+    Chains are stateless, so sharing them across concurrent requests is safe.
+    reload() rebuilds everything from the current prompts and swaps the whole
+    set in one assignment; requests already running keep the chain they hold.
+    """
+
+    def __init__(self):
+        self.prompts = load_prompts()
+        self.prompt_version = compute_prompt_version(self.prompts)
+        self.stage_fingerprints = compute_stage_fingerprints(self.prompts)
+        self._chains: Optional[Dict[str, Any]] = None
+
+    def build(self) -> str:
+        prompts = load_prompts()
+        chains = {
+            name: InstrumentedChain(name, build_chain(schema, prompts[system_key], prompts[user_key]))
+            for name, (schema, system_key, user_key) in CHAIN_SPECS.items()
+        }
+        self._chains, self.prompts, self.prompt_version = chains, prompts, compute_prompt_version(prompts)
+        self.stage_fingerprints = compute_stage_fingerprints(prompts)
+        return self.prompt_version
+
+    def reload(self) -> bool:
+        """Rebuilds the chains; returns True if the prompts changed."""
+        previous = self.prompt_version
+        self.build()
+        return self.prompt_version != previous
+
+    def get(self, name: str):
+        if self._chains is None:
+            self.build()
+        return self._chains[name]
+
+    async def watch(self, interval: float) -> None:
+        """Polls PROMPTS_DIR and rebuilds the chains when a prompt file changes."""
+        while True:
+            await asyncio.sleep(interval)
+            if compute_prompt_version(load_prompts()) != self.prompt_version:
+                self.build()
+                print(f"Prompts changed, chains rebuilt (prompt version {self.prompt_version})")
+
+chain_registry = ChainRegistry()
+
+def current_prompt_version() -> str:
+    return chain_registry.prompt_version
+
+def pipeline_fingerprint(*stages: str) -> Dict[str, str]:
+    """
+    Stamp for a stored result: the model, the pre-processing settings and
+    the fingerprint of each chain that contributed to it.
+    """
+    current = chain_registry.stage_fingerprints
+    return {"model": MODEL_NAME, "preprocess": preprocess_fingerprint(), **{stage: current[stage] for stage in stages}}
+
+def current_pipeline_fingerprint() -> Dict[str, str]:
+    return pipeline_fingerprint(*CHAIN_SPECS)
+
+def get_judge_chain():
+    return chain_registry.get("judge")
+
 def get_writer_chain():
-    parser = JsonOutputParser(pydantic_object=PrivilegeDescription)
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", writer_system_prompt),
-        ("user", "Privilege Reason: {reasoning}\n\nEmail Body:\n{body}\n\n{format_instructions}")
-    ]).partial(format_instructions=parser.get_format_instructions())
-    return prompt | llm | parser
+    return chain_registry.get("writer")
 
 def get_redactor_chain():
-    parser = JsonOutputParser(pydantic_object=RedactionOutput)
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", redactor_system_prompt),
-        ("user", "Email Body:\n{body}\n\n{format_instructions}")
-    ]).partial(format_instructions=parser.get_format_instructions())
-    return prompt | llm | parser
+    return chain_registry.get("redactor")
+
+def get_fused_chain():
+    return chain_registry.get("fused")
@@ -0,0 +1,190 @@
+import hashlib
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+# MinHash/LSH parameters: 16 bands of 8 rows put the LSH candidate threshold
+# around Jaccard 0.7; candidates are then checked against CLUSTER_SIMILARITY.
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+
+CLUSTER_SIMILARITY = float(os.getenv("CLUSTER_SIMILARITY", "0.8"))
+# Share of a thread member's shingles that must appear in the representative
+# before the representative's review is reused for it
+CLUSTER_CONTAINMENT = float(os.getenv("CLUSTER_CONTAINMENT", "0.9"))
+
+_EMPTY = -1
+# Offset added per bin when densifying, keeps borrowed values distinct from real ones
+_DENSIFY_STEP = 1 << 58
+
+_QUOTE_PREFIX = re.compile(r"^[ \t]*(>[ \t]*)+", re.MULTILINE)
+_NON_WORD = re.compile(r"[^\w@.]+")
+_MESSAGE_ID = re.compile(r"<[^<>\s]+>")
+
+RELATION_NEAR_DUPLICATE = "near_duplicate"
+RELATION_THREAD = "thread"
+
+
+def normalize_for_similarity(text: str) -> List[str]:
+    """Lower-cased word tokens with reply quoting (">") removed."""
+    text = _QUOTE_PREFIX.sub("", text.lower())
+    return [token for token in _NON_WORD.split(text) if token]
+
+
+def shingle_hashes(text: str, k: int = SHINGLE_SIZE) -> set:
+    tokens = normalize_for_similarity(text)
+    if len(tokens) < k:
+        grams = [" ".join(tokens)] if tokens else []
+    else:
+        grams = [" ".join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)]
+    return {int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "big") for g in grams}
+
+
+def minhash(shingles: set) -> Tuple[int, ...]:
+    """
+    One-permutation MinHash with rotation densification: each shingle hash is
+    routed to one of NUM_PERM bins and each bin keeps its minimum. This costs
+    one pass over the shingles instead of NUM_PERM passes, with the same
+    Jaccard estimate (fraction of equal slots) as classic MinHash.
+    """
+    bins = [_EMPTY] * NUM_PERM
+    for value in shingles:
+        slot = value % NUM_PERM
+        rest = value // NUM_PERM
+        if bins[slot] == _EMPTY or rest < bins[slot]:
+            bins[slot] = rest
+    if all(b == _EMPTY for b in bins):
+        return tuple(bins)
+    # Empty bins borrow from the next non-empty bin to the right (circularly)
+    signature = list(bins)
+    for i in range(NUM_PERM):
+        if bins[i] != _EMPTY:
+            continue
+        distance = 1
+        while bins[(i + distance) % NUM_PERM] == _EMPTY:
+            distance += 1
+        signature[i] = bins[(i + distance) % NUM_PERM] + distance * _DENSIFY_STEP
+    return tuple(signature)
+
+
+def estimated_jaccard(sig_a: Sequence[int], sig_b: Sequence[int]) -> float:
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def containment(part: set, whole: set) -> float:
+    """Share of `part` that also appears in `whole`."""
+    if not part:
+        return 1.0
+    return len(part & whole) / len(part)
+
+
+def parse_message_ids(value: Optional[str]) -> List[str]:
+    return _MESSAGE_ID.findall(value or "")
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+@dataclass
+class ClusterMember:
+    index: int
+    relation: str  # near_duplicate or thread
+    similarity: float
+
+
+@dataclass
+class Cluster:
+    representative: int
+    members: List[ClusterMember] = field(default_factory=list)
+
+
+def cluster_documents(documents: Sequence[Tuple[str, Dict[str, Any]]]) -> List[Cluster]:
+    """
+    Groups documents so only one per group needs LLM review.
+
+    Near-duplicates are found with MinHash/LSH over word shingles of the
+    normalized body. Threads come from Message-ID / In-Reply-To / References.
+    Within a group the representative is the most inclusive message (the one
+    with the most content, usually the latest reply quoting the rest); only
+    members whose text is contained in it (or that are near-duplicates of it)
+    are attached, the others become clusters of their own.
+    """
+    count = len(documents)
+    shingles = [shingle_hashes(text) for text, _ in documents]
+    signatures = [minhash(s) for s in shingles]
+    groups = _UnionFind(count)
+
+    # Near-duplicates: documents sharing any LSH band are candidates
+    near_duplicate_of: Dict[Tuple[int, int], float] = {}
+    buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+    for i, sig in enumerate(signatures):
+        for band in range(BANDS):
+            key = (band, sig[band * ROWS:(band + 1) * ROWS])
+            buckets.setdefault(key, []).append(i)
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        for pos, a in enumerate(members):
+            for b in members[pos + 1:]:
+                if (a, b) in near_duplicate_of:
+                    continue
+                similarity = estimated_jaccard(signatures[a], signatures[b])
+                if similarity >= CLUSTER_SIMILARITY:
+                    near_duplicate_of[(a, b)] = similarity
+                    groups.union(a, b)
+
+    # Threads: link each message to the messages it replies to or references
+    by_message_id: Dict[str, int] = {}
+    for i, (_, metadata) in enumerate(documents):
+        for message_id in parse_message_ids(metadata.get("Message-ID")):
+            by_message_id.setdefault(message_id, i)
+    for i, (_, metadata) in enumerate(documents):
+        for ref in parse_message_ids(metadata.get("In-Reply-To")) + parse_message_ids(metadata.get("References")):
+            j = by_message_id.get(ref)
+            if j is not None and j != i:
+                groups.union(i, j)
+
+    grouped: Dict[int, List[int]] = {}
+    for i in range(count):
+        grouped.setdefault(groups.find(i), []).append(i)
+
+    clusters: List[Cluster] = []
+    for indices in grouped.values():
+        remaining = sorted(indices, key=lambda i: (-len(shingles[i]), i))
+        while remaining:
+            representative = remaining.pop(0)
+            cluster = Cluster(representative=representative)
+            leftover = []
+            for i in remaining:
+                pair = (min(i, representative), max(i, representative))
+                if pair in near_duplicate_of:
+                    cluster.members.append(ClusterMember(i, RELATION_NEAR_DUPLICATE, round(near_duplicate_of[pair], 3)))
+                    continue
+                # Earlier messages of a thread are quoted in full by the later reply
+                contained = containment(shingles[i], shingles[representative])
+                if contained >= CLUSTER_CONTAINMENT:
+                    cluster.members.append(ClusterMember(i, RELATION_THREAD, round(contained, 3)))
+                else:
+                    leftover.append(i)
+            clusters.append(cluster)
+            remaining = leftover
+
+    clusters.sort(key=lambda c: c.representative)
+    return clusters
+
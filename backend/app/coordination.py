@@ -0,0 +1,246 @@
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from typing import Callable, Dict, Optional, Set
+
+import asyncpg
+from sqlalchemy import Float, extract, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from .database import engine
+from .governor import LLMGovernor, TokenBucket
+from .models import LLMRateBucket
+
+# Several API processes share the database (uvicorn --workers, or several
+# containers). On by default when uvicorn runs more than one worker; uvicorn
+# reads WEB_CONCURRENCY as its worker count.
+MULTI_WORKER = os.getenv(
+    "MULTI_WORKER", "true" if int(os.getenv("WEB_CONCURRENCY", "1")) > 1 else "false"
+).lower() in ("1", "true", "yes")
+# Seconds of a shared bucket's full rate that a process leases at a time
+LLM_SHARED_LEASE_SECONDS = float(os.getenv("LLM_SHARED_LEASE_SECONDS", "1"))
+# How often the governor looks again while a lease is being fetched
+_LEASE_POLL_SECONDS = 0.01
+# Wait after a lease failed (database unreachable)
+_LEASE_RETRY_SECONDS = 1.0
+
+BROADCAST_CHANNEL = "privilege_pipeline"
+# How often the listener checks its connection, and waits before reconnecting
+_LISTEN_CHECK_SECONDS = 5.0
+
+# Identifies this process in broadcasts, so it skips its own events
+NODE_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+async def advisory_xact_lock(conn: AsyncConnection, name: str) -> None:
+    """Waits for the advisory lock called name; it is released when conn's transaction ends."""
+    await conn.execute(select(func.pg_advisory_xact_lock(func.hashtext(name))))
+
+
+async def lease_tokens(name: str, want: float, capacity: float, rate_per_second: float, create: bool = False) -> float:
+    """
+    Takes up to `want` tokens from the shared bucket `name` and returns how
+    many it got. The refill since the last lease is computed from database
+    time, and the row lock makes concurrent leases from other processes wait
+    for this one. create=True first inserts the bucket (full), or updates its
+    capacity and rate from this process's settings.
+    """
+    async with engine.begin() as conn:
+        if create:
+            stmt = pg_insert(LLMRateBucket).values(
+                name=name, tokens=capacity, capacity=capacity, rate_per_second=rate_per_second, updated_at=func.clock_timestamp(),
+            )
+            await conn.execute(stmt.on_conflict_do_update(
+                index_elements=["name"],
+                set_={"capacity": stmt.excluded.capacity, "rate_per_second": stmt.excluded.rate_per_second},
+            ))
+        refilled = LLMRateBucket.tokens + extract("epoch", func.clock_timestamp() - LLMRateBucket.updated_at) * LLMRateBucket.rate_per_second
+        bucket = (
+            select(LLMRateBucket.name, func.least(LLMRateBucket.capacity, refilled).label("available"))
+            .where(LLMRateBucket.name == name)
+            .with_for_update()
+            .cte("bucket")
+        )
+        granted = func.least(literal(want, Float), func.greatest(bucket.c.available, literal(0.0, Float)))
+        result = await conn.execute(
+            update(LLMRateBucket)
+            .where(LLMRateBucket.name == bucket.c.name)
+            .values(tokens=bucket.c.available - granted, updated_at=func.clock_timestamp())
+            .returning(granted)
+        )
+        return float(result.scalar_one())
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    A governor bucket kept in Postgres (llm_rate_buckets) and shared by every
+    process. The process leases about LLM_SHARED_LEASE_SECONDS of the full
+    rate at a time and spends it locally, so admission stays a synchronous
+    check and the database sees about one short UPDATE per bucket, process
+    and lease period. A lease not spent within that period is dropped, not
+    handed back: an idle process can leave some quota unused, but the
+    processes together never go over it.
+    """
+
+    def __init__(self, name: str, rate_per_minute: float, on_lease: Callable[[], None],
+                 lease_seconds: float = LLM_SHARED_LEASE_SECONDS):
+        super().__init__(rate_per_minute)
+        self.name = name
+        self.on_lease = on_lease
+        self.lease_seconds = lease_seconds
+        # Only what this process leased
+        self.tokens = 0.0
+        self.expires = 0.0
+        self.leases = 0
+        self.lease_errors = 0
+        self._created = False
+        self._leasing: Optional[asyncio.Task] = None
+        self._retry_at = 0.0
+
+    def _refill(self) -> None:
+        # Tokens only come from leases; an expired lease is dropped (a debt from adjust_tokens is kept)
+        if self.tokens > 0 and time.monotonic() > self.expires:
+            self.tokens = 0.0
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        now = time.monotonic()
+        if self._leasing is None and now >= self._retry_at:
+            self._leasing = asyncio.get_running_loop().create_task(self._lease(amount - self.tokens))
+        # on_lease wakes the governor as soon as the lease is in
+        return max(self._retry_at - now, _LEASE_POLL_SECONDS)
+
+    def idle(self) -> bool:
+        # The bucket itself lives in the database: only a lease or a debt would be lost
+        self._refill()
+        return self._leasing is None and self.tokens == 0
+
+    async def _lease(self, need: float) -> None:
+        want = min(self.capacity, max(need, self.rate * self.lease_seconds))
+        try:
+            granted = await lease_tokens(self.name, want, self.capacity, self.rate, create=not self._created)
+        except Exception as e:
+            print(f"Could not lease from the shared {self.name} bucket: {e}")
+            self.lease_errors += 1
+            self._retry_at = time.monotonic() + _LEASE_RETRY_SECONDS
+        else:
+            self._created = True
+            self.leases += 1
+            self._refill()
+            self.tokens += granted
+            self.expires = time.monotonic() + self.lease_seconds
+            if granted < need:
+                # The shared bucket is drained: ask again once it has refilled enough
+                self._retry_at = time.monotonic() + (need - granted) / self.rate
+        finally:
+            self._leasing = None
+        self.on_lease()
+
+
+def shared_buckets(governor: LLMGovernor) -> Callable[[str, float], TokenBucket]:
+    """Bucket factory for governor.use_buckets."""
+    return lambda name, rate: SharedTokenBucket(name, rate, governor.wake)
+
+
+class Broadcaster:
+    """
+    Events that every API process has to act on, such as a prompt reload or a
+    retrained triage model. They are sent with NOTIFY and received on a
+    dedicated LISTEN connection. Handlers run in every process except the one
+    that published the event. A process misses the events sent while it is
+    reconnecting.
+    """
+
+    def __init__(self, channel: str = BROADCAST_CHANNEL):
+        self.channel = channel
+        self.received = 0
+        self._handlers: Dict[str, Callable[[dict], object]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+
+    def on(self, event: str, handler: Callable[[dict], object]) -> None:
+        """handler(message) may return a coroutine; it then runs as a task."""
+        self._handlers[event] = handler
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def publish(self, event: str, **payload) -> None:
+        """Sends event to the other processes; does nothing when the broadcaster was not started."""
+        if self._task is None:
+            return
+        message = json.dumps({"event": event, "origin": NODE_ID, **payload})
+        async with engine.begin() as conn:
+            await conn.execute(select(func.pg_notify(self.channel, message)))
+
+    def publish_soon(self, event: str, **payload) -> None:
+        """publish() for synchronous code such as ORM event hooks; runs as a task on the event loop."""
+        if self._task is None:
+            return
+        task = asyncio.get_running_loop().create_task(self._publish_logged(event, payload))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _publish_logged(self, event: str, payload: dict) -> None:
+        try:
+            await self.publish(event, **payload)
+        except Exception as e:
+            print(f"Could not broadcast {event}: {e}")
+
+    async def _listen(self) -> None:
+        # asyncpg directly: a LISTEN connection must not go back to the pool
+        dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                await connection.add_listener(self.channel, self._notified)
+                while not connection.is_closed():
+                    await asyncio.sleep(_LISTEN_CHECK_SECONDS)
+                print("Broadcast listener lost its connection, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Broadcast listener error: {e}")
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(_LISTEN_CHECK_SECONDS)
+
+    def _notified(self, connection, pid: int, channel: str, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            print(f"Ignoring malformed broadcast: {payload!r}")
+            return
+        if message.get("origin") == NODE_ID:
+            return
+        handler = self._handlers.get(message.get("event"))
+        if handler is None:
+            return
+        self.received += 1
+        try:
+            outcome = handler(message)
+        except Exception as e:
+            print(f"Broadcast handler for {message.get('event')} failed: {e}")
+            return
+        if asyncio.iscoroutine(outcome):
+            task = asyncio.create_task(outcome)
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+
+broadcaster = Broadcaster()
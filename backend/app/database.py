@@ -1,8 +1,12 @@
 import os
+import time
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from dotenv import load_dotenv
 
+from .metrics import METRICS_ENABLED, DB_POOL_WAIT, registry
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -14,13 +18,58 @@ if not DATABASE_URL:
 if DATABASE_URL.startswith("postgresql://"):
     DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
 
-engine = create_async_engine(DATABASE_URL)
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited (including opening a new connection)."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - started)
+
+# Pool sizing: each API worker process opens at most DB_POOL_SIZE + DB_MAX_OVERFLOW connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds to wait for a free connection before giving up (answered with a 503)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Connections older than this are replaced, ahead of server/proxy idle timeouts
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Test each connection on checkout (one round trip) so a restarted server does not fail requests
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# asyncpg prepared statement caches per connection; set 0 behind pgbouncer in transaction mode
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+
+engine = create_async_engine(
+    DATABASE_URL,
+    poolclass=InstrumentedPool if METRICS_ENABLED else AsyncAdaptedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args={
+        # SQLAlchemy's cache of asyncpg prepared statements, and asyncpg's own
+        "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+    },
+)
 SessionLocal = sessionmaker(
     bind=engine, 
     class_=AsyncSession, 
     expire_on_commit=False
 )
 
+@registry.collector
+def pool_metrics() -> list:
+    pool = engine.sync_engine.pool
+    return [
+        ("db_pool_size", "gauge", "Configured pool size.", [({}, pool.size())]),
+        ("db_pool_max_overflow", "gauge", "Connections allowed beyond the pool size.", [({}, DB_MAX_OVERFLOW)]),
+        ("db_pool_checked_out", "gauge", "Connections currently checked out.", [({}, pool.checkedout())]),
+        ("db_pool_overflow", "gauge", "Connections open beyond the pool size (negative while the pool is not full).", [({}, pool.overflow())]),
+    ]
+
 class Base(DeclarativeBase):
     pass
 
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from typing import Any, AsyncIterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Words that make the fake judge call a document privileged
+_PRIVILEGE_MARKERS = re.compile(
+    r"\b(attorney|counsel|legal advice|privileged|litigation|lawsuit|work product|settlement)\b",
+    re.IGNORECASE,
+)
+_SENTENCE = re.compile(r"[A-Z][^.!?\n]*[.!?]")
+# Characters per streamed chunk, roughly a few tokens
+_STREAM_CHUNK_CHARS = 16
+
+
+class FakeRateLimitError(Exception):
+    """Mimics the provider's 429 / RESOURCE_EXHAUSTED error."""
+
+    status_code = 429
+
+    def __init__(self, message: str = "429 RESOURCE_EXHAUSTED: fake quota exceeded"):
+        super().__init__(message)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic offline stand-in for the Gemini client.
+    It recognises which chain is calling from the format instructions in the
+    prompt and answers with valid JSON for that chain, so the whole pipeline
+    runs without network access. Latency, random failures and a concurrency
+    quota (answered with 429s) can be injected to exercise the governor.
+    """
+
+    model_name: str = "fake-llm"
+    latency_ms: float = 0.0
+    error_rate: float = 0.0
+    max_concurrency: int = 0  # 0 = unlimited; above this, calls fail with a 429
+    seed: Optional[int] = None
+
+    _in_flight: int = 0
+    _rng: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-privilege-llm"
+
+    def _random(self) -> random.Random:
+        if self._rng is None:
+            self._rng = random.Random(self.seed)
+        return self._rng
+
+    def _judge(self, body: str) -> dict:
+        marker = _PRIVILEGE_MARKERS.search(body)
+        return {
+            "is_privileged": bool(marker),
+            "privilege_type": "Attorney-Client" if marker else None,
+            "reasoning": (
+                f"The communication references '{marker.group(0)}' in a legal context."
+                if marker else "Routine business communication with no legal advice."
+            ),
+        }
+
+    def _describe(self) -> dict:
+        return {
+            "log_description": "Confidential communication between Client and Counsel requesting legal advice regarding a legal matter."
+        }
+
+    def _redact(self, body: str) -> dict:
+        sentences = [s.strip() for s in _SENTENCE.findall(body)]
+        return {"items": [s for s in sentences if _PRIVILEGE_MARKERS.search(s)][:5]}
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        prompt = "\n".join(str(m.content) for m in messages)
+        # The body sits between the "Email Body:" label and the parser's format instructions
+        body = prompt.split("Email Body:", 1)[-1].split("The output should be formatted", 1)[0]
+
+        if '"is_privileged"' in prompt:
+            payload = self._judge(body)
+            # Fused mode: one call answers for all three chains
+            if '"log_description"' in prompt:
+                privileged = payload["is_privileged"]
+                payload["log_description"] = self._describe()["log_description"] if privileged else None
+                payload["items"] = self._redact(body)["items"] if privileged else []
+        elif '"log_description"' in prompt:
+            payload = self._describe()
+        else:
+            payload = self._redact(body)
+
+        content = json.dumps(payload)
+        input_tokens = max(1, len(prompt) // 4)
+        output_tokens = max(1, len(content) // 4)
+        return AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        )
+
+    def _check_failures(self) -> None:
+        if self.max_concurrency and self._in_flight > self.max_concurrency:
+            raise FakeRateLimitError()
+        if self.error_rate and self._random().random() < self.error_rate:
+            raise RuntimeError("Fake LLM injected failure")
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        self._in_flight += 1
+        try:
+            self._check_failures()
+            if self.latency_ms:
+                time.sleep(self.latency_ms / 1000)
+            return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+        finally:
+            self._in_flight -= 1
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        self._in_flight += 1
+        try:
+            self._check_failures()
+            if self.latency_ms:
+                await asyncio.sleep(self.latency_ms / 1000)
+            return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+        finally:
+            self._in_flight -= 1
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        # The configured latency is spread over the chunks; usage comes with the last one
+        self._in_flight += 1
+        try:
+            self._check_failures()
+            message = self._respond(messages)
+            content = message.content
+            pieces = [content[i:i + _STREAM_CHUNK_CHARS] for i in range(0, len(content), _STREAM_CHUNK_CHARS)]
+            for n, piece in enumerate(pieces):
+                if self.latency_ms:
+                    await asyncio.sleep(self.latency_ms / 1000 / len(pieces))
+                last = n == len(pieces) - 1
+                chunk = AIMessageChunk(content=piece, usage_metadata=message.usage_metadata if last else None)
+                if run_manager:
+                    await run_manager.on_llm_new_token(piece, chunk=chunk)
+                yield ChatGenerationChunk(message=chunk)
+        finally:
+            self._in_flight -= 1
+
+
+def fake_llm_from_env() -> FakeChatModel:
+    seed = os.getenv("FAKE_LLM_SEED")
+    return FakeChatModel(
+        latency_ms=float(os.getenv("FAKE_LLM_LATENCY_MS", "0")),
+        error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+        max_concurrency=int(os.getenv("FAKE_LLM_MAX_CONCURRENCY", "0")),
+        seed=int(seed) if seed else None,
+    )
@@ -0,0 +1,567 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from .metrics import METRICS_ENABLED, LLM_CALLS, LLM_QUEUE_WAIT, LLM_RETRIES, LLM_TOKENS
+
+LLM_RPM = float(os.getenv("LLM_RPM", "1000"))
+LLM_TPM = float(os.getenv("LLM_TPM", "1000000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "4"))
+# A call slower than this multiple of the running average counts as congestion
+LLM_LATENCY_SPIKE_FACTOR = float(os.getenv("LLM_LATENCY_SPIKE_FACTOR", "3.0"))
+# Reserve for the completion when charging the tokens-per-minute bucket up front
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "256"))
+
+
+def _per_user(value: str) -> Dict[str, float]:
+    """Parses "12:2,40:0.5" (user id: value) into {"12": 2.0, "40": 0.5}."""
+    values = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        user, _, number = item.partition(":")
+        try:
+            values[user.strip()] = float(number)
+        except ValueError:
+            print(f"Ignoring malformed per-user setting {item!r}")
+    return values
+
+
+# Share of the LLM capacity per user when several users are waiting (default 1)
+LLM_USER_WEIGHTS = _per_user(os.getenv("LLM_USER_WEIGHTS", ""))
+# Concurrent calls one user may hold; 0 means no cap. LLM_USER_CONCURRENCY overrides it per user.
+LLM_USER_MAX_CONCURRENCY = int(os.getenv("LLM_USER_MAX_CONCURRENCY", "0"))
+LLM_USER_CONCURRENCY = _per_user(os.getenv("LLM_USER_CONCURRENCY", ""))
+# Tokens per minute one user may use; 0 means no quota. LLM_USER_TPM_OVERRIDES overrides it per user.
+LLM_USER_TPM = float(os.getenv("LLM_USER_TPM", "0"))
+LLM_USER_TPM_OVERRIDES = _per_user(os.getenv("LLM_USER_TPM_OVERRIDES", ""))
+# How often the governor drops the state of users with nothing queued or running
+_FLOW_SWEEP_SECONDS = 60.0
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+_PRIORITY_RANK = {PRIORITY_INTERACTIVE: 0, PRIORITY_BULK: 1}
+_PRIORITY_NAMES = {rank: name for name, rank in _PRIORITY_RANK.items()}
+
+# Set by callers that do background work; interactive is the default so an
+# ad-hoc /analyze request is never queued behind a mailbox import.
+llm_priority: contextvars.ContextVar[str] = contextvars.ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+# Per-document token accounting: the pipeline sets a fresh dict and every LLM
+# call made under it (including concurrent ones) adds its usage.
+llm_usage: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("llm_usage", default=None)
+
+# Whose work the LLM calls are, for fair queuing between users. Calls made
+# outside a user's request (scripts, triage training) share one flow.
+llm_user: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("llm_user", default=None)
+
+
+def record_usage(usage: Optional[dict]) -> None:
+    totals = llm_usage.get()
+    if totals is None:
+        return
+    totals["calls"] = totals.get("calls", 0) + 1
+    if usage:
+        for key in ("input_tokens", "output_tokens", "total_tokens"):
+            totals[key] = totals.get(key, 0) + (usage.get(key) or 0)
+
+
+def _chain_label(config: Optional[RunnableConfig]) -> str:
+    # Set in the run metadata by chains.InstrumentedChain
+    return ((config or {}).get("metadata") or {}).get("chain", "unknown")
+
+
+def _record_call(config: Optional[RunnableConfig], outcome: str, usage: Optional[dict] = None) -> None:
+    if not METRICS_ENABLED:
+        return
+    chain = _chain_label(config)
+    LLM_CALLS.inc(chain=chain, outcome=outcome)
+    if usage:
+        LLM_TOKENS.inc(usage.get("input_tokens") or 0, chain=chain, direction="input")
+        LLM_TOKENS.inc(usage.get("output_tokens") or 0, chain=chain, direction="output")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English prose)."""
+    return max(1, len(text) // 4)
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    if getattr(error, "status_code", None) == 429 or getattr(error, "code", None) == 429:
+        return True
+    name = type(error).__name__
+    if "ResourceExhausted" in name or "RateLimit" in name:
+        return True
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message or "rate limit" in message.lower()
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate_per_minute`."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if they are now)."""
+        self._refill()
+        # Requests larger than the bucket would never fit; let them through on a full bucket
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= amount
+
+    def refund(self, amount: float) -> None:
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def idle(self) -> bool:
+        """True when a new bucket would be in the same state, so this one can be dropped."""
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class _Flow:
+    """One user's queue in the governor, with its share, cap and quota."""
+
+    def __init__(self, user: str, weight: float, max_concurrency: int, quota: Optional[TokenBucket]):
+        self.user = user
+        self.weight = weight if weight > 0 else 1.0
+        self.max_concurrency = max_concurrency
+        self.quota = quota
+        # Heap of (rank, ticket, cost, future, enqueued_at)
+        self.waiters: list = []
+        # Virtual finish time of the last admitted call, per priority rank
+        self.finish: Dict[int, float] = {}
+        self.in_flight = 0
+        self.admitted = 0
+        self.wait_seconds = 0.0
+
+    def head(self):
+        while self.waiters and self.waiters[0][3].done():  # cancelled while queued
+            heapq.heappop(self.waiters)
+        return self.waiters[0] if self.waiters else None
+
+    def capped(self) -> bool:
+        return self.max_concurrency > 0 and self.in_flight >= self.max_concurrency
+
+    def idle(self, virtual: Dict[int, float], backlogged: bool) -> bool:
+        """
+        True when forgetting the flow changes nothing: no calls queued or
+        running, a full quota, and no finish time still ahead of the virtual
+        time while other users are waiting.
+        """
+        if self.head() is not None or self.in_flight:
+            return False
+        if self.quota is not None and not self.quota.idle():
+            return False
+        return not backlogged or all(finish <= virtual.get(rank, 0.0) for rank, finish in self.finish.items())
+
+
+class LLMGovernor:
+    """
+    Process-wide admission control for LLM calls.
+
+    - Token buckets keep requests/min and tokens/min under the provider quota.
+    - The concurrency limit follows AIMD: +1/limit per success, halved on a
+      429 or a latency spike, so load settles just below the point where the
+      provider starts pushing back instead of collapsing into retry storms.
+    - Waiters are served strictly by priority, interactive before bulk.
+    - Within a priority, users are served by weighted fair queuing
+      (start-time fair queuing on estimated tokens): a user with a large
+      backlog gets their weighted share of the slots, not all of them, and a
+      user with one call waits for the next free slot. Calls of one user
+      stay in ticket order. A user at their concurrency cap or out of their
+      token quota is passed over until a call finishes or the quota refills.
+    """
+
+    def __init__(
+        self,
+        rpm: float = LLM_RPM,
+        tpm: float = LLM_TPM,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        min_concurrency: int = LLM_MIN_CONCURRENCY,
+        latency_spike_factor: float = LLM_LATENCY_SPIKE_FACTOR,
+        user_weights: Optional[Dict[str, float]] = None,
+        user_max_concurrency: int = LLM_USER_MAX_CONCURRENCY,
+        user_concurrency: Optional[Dict[str, float]] = None,
+        user_tpm: float = LLM_USER_TPM,
+        user_tpm_overrides: Optional[Dict[str, float]] = None,
+    ):
+        # Builds a bucket from (name, rate per minute); see use_buckets
+        self._make_bucket: Callable[[str, float], TokenBucket] = lambda name, rate: TokenBucket(rate)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max_concurrency)
+        self.latency_spike_factor = latency_spike_factor
+        self.user_weights = LLM_USER_WEIGHTS if user_weights is None else user_weights
+        self.user_max_concurrency = user_max_concurrency
+        self.user_concurrency = LLM_USER_CONCURRENCY if user_concurrency is None else user_concurrency
+        self.user_tpm = user_tpm
+        self.user_tpm_overrides = LLM_USER_TPM_OVERRIDES if user_tpm_overrides is None else user_tpm_overrides
+
+        self.in_flight = 0
+        self._flows: Dict[str, _Flow] = {}
+        # Flows with queued calls
+        self._backlogged: Dict[str, _Flow] = {}
+        # Virtual time per priority rank: start tag of the last admitted call
+        self._virtual: Dict[int, float] = {}
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._avg_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._last_sweep = time.monotonic()
+
+        self.admitted = 0
+        self.rate_limited = 0
+        self.latency_spikes = 0
+        self.retries = 0
+
+    def use_buckets(self, make_bucket: Callable[[str, float], TokenBucket]) -> None:
+        """
+        Replaces the requests/min, tokens/min and per-user quota buckets with
+        ones built by make_bucket(name, rate per minute), e.g. buckets shared
+        by several processes (app/coordination.py). Call it before the first
+        LLM call: allowance left in the old buckets is dropped.
+        """
+        self._make_bucket = make_bucket
+        self.requests = make_bucket("rpm", self.requests.rate * 60)
+        self.tokens = make_bucket("tpm", self.tokens.rate * 60)
+        for flow in self._flows.values():
+            if flow.quota is not None:
+                flow.quota = make_bucket(f"user:{flow.user}:tpm", flow.quota.rate * 60)
+
+    # --- Admission ---
+
+    def _flow(self, user: Optional[int]) -> _Flow:
+        key = "none" if user is None else str(user)
+        flow = self._flows.get(key)
+        if flow is None:
+            tpm = self.user_tpm_overrides.get(key, self.user_tpm)
+            flow = self._flows[key] = _Flow(
+                key,
+                self.user_weights.get(key, 1.0),
+                int(self.user_concurrency.get(key, self.user_max_concurrency)),
+                self._make_bucket(f"user:{key}:tpm", tpm) if tpm > 0 else None,
+            )
+        return flow
+
+    def _next(self):
+        """
+        The flow whose head call goes next: lowest priority rank, then
+        smallest virtual start time. Also returns how long until a flow held
+        back only by its quota could go.
+        """
+        best = best_key = None
+        quota_wait = 0.0
+        for key, flow in list(self._backlogged.items()):
+            head = flow.head()
+            if head is None:
+                del self._backlogged[key]
+                continue
+            if flow.capped():
+                continue
+            rank, ticket, cost = head[:3]
+            if flow.quota is not None:
+                wait = flow.quota.wait_time(cost)
+                if wait > 0:
+                    quota_wait = wait if not quota_wait else min(quota_wait, wait)
+                    continue
+            start = max(flow.finish.get(rank, 0.0), self._virtual.get(rank, 0.0))
+            order = (rank, start, ticket)
+            if best_key is None or order < best_key:
+                best, best_key = flow, order
+        return best, quota_wait
+
+    def _schedule(self, wait: float) -> None:
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(wait, self._on_timer)
+
+    def _dispatch(self) -> None:
+        while self.in_flight < max(int(self.limit), self.min_concurrency):
+            flow, quota_wait = self._next()
+            if flow is None:
+                if quota_wait:
+                    self._schedule(quota_wait)
+                return
+            rank, _, cost, future, enqueued = flow.waiters[0]
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(cost))
+            if wait > 0:
+                self._schedule(wait)
+                return
+            heapq.heappop(flow.waiters)
+            self.requests.consume(1)
+            self.tokens.consume(cost)
+            if flow.quota is not None:
+                flow.quota.consume(cost)
+            start = max(flow.finish.get(rank, 0.0), self._virtual.get(rank, 0.0))
+            flow.finish[rank] = start + cost / flow.weight
+            self._virtual[rank] = start
+            waited = time.monotonic() - enqueued
+            flow.in_flight += 1
+            flow.admitted += 1
+            flow.wait_seconds += waited
+            self.in_flight += 1
+            self.admitted += 1
+            LLM_QUEUE_WAIT.observe(waited, priority=_PRIORITY_NAMES.get(rank, PRIORITY_BULK))
+            future.set_result(flow)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def wake(self) -> None:
+        """Runs admission again, e.g. when a shared bucket received tokens."""
+        self._dispatch()
+
+    def ticket(self) -> int:
+        """Queue position; a retried call reuses its ticket so it keeps its place in line."""
+        return next(self._seq)
+
+    async def acquire(
+        self, cost: int, priority: str = PRIORITY_INTERACTIVE, ticket: Optional[int] = None, user: Optional[int] = None
+    ) -> _Flow:
+        """Waits for a slot; pass the returned flow to release()."""
+        future = asyncio.get_running_loop().create_future()
+        if ticket is None:
+            ticket = self.ticket()
+        flow = self._flow(user)
+        heapq.heappush(flow.waiters, (_PRIORITY_RANK.get(priority, 1), ticket, cost, future, time.monotonic()))
+        self._backlogged[flow.user] = flow
+        self._dispatch()
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted in the same tick we were cancelled: give the slot back
+                self.release(flow)
+            raise
+
+    def release(self, flow: _Flow) -> None:
+        flow.in_flight -= 1
+        self.in_flight -= 1
+        self._dispatch()
+        if time.monotonic() - self._last_sweep >= _FLOW_SWEEP_SECONDS:
+            self.evict_idle_flows()
+
+    def evict_idle_flows(self) -> int:
+        """
+        Drops the flows of users who have gone idle, so that every user who
+        ever made a call does not stay in memory. Returns how many it dropped.
+        """
+        self._last_sweep = time.monotonic()
+        backlogged = any(flow.head() is not None for flow in self._backlogged.values())
+        idle = [key for key, flow in self._flows.items() if flow.idle(self._virtual, backlogged)]
+        for key in idle:
+            del self._flows[key]
+            self._backlogged.pop(key, None)
+        return len(idle)
+
+    @asynccontextmanager
+    async def slot(self, cost: int, priority: Optional[str] = None, ticket: Optional[int] = None, user: Optional[int] = None):
+        """Holds a slot for the block; yields the flow, for adjust_tokens."""
+        flow = await self.acquire(cost, priority or llm_priority.get(), ticket, user if user is not None else llm_user.get())
+        try:
+            yield flow
+        finally:
+            self.release(flow)
+
+    # --- AIMD feedback ---
+
+    def on_success(self, latency: float) -> None:
+        spike = self._avg_latency is not None and latency > self._avg_latency * self.latency_spike_factor
+        # The average follows the new level too, so a lasting shift in latency
+        # (longer prompts, slower model) only triggers a decrease once.
+        if self._avg_latency is None:
+            self._avg_latency = latency
+        else:
+            self._avg_latency = 0.9 * self._avg_latency + 0.1 * latency
+        if spike:
+            self.latency_spikes += 1
+            self._decrease()
+            return
+        self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+        self._dispatch()
+
+    def on_rate_limited(self) -> None:
+        self.rate_limited += 1
+        self._decrease()
+
+    def _decrease(self) -> None:
+        # Errors from calls already in flight at the time of the first 429 would
+        # otherwise halve the limit several times for a single congestion event.
+        now = time.monotonic()
+        window = self._avg_latency or 1.0
+        if now - self._last_decrease < window:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_concurrency), self.limit / 2)
+
+    def adjust_tokens(self, charged: int, actual: int, flow: Optional[_Flow] = None) -> None:
+        """
+        Corrects the up-front token estimate once the real usage is known, in
+        the tokens/min bucket and in the quota of the flow the call ran under.
+        """
+        buckets = [self.tokens]
+        if flow is not None and flow.quota is not None:
+            buckets.append(flow.quota)
+        for bucket in buckets:
+            if actual > charged:
+                bucket.consume(actual - charged)
+            elif charged > actual:
+                bucket.refund(charged - actual)
+
+    def stats(self) -> dict:
+        waiting = {name: 0 for name in _PRIORITY_RANK}
+        users = {}
+        for flow in self._flows.values():
+            queued = 0
+            for rank, _, _, future, _ in flow.waiters:
+                if not future.done():
+                    waiting[_PRIORITY_NAMES.get(rank, PRIORITY_BULK)] += 1
+                    queued += 1
+            if queued or flow.in_flight:
+                users[flow.user] = {
+                    "waiting": queued,
+                    "in_flight": flow.in_flight,
+                    "admitted": flow.admitted,
+                    "avg_wait_ms": round(flow.wait_seconds / flow.admitted * 1000, 1) if flow.admitted else None,
+                    "weight": flow.weight,
+                    "max_concurrency": flow.max_concurrency or None,
+                    "tpm_available": round(flow.quota.tokens, 1) if flow.quota is not None else None,
+                }
+        return {
+            "concurrency_limit": round(self.limit, 2),
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": waiting,
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited,
+            "latency_spikes": self.latency_spikes,
+            "retries": self.retries,
+            "avg_latency_ms": round(self._avg_latency * 1000, 1) if self._avg_latency else None,
+            "rpm_available": round(self.requests.tokens, 1),
+            "tpm_available": round(self.tokens.tokens, 1),
+            # Users with calls queued or running
+            "users": users,
+        }
+
+
+class GovernedLLM(Runnable):
+    """
+    Drop-in wrapper for the chat model: `prompt | llm | parser` keeps working,
+    but every async call goes through the governor. 429s are absorbed here
+    with a backoff and retry instead of surfacing as a pipeline error.
+    """
+
+    def __init__(self, inner: Runnable, governor: LLMGovernor, rate_limit_retries: int = LLM_RATE_LIMIT_RETRIES):
+        self.inner = inner
+        self.governor = governor
+        self.rate_limit_retries = rate_limit_retries
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.inner, "model", None) or getattr(self.inner, "model_name", "unknown")
+
+    def _cost(self, input: Any) -> int:
+        text = input.to_string() if hasattr(input, "to_string") else str(input)
+        return estimate_tokens(text) + LLM_EXPECTED_OUTPUT_TOKENS
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        # Synchronous callers (scripts) bypass the async governor
+        return self.inner.invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        cost = self._cost(input)
+        ticket = self.governor.ticket()
+        attempt = 0
+        while True:
+            async with self.governor.slot(cost, ticket=ticket) as flow:
+                started = time.monotonic()
+                try:
+                    output = await self.inner.ainvoke(input, config, **kwargs)
+                except Exception as e:
+                    if not is_rate_limit_error(e):
+                        _record_call(config, "error")
+                        raise
+                    _record_call(config, "rate_limited")
+                    self.governor.on_rate_limited()
+                    if attempt >= self.rate_limit_retries:
+                        raise
+                else:
+                    self.governor.on_success(time.monotonic() - started)
+                    usage = getattr(output, "usage_metadata", None)
+                    record_usage(usage)
+                    _record_call(config, "ok", usage)
+                    if usage and usage.get("total_tokens"):
+                        self.governor.adjust_tokens(cost, usage["total_tokens"], flow)
+                    return output
+            # Back off outside the slot so other callers can use it
+            attempt += 1
+            self.governor.retries += 1
+            LLM_RETRIES.inc(chain=_chain_label(config))
+            await asyncio.sleep(min(30.0, 0.5 * (2 ** attempt)))
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        """
+        Streams the model's message chunks under one governor slot. A 429 is
+        retried like in ainvoke, but only before the first chunk was yielded.
+        """
+        cost = self._cost(input)
+        ticket = self.governor.ticket()
+        attempt = 0
+        while True:
+            async with self.governor.slot(cost, ticket=ticket) as flow:
+                started = time.monotonic()
+                message = None
+                try:
+                    async for chunk in self.inner.astream(input, config, **kwargs):
+                        # Chunks add up, usage included
+                        message = chunk if message is None else message + chunk
+                        yield chunk
+                except Exception as e:
+                    if message is not None or not is_rate_limit_error(e):
+                        _record_call(config, "error")
+                        raise
+                    _record_call(config, "rate_limited")
+                    self.governor.on_rate_limited()
+                    if attempt >= self.rate_limit_retries:
+                        raise
+                else:
+                    self.governor.on_success(time.monotonic() - started)
+                    usage = getattr(message, "usage_metadata", None)
+                    record_usage(usage)
+                    _record_call(config, "ok", usage)
+                    if usage and usage.get("total_tokens"):
+                        self.governor.adjust_tokens(cost, usage["total_tokens"], flow)
+                    return
+            attempt += 1
+            self.governor.retries += 1
+            LLM_RETRIES.inc(chain=_chain_label(config))
+            await asyncio.sleep(min(30.0, 0.5 * (2 ** attempt)))
+
+
+governor = LLMGovernor()
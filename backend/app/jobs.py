@@ -0,0 +1,284 @@
+import asyncio
+import base64
+import os
+import random
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select, update, or_, and_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import SessionLocal
+from .models import AnalysisJob
+from .parsing import AttachmentPart
+from .routes.processing import process_and_save_email
+from .governor import llm_priority, PRIORITY_BULK
+from .metrics import JOB_ATTEMPTS, start_trace, finish_trace
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", "2.0"))
+JOB_BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX", "300"))
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+class LeaseLost(Exception):
+    """The job's lease expired and another worker may have claimed it."""
+
+
+def backoff_delay(attempts: int) -> float:
+    """Exponential backoff with full jitter, capped at JOB_BACKOFF_MAX seconds."""
+    ceiling = min(JOB_BACKOFF_MAX, JOB_BACKOFF_BASE * (2 ** max(attempts - 1, 0)))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def attachments_to_json(parts: List[AttachmentPart]) -> List[dict]:
+    return [
+        {
+            "filename": part.filename,
+            "content_type": part.content_type,
+            "charset": part.charset,
+            "payload": base64.b64encode(part.payload).decode("ascii"),
+            "skipped": part.skipped,
+        }
+        for part in parts
+    ]
+
+
+def attachments_from_json(items: Optional[List[dict]]) -> List[AttachmentPart]:
+    return [
+        AttachmentPart(item["filename"], item["content_type"], item["charset"], base64.b64decode(item["payload"]), item["skipped"])
+        for item in items or ()
+    ]
+
+
+async def enqueue_job(
+    db: AsyncSession,
+    text: str,
+    metadata_override: dict,
+    user_id: int | None,
+    mode: Optional[str] = None,
+    attachments: Optional[List[AttachmentPart]] = None
+) -> AnalysisJob:
+    job = AnalysisJob(
+        text=text,
+        metadata_override=metadata_override,
+        mode=mode,
+        attachments=attachments_to_json(attachments) if attachments else None,
+        user_id=user_id,
+        max_attempts=JOB_MAX_ATTEMPTS,
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+
+async def queue_depth(db: AsyncSession) -> int:
+    result = await db.execute(
+        select(func.count()).select_from(AnalysisJob).where(AnalysisJob.status == "queued")
+    )
+    return result.scalar_one()
+
+
+async def claim_job(db: AsyncSession, worker_id: str) -> Optional[AnalysisJob]:
+    """
+    Atomically takes the oldest runnable job: a queued job whose backoff has
+    elapsed, or a running job whose worker died and let its lease expire.
+    SKIP LOCKED lets any number of workers poll the table without blocking
+    each other or handing out the same row twice.
+    """
+    now = datetime.utcnow()
+    result = await db.execute(
+        select(AnalysisJob)
+        .where(or_(
+            and_(AnalysisJob.status == "queued", AnalysisJob.available_at <= now),
+            and_(AnalysisJob.status == "running", AnalysisJob.locked_until < now),
+        ))
+        .order_by(AnalysisJob.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    job = result.scalar_one_or_none()
+    if job is None:
+        await db.rollback()
+        return None
+
+    if job.attempts >= job.max_attempts:
+        # Reclaimed after its last allowed attempt crashed the worker: give up on it
+        job.status = "failed"
+        job.last_error = job.last_error or "Worker lease expired on final attempt"
+        job.locked_by = None
+        job.locked_until = None
+        await db.commit()
+        return None
+
+    job.status = "running"
+    job.locked_by = worker_id
+    job.locked_until = now + timedelta(seconds=JOB_LEASE_SECONDS)
+    job.attempts += 1
+    await db.commit()
+    return job
+
+
+async def _lock_own_job(db: AsyncSession, job_id: int, worker_id: str) -> AnalysisJob:
+    """Re-reads the job under a row lock and checks this worker still holds the lease."""
+    result = await db.execute(
+        select(AnalysisJob).where(AnalysisJob.id == job_id).with_for_update()
+    )
+    job = result.scalar_one()
+    if job.status != "running" or job.locked_by != worker_id:
+        raise LeaseLost(f"Job {job_id} is no longer leased by {worker_id}")
+    return job
+
+
+async def _heartbeat(job_id: int, worker_id: str) -> None:
+    """Extends the lease while a long LLM call is in flight."""
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        async with SessionLocal() as db:
+            await db.execute(
+                update(AnalysisJob)
+                .where(AnalysisJob.id == job_id, AnalysisJob.locked_by == worker_id, AnalysisJob.status == "running")
+                .values(locked_until=datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS))
+            )
+            await db.commit()
+
+
+async def run_job(job_id: int, worker_id: str) -> None:
+    heartbeat = asyncio.create_task(_heartbeat(job_id, worker_id))
+    trace, trace_token = start_trace("job", job_id=job_id, worker=worker_id)
+    outcome = "error"
+    try:
+        async with SessionLocal() as db:
+            job = await db.get(AnalysisJob, job_id)
+            text, overrides, user_id, mode = job.text, job.metadata_override or {}, job.user_id, job.mode
+            attachments = attachments_from_json(job.attachments)
+            # Hand the connection back while the LLM runs; the lease (renewed by
+            # the heartbeat) keeps the job ours, and it is locked again below
+            await db.commit()
+
+            try:
+                result = await process_and_save_email(
+                    text, overrides, db, user_id=user_id, commit=False, mode=mode, attachments=attachments
+                )
+                # The email, its log entry and the job's completion commit together:
+                # either the document is stored and the job is done, or neither.
+                job = await _lock_own_job(db, job_id, worker_id)
+                job.status = "succeeded"
+                job.email_id = result.email_id
+                job.result = result.model_dump(mode="json")
+                # The attachments are stored as documents now
+                job.attachments = None
+                job.last_error = None
+                job.locked_by = None
+                job.locked_until = None
+                await db.commit()
+                outcome = "succeeded"
+            except LeaseLost:
+                await db.rollback()
+                outcome = "lease_lost"
+                print(f"Worker {worker_id} lost the lease on job {job_id}, discarding its result")
+            except Exception as e:
+                await db.rollback()
+                error = e.detail if isinstance(e, HTTPException) else str(e)
+                print(f"Job {job_id} attempt failed: {error}")
+                try:
+                    job = await _lock_own_job(db, job_id, worker_id)
+                except LeaseLost:
+                    await db.rollback()
+                    outcome = "lease_lost"
+                    return
+                job.last_error = str(error)
+                job.locked_by = None
+                job.locked_until = None
+                if job.attempts >= job.max_attempts:
+                    job.status = "failed"
+                else:
+                    job.status = "queued"
+                    job.available_at = datetime.utcnow() + timedelta(seconds=backoff_delay(job.attempts))
+                await db.commit()
+                outcome = "failed" if job.status == "failed" else "retry"
+    finally:
+        heartbeat.cancel()
+        JOB_ATTEMPTS.inc(outcome=outcome)
+        finish_trace(trace, trace_token, outcome=outcome)
+
+
+async def release_job(job_id: int, worker_id: str) -> None:
+    """Hands an interrupted job straight back to the queue on graceful shutdown."""
+    async with SessionLocal() as db:
+        await db.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.id == job_id, AnalysisJob.locked_by == worker_id, AnalysisJob.status == "running")
+            .values(
+                status="queued",
+                attempts=AnalysisJob.attempts - 1,
+                locked_by=None,
+                locked_until=None,
+                available_at=datetime.utcnow(),
+            )
+        )
+        await db.commit()
+
+
+class WorkerPool:
+    """
+    Async workers that pull jobs from the analysis_jobs table.
+    State lives entirely in Postgres: after a crash, jobs left 'running' are
+    picked up again once their lease expires.
+    """
+
+    def __init__(self, size: int = JOB_WORKERS):
+        self.size = size
+        self.node_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._tasks: list[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+
+    async def _worker(self, index: int) -> None:
+        worker_id = f"{self.node_id}/{index}"
+        # Queued jobs never compete with interactive requests for LLM capacity
+        llm_priority.set(PRIORITY_BULK)
+        while not self._stopping.is_set():
+            try:
+                async with SessionLocal() as db:
+                    job = await claim_job(db, worker_id)
+            except Exception as e:
+                print(f"Worker {worker_id} could not claim a job: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await run_job(job.id, worker_id)
+            except asyncio.CancelledError:
+                await asyncio.shield(release_job(job.id, worker_id))
+                raise
+            except Exception as e:
+                # Bookkeeping failed (e.g. DB down); the lease expiry recovers the job
+                print(f"Worker {worker_id} failed while running job {job.id}: {e}")
+
+    def start(self) -> None:
+        self._stopping.clear()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.size)]
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+worker_pool = WorkerPool()
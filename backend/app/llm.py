@@ -2,13 +2,18 @@ import os
 # from langchain_groq import ChatGroq
 from langchain_google_genai import ChatGoogleGenerativeAI
 from dotenv import load_dotenv
+from .governor import GovernedLLM, governor
 
 load_dotenv()
 
+# "google" for Gemini, "fake" for the deterministic offline model (benchmarks, local testing)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "google").lower()
+
 # GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+MODEL_NAME = os.getenv("LLM_MODEL", "gemini-3-flash-preview")
 
-if not GOOGLE_API_KEY:
+if LLM_PROVIDER == "google" and not GOOGLE_API_KEY:
     raise ValueError("GOOGLE_API_KEY environment variable is not set")
 
 # llm = ChatGroq(
@@ -20,11 +25,20 @@ if not GOOGLE_API_KEY:
 #     api_key=GROQ_API_KEY
 # )
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-3-flash-preview",
-    temperature=0.0,  # Gemini 3.0+ defaults to 1.0
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-    google_api_key=GOOGLE_API_KEY
-)
+if LLM_PROVIDER == "fake":
+    from .fake_llm import fake_llm_from_env
+    base_llm = fake_llm_from_env()
+    MODEL_NAME = base_llm.model_name
+else:
+    base_llm = ChatGoogleGenerativeAI(
+        model=MODEL_NAME,
+        temperature=0.0,  # Gemini 3.0+ defaults to 1.0
+        max_tokens=None,
+        timeout=None,
+        # GovernedLLM retries 429s itself; client-side retries would hide them from the governor
+        max_retries=0,
+        google_api_key=GOOGLE_API_KEY
+    )
+
+# All chains share this wrapper, so rate limits and concurrency are enforced process-wide
+llm = GovernedLLM(base_llm, governor)
@@ -1,14 +1,65 @@
-from fastapi import FastAPI
-from .database import engine, Base
-from .routes import processing, auth
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from .database import engine, Base, SessionLocal
+from .cache import result_cache
+from .jobs import worker_pool, queue_depth
+from .governor import governor
+from .user_cache import user_cache
+from .auth_utils import password_hasher
+from .uploads import attachment_extractor
+from .metrics import METRICS_ENABLED, TracingMiddleware, registry
+from .triage import triage, train_triage, TRIAGE_TRAIN_ON_STARTUP
+from .chains import chain_registry, PROMPTS_DIR, PROMPTS_WATCH_INTERVAL
+from .coordination import MULTI_WORKER, advisory_xact_lock, broadcaster, shared_buckets
+from .routes import processing, auth, ingest, jobs, logs, rereview
 
 from contextlib import asynccontextmanager
+import asyncio
+
+async def _train_triage_in_background():
+    try:
+        evaluation = await train_triage()
+        print(f"Triage model: {evaluation}")
+    except Exception as e:
+        print(f"Triage training failed: {e}")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Build every chain once; requests reuse them instead of rebuilding prompts and parsers
+    chain_registry.build()
+    prompt_watcher = None
+    if PROMPTS_DIR and PROMPTS_WATCH_INTERVAL > 0:
+        prompt_watcher = asyncio.create_task(chain_registry.watch(PROMPTS_WATCH_INTERVAL))
+
     async with engine.begin() as conn:
+        # With several workers starting at once, one creates the tables while the others wait
+        await advisory_xact_lock(conn, "privilege_pipeline:create_all")
         await conn.run_sync(Base.metadata.create_all)
+    # A prompt or model change makes older cached results unusable
+    async with SessionLocal() as db:
+        await result_cache.evict_stale(db)
+    # The pre-classifier learns from earlier LLM decisions; requests go to the LLM until it is ready
+    triage_training = None
+    if triage.enabled and TRIAGE_TRAIN_ON_STARTUP:
+        triage_training = asyncio.create_task(_train_triage_in_background())
+    if MULTI_WORKER:
+        # LLM quotas are drawn from buckets in Postgres, and reloads and user changes reach every process
+        governor.use_buckets(shared_buckets(governor))
+        broadcaster.on("chains_reloaded", lambda message: chain_registry.reload())
+        broadcaster.on("triage_retrained", lambda message: _train_triage_in_background())
+        broadcaster.on("user_invalidated", lambda message: user_cache.invalidate(message["username"]))
+        broadcaster.start()
+    if worker_pool.size > 0:
+        worker_pool.start()
     yield
+    await worker_pool.stop()
+    await broadcaster.stop()
+    attachment_extractor.shutdown()
+    if prompt_watcher:
+        prompt_watcher.cancel()
+    if triage_training:
+        triage_training.cancel()
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -22,9 +73,66 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so the trace covers the whole request
+if METRICS_ENABLED:
+    app.add_middleware(TracingMiddleware)
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_exhausted(request: Request, exc: PoolTimeoutError):
+    # Every connection stayed busy for DB_POOL_TIMEOUT seconds: shed load instead of a 500
+    print(f"Database pool exhausted: {exc}")
+    return JSONResponse(status_code=503, content={"detail": "Database busy, retry later"}, headers={"Retry-After": "1"})
+
 app.include_router(processing.router, prefix="/api/v1")
+app.include_router(ingest.router, prefix="/api/v1")
+app.include_router(jobs.router, prefix="/api/v1")
+app.include_router(logs.router, prefix="/api/v1")
+app.include_router(rereview.router, prefix="/api/v1")
 app.include_router(auth.router, prefix="/api/v1")
 
+def _component_metrics(jobs_queued: int) -> list:
+    """Current values from the components that already keep their own counters."""
+    llm = governor.stats()
+    cache = result_cache.stats()
+    users = user_cache.stats()
+    hashing = password_hasher.stats()
+    triaged = triage.stats()
+    return [
+        ("llm_concurrency_limit", "gauge", "Current AIMD concurrency limit of the LLM governor.", [({}, llm["concurrency_limit"])]),
+        ("llm_in_flight", "gauge", "LLM calls currently running.", [({}, llm["in_flight"])]),
+        ("llm_queue_depth", "gauge", "LLM calls waiting for the governor, by priority.",
+         [({"priority": name}, count) for name, count in llm["waiting"].items()]),
+        # Aggregates only: /metrics is unauthenticated, and user ids as labels would also be unbounded
+        ("llm_active_users", "gauge", "Users with LLM calls queued or running.", [({}, len(llm["users"]))]),
+        ("llm_user_queue_depth_max", "gauge", "Most LLM calls waiting for the governor for any one user.",
+         [({}, max((flow["waiting"] for flow in llm["users"].values()), default=0))]),
+        ("llm_rate_limited_total", "counter", "429 responses seen by the governor.", [({}, llm["rate_limited"])]),
+        ("result_cache_lookups_total", "counter", "Result cache lookups by outcome.",
+         [({"outcome": "hit"}, cache["hits"]), ({"outcome": "miss"}, cache["misses"])]),
+        ("user_cache_lookups_total", "counter", "Authenticated-user cache lookups by outcome.",
+         [({"outcome": "hit"}, users["hits"]), ({"outcome": "miss"}, users["misses"]), ({"outcome": "token_only"}, users["token_only"])]),
+        ("password_hash_pending", "gauge", "bcrypt operations queued or running.", [({}, hashing["pending"])]),
+        ("password_hash_rejected_total", "counter", "Logins/signups refused with 503 because the hashing pool was full.", [({}, hashing["rejected"])]),
+        ("triage_documents_total", "counter", "Documents seen by the triage pre-classifier, by outcome.",
+         [({"outcome": "auto_decided"}, triaged["auto_decided"]), ({"outcome": "legal_signal"}, triaged["sent_for_legal_signal"]),
+          ({"outcome": "to_llm"}, triaged["seen"] - triaged["auto_decided"] - triaged["sent_for_legal_signal"])]),
+        ("job_queue_depth", "gauge", "Background jobs waiting to be claimed.", [({}, jobs_queued)]),
+    ]
+
+async def metrics():
+    """Prometheus text format."""
+    try:
+        async with SessionLocal() as db:
+            jobs_queued = await queue_depth(db)
+    except Exception as e:
+        print(f"Could not read the job queue depth: {e}")
+        jobs_queued = -1
+    return PlainTextResponse(registry.render(_component_metrics(jobs_queued)), media_type="text/plain; version=0.0.4")
+
+# With METRICS_ENABLED=false there is no /metrics route (404)
+if METRICS_ENABLED:
+    app.add_api_route("/metrics", metrics, methods=["GET"], include_in_schema=False)
+
 @app.get("/")
 def read_root():
     return {"message": "Privilege Logging Pipeline API is running"}
@@ -0,0 +1,342 @@
+import contextvars
+import json
+import math
+import os
+import time
+import uuid
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# With metrics disabled, metrics and spans are shared no-ops, and neither the middleware nor /metrics is installed
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Print one JSON line per request/job with its spans
+TRACE_LOG = os.getenv("TRACE_LOG", "false").lower() in ("1", "true", "yes")
+# Only log traces at least this slow (ms)
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "0"))
+
+# Seconds; covers a cached hit (sub-ms) to a chunked document on a slow model
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    parts = []
+    for key, value in labels:
+        value = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> List[Sample]:
+        return [(self.name, dict(key), value) for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self.values[_label_key(labels)] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # Per label set: per-bucket counts (not cumulative), sum, count
+        self.values: Dict[LabelKey, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def samples(self) -> List[Sample]:
+        samples = []
+        for key, (counts, total, count) in self.values.items():
+            labels = dict(key)
+            cumulative = 0
+            for bound, n in zip((*self.buckets, math.inf), counts):
+                cumulative += n
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class _NoopMetric:
+    """Every metric of a disabled registry: updates do nothing and keep no label sets."""
+
+    __slots__ = ()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        pass
+
+    def set(self, value: float, **labels) -> None:
+        pass
+
+    def observe(self, value: float, **labels) -> None:
+        pass
+
+    def samples(self) -> List[Sample]:
+        return []
+
+
+_NOOP_METRIC = _NoopMetric()
+
+
+class Registry:
+    """
+    Metrics in the Prometheus text format. Collectors are called at scrape
+    time for values that already live elsewhere (governor, caches, pool), so
+    nothing has to be kept in sync on the hot path. A disabled registry hands
+    out one shared no-op metric and registers nothing.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.metrics: List[object] = []
+        # Each returns [(name, kind, help, [(labels, value), ...]), ...]
+        self.collectors: List[Callable[[], list]] = []
+
+    def _register(self, metric):
+        if not self.enabled:
+            return _NOOP_METRIC
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._register(Counter(name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._register(Gauge(name, help))
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, buckets))
+
+    def collector(self, fn: Callable[[], list]) -> Callable[[], list]:
+        if self.enabled:
+            self.collectors.append(fn)
+        return fn
+
+    def render(self, extra: Iterable[tuple] = ()) -> str:
+        lines = []
+
+        def family(name: str, kind: str, help: str, samples: Iterable[Sample]) -> None:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+
+        for metric in self.metrics:
+            family(metric.name, metric.kind, metric.help, metric.samples())
+        collected = list(extra)
+        for fn in self.collectors:
+            try:
+                collected.extend(fn())
+            except Exception as e:
+                print(f"Metrics collector {fn.__name__} failed: {e}")
+        for name, kind, help, values in collected:
+            family(name, kind, help, ((name, labels, value) for labels, value in values))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry(enabled=METRICS_ENABLED)
+
+HTTP_REQUESTS = registry.counter("http_requests_total", "HTTP requests by endpoint and status.")
+HTTP_DURATION = registry.histogram("http_request_duration_seconds", "HTTP request latency by endpoint.")
+STAGE_DURATION = registry.histogram("pipeline_stage_duration_seconds", "Time spent per traced stage (parse, chains, DB commit, export).")
+STAGE_ERRORS = registry.counter("pipeline_stage_errors_total", "Traced stages that raised, by stage and exception type.")
+LLM_CALLS = registry.counter("llm_calls_total", "LLM calls by chain and outcome (ok, error, rate_limited).")
+LLM_TOKENS = registry.counter("llm_tokens_total", "LLM tokens reported by the provider, by chain and direction.")
+LLM_RETRIES = registry.counter("llm_retries_total", "LLM calls retried after a rate limit, by chain.")
+LLM_QUEUE_WAIT = registry.histogram(
+    "llm_queue_wait_seconds", "Time LLM calls waited for the governor, by priority.",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+DB_POOL_WAIT = registry.histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled database connection.",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+JOB_ATTEMPTS = registry.counter("job_attempts_total", "Background job attempts by outcome (succeeded, retry, failed, lease_lost).")
+DOCUMENTS = registry.counter("documents_processed_total", "Documents analysed, by who decided (llm, cache, triage, propagated).")
+
+
+# --- Tracing ---
+
+class Trace:
+    def __init__(self, name: str, trace_id: Optional[str] = None, **attrs):
+        self.name = name
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.spans: List[dict] = []
+
+    def to_dict(self, duration_ms: float) -> dict:
+        return {"trace_id": self.trace_id, "name": self.name, **self.attrs, "duration_ms": round(duration_ms, 2), "spans": self.spans}
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+
+class _Span:
+    """Times a stage into STAGE_DURATION and, inside a trace, records it on the trace. Usable with `with` and `async with`."""
+
+    __slots__ = ("name", "attrs", "started")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        STAGE_DURATION.observe(elapsed, stage=self.name)
+        if exc_type is not None and not issubclass(exc_type, GeneratorExit):
+            STAGE_ERRORS.inc(stage=self.name, error=exc_type.__name__)
+        trace = _current_trace.get()
+        if trace is not None:
+            record = {"name": self.name, "start_ms": round((self.started - trace.started) * 1000, 2), "duration_ms": round(elapsed * 1000, 2)}
+            if self.attrs:
+                record.update(self.attrs)
+            if exc_type is not None:
+                record["error"] = exc_type.__name__
+            trace.spans.append(record)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attrs):
+    """`with span("db.commit"):` / `async with span("chain.judge"):`"""
+    if not METRICS_ENABLED:
+        return _NOOP_SPAN
+    return _Span(name, attrs)
+
+
+def start_trace(name: str, trace_id: Optional[str] = None, **attrs) -> Tuple[Optional[Trace], Optional[contextvars.Token]]:
+    if not METRICS_ENABLED:
+        return None, None
+    trace = Trace(name, trace_id, **attrs)
+    return trace, _current_trace.set(trace)
+
+
+def finish_trace(trace: Optional[Trace], token: Optional[contextvars.Token], **attrs) -> None:
+    if trace is None:
+        return
+    _current_trace.reset(token)
+    duration_ms = (time.perf_counter() - trace.started) * 1000
+    trace.attrs.update(attrs)
+    if TRACE_LOG and duration_ms >= TRACE_SLOW_MS:
+        print(json.dumps(trace.to_dict(duration_ms), default=str))
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware: one trace per HTTP request (id from X-Request-ID or
+    generated, echoed back), plus request count and latency by endpoint.
+    Streaming bodies are included, since the trace ends only when the
+    response has been sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = None
+        for key, value in scope.get("headers", ()):
+            if key == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        trace, token = start_trace("http", request_id, method=scope["method"], path=scope["path"])
+        status = 500
+
+        async def send_with_trace_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = [*message["headers"], (b"x-request-id", trace.trace_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            # Endpoint name rather than the raw path, so ids do not explode the label set
+            handler = getattr(scope.get("route"), "name", None) or "unmatched"
+            elapsed = time.perf_counter() - trace.started
+            HTTP_REQUESTS.inc(method=scope["method"], handler=handler, status=status)
+            HTTP_DURATION.observe(elapsed, method=scope["method"], handler=handler)
+            finish_trace(trace, token, handler=handler, status=status)
@@ -1,38 +1,85 @@
-from sqlalchemy import Integer, String, Boolean, Text, ForeignKey, DateTime
+from sqlalchemy import Integer, String, Boolean, Text, ForeignKey, DateTime, Float, JSON, Index, Computed
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from .database import Base
 from datetime import datetime
 from typing import Optional
 
+# Characters of the body that go into the full-text index; a tsvector is capped
+# at 1 MB, and the first pages of a huge attachment dump are what reviewers search
+SEARCH_BODY_CHARS = 100000
+
 class Email(Base):
     __tablename__ = "emails"
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     sender: Mapped[Optional[str]] = mapped_column(index=True)
     recipient: Mapped[Optional[str]] = mapped_column(index=True)
+    cc: Mapped[Optional[str]] = mapped_column(nullable=True)
     date: Mapped[datetime] = mapped_column(default=datetime.utcnow)
     subject: Mapped[Optional[str]] = mapped_column()
     body: Mapped[Optional[str]] = mapped_column(Text)
     
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=True)
 
+    # Set on a document extracted from an attachment: the email (or attached message) it came with
+    parent_email_id: Mapped[Optional[int]] = mapped_column(ForeignKey("emails.id"), nullable=True, index=True)
+    # Hash of the attachment's bytes, to reuse the result for the same file attached elsewhere in the matter
+    attachment_sha256: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+
+    # Full-text search over subject and the start of the body, maintained by Postgres
+    search_vector: Mapped[Optional[str]] = mapped_column(
+        TSVECTOR,
+        Computed(
+            f"to_tsvector('english', coalesce(subject, '') || ' ' || left(coalesce(body, ''), {SEARCH_BODY_CHARS}))",
+            persisted=True,
+        ),
+        deferred=True,
+    )
+
     # Relationships
-    privilege_log: Mapped[Optional["PrivilegeLog"]] = relationship(back_populates="email", uselist=False)
+    privilege_log: Mapped[Optional["PrivilegeLog"]] = relationship(back_populates="email", uselist=False, foreign_keys="PrivilegeLog.email_id")
     user: Mapped["User"] = relationship()
 
+    __table_args__ = (
+        # Keyset pagination per user, by id or by date
+        Index("ix_emails_user_id_id", "user_id", "id"),
+        Index("ix_emails_user_id_date_id", "user_id", "date", "id"),
+        Index("ix_emails_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_emails_user_id_attachment_sha256", "user_id", "attachment_sha256"),
+    )
+
 class PrivilegeLog(Base):
     __tablename__ = "privilege_logs"
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
-    email_id: Mapped[int] = mapped_column(ForeignKey("emails.id"))
+    email_id: Mapped[int] = mapped_column(ForeignKey("emails.id"), index=True)
     
     is_privileged: Mapped[bool] = mapped_column(default=False)
     privilege_type: Mapped[Optional[str]] = mapped_column(nullable=True) # e.g. "Attorney-Client", "Work Product"
     log_description: Mapped[Optional[str]] = mapped_column(Text, nullable=True) # The "safe" description
     reasoning: Mapped[Optional[str]] = mapped_column(Text, nullable=True) # AI reasoning
-    redacted_text: Mapped[Optional[str]] = mapped_column(Text, nullable=True) # JSON string of text list
+    # [{"text", "start", "end"}, ...]: character offsets into emails.body, one record per occurrence,
+    # resolved at write time (start/end null for a passage the model quoted but the body does not contain)
+    redaction_spans: Mapped[Optional[list]] = mapped_column(JSONB(none_as_null=True), nullable=True)
+
+    # Set when the result was copied from a near-duplicate or a more inclusive message in the thread
+    propagated_from_email_id: Mapped[Optional[int]] = mapped_column(ForeignKey("emails.id"), nullable=True)
+    cluster_relation: Mapped[Optional[str]] = mapped_column(nullable=True) # "near_duplicate" or "thread"
+    cluster_similarity: Mapped[Optional[float]] = mapped_column(nullable=True)
+    needs_spot_check: Mapped[bool] = mapped_column(default=False)
+
+    # Who made the decision: "llm", "cache", "triage" (local pre-classifier) or "propagated"
+    decided_by: Mapped[Optional[str]] = mapped_column(nullable=True)
 
-    email: Mapped["Email"] = relationship(back_populates="privilege_log")
+    # LLM calls/tokens spent on this document and the pre-processing estimate (raw vs sent)
+    token_usage: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+
+    # What produced this entry: {"model", "preprocess", "judge", "writer", "redactor"} (or "fused") hashes,
+    # {"triage": "local"} for triage decisions; compared with the current pipeline by the re-review
+    pipeline_fingerprint: Mapped[Optional[dict]] = mapped_column(JSONB(none_as_null=True), nullable=True)
+
+    email: Mapped["Email"] = relationship(back_populates="privilege_log", foreign_keys=[email_id])
 
 class User(Base):
     __tablename__ = "users"
@@ -41,3 +88,65 @@ class User(Base):
     username: Mapped[str] = mapped_column(unique=True, index=True)
     email: Mapped[str] = mapped_column(unique=True, index=True)
     hashed_password: Mapped[str] = mapped_column()
+
+class LLMResultCache(Base):
+    __tablename__ = "llm_result_cache"
+
+    # sha256 of normalized body + metadata + prompt version + pipeline version + model name
+    cache_key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    prompt_version: Mapped[str] = mapped_column(String(32), index=True)
+    # Pre-processing fingerprint and parser schema version (cache.current_pipeline_version)
+    pipeline_version: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    model_name: Mapped[str] = mapped_column(index=True)
+
+    is_privileged: Mapped[bool] = mapped_column(default=False)
+    privilege_type: Mapped[Optional[str]] = mapped_column(nullable=True)
+    reasoning: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    log_description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    redaction_items: Mapped[Optional[list]] = mapped_column(JSON, nullable=True)
+    # The chains the result came from, e.g. ["judge", "writer", "redactor"] or ["fused"]
+    stages: Mapped[Optional[list]] = mapped_column(JSON(none_as_null=True), nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
+
+class LLMRateBucket(Base):
+    """A governor token bucket shared by every API process in multi-worker mode (app/coordination.py)."""
+    __tablename__ = "llm_rate_buckets"
+
+    # rpm, tpm, or user:<id>:tpm
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    tokens: Mapped[float] = mapped_column(Float)
+    capacity: Mapped[float] = mapped_column(Float)
+    rate_per_second: Mapped[float] = mapped_column(Float)
+    # Database time, so the refill does not depend on the clocks of the hosts
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    user_id: Mapped[Optional[int]] = mapped_column(ForeignKey("users.id"), nullable=True, index=True)
+
+    status: Mapped[str] = mapped_column(String(16), default="queued") # queued, running, succeeded, failed
+    text: Mapped[str] = mapped_column(Text)
+    metadata_override: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    mode: Mapped[Optional[str]] = mapped_column(String(16), nullable=True) # staged or fused; None for PIPELINE_MODE
+    # An uploaded .eml's attachments (jobs.attachments_to_json), cleared once the job succeeded
+    attachments: Mapped[Optional[list]] = mapped_column(JSON(none_as_null=True), nullable=True)
+
+    attempts: Mapped[int] = mapped_column(default=0)
+    max_attempts: Mapped[int] = mapped_column(default=5)
+    available_at: Mapped[datetime] = mapped_column(default=datetime.utcnow) # Not claimable before this (retry backoff)
+    locked_by: Mapped[Optional[str]] = mapped_column(nullable=True) # Worker holding the lease
+    locked_until: Mapped[Optional[datetime]] = mapped_column(nullable=True) # Lease expiry; expired leases are reclaimed
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    email_id: Mapped[Optional[int]] = mapped_column(ForeignKey("emails.id"), nullable=True)
+    result: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True) # ProcessingResult once succeeded
+
+    created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_analysis_jobs_status_available_at", "status", "available_at"),
+    )
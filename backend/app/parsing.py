@@ -1,32 +1,412 @@
 import re
-from typing import Dict, Any
+import email
+import zipfile
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.feedparser import BytesFeedParser
+from email.message import Message
+from email.utils import getaddresses, parsedate_to_datetime
+from html.parser import HTMLParser
+from typing import Dict, Any, BinaryIO, Iterator, List, Optional, Tuple
+
+# Header names accepted in pasted/plain-text emails, mapped to the metadata key.
+# Outlook copies use Sent/Recipient; "Re:" on its own line has long been taken as the subject.
+_HEADER_KEYS = {
+    "date": "Date",
+    "sent": "Date",
+    "from": "From",
+    "sender": "From",
+    "to": "To",
+    "recipient": "To",
+    "cc": "Cc",
+    "subject": "Subject",
+    "re": "Subject",
+    "message-id": "Message-ID",
+    "in-reply-to": "In-Reply-To",
+    "references": "References",
+}
+# Recipient headers may repeat; their values are joined instead of overwritten
+_LIST_HEADERS = {"To", "Cc", "References"}
+
+_HEADER_LINE = re.compile(r"([A-Za-z][A-Za-z0-9-]*)[ \t]*:[ \t]*(.*)")
+# Lines that start quoted material in a reply or forward
+_REPLY_SEPARATOR = re.compile(
+    r"-{2,}\s*(?:Original Message|Forwarded message)\s*-{2,}|On .+ wrote:\s*$|>",
+    re.IGNORECASE,
+)
+_BLANK_LINE = re.compile(r"\n[ \t]*\n")
+# Give up looking for a header block this far into the text
+_MAX_HEADER_SCAN = 64 * 1024
+
+# HTML elements whose content is not text, and those that start a new line
+_HTML_HIDDEN = {"script", "style", "head", "title"}
+_HTML_BREAKS = {"br", "p", "div", "tr", "li", "h1", "h2", "h3", "h4", "h5", "h6", "table", "blockquote", "hr"}
+_HTML_SPACES = re.compile(r"[ \t\r\f\v]+")
+_HTML_BLANK_LINES = re.compile(r"\n{3,}")
+# Attachments above this size are listed but not extracted
+MAX_ATTACHMENT_BYTES = 25 * 1024 * 1024
+# Spooled uploads are fed to the MIME parser this much at a time
+_READ_CHUNK_BYTES = 64 * 1024
+
+_DATE_FORMATS = (
+    "%A, %B %d, %Y %I:%M %p",  # Outlook: Monday, November 6, 2023 3:15 PM
+    "%A, %B %d, %Y %H:%M",
+    "%B %d, %Y %I:%M %p",
+    "%B %d, %Y",
+    "%d %B %Y",
+    "%m/%d/%Y %I:%M %p",
+    "%m/%d/%Y %H:%M",
+    "%m/%d/%Y",
+)
+
+
+def _iter_lines(text: str, limit: int) -> Iterator[str]:
+    """Yields lines lazily (no split of a multi-megabyte body), up to `limit` characters."""
+    start = 0
+    end_of_scan = min(len(text), limit)
+    while start < end_of_scan:
+        end = text.find("\n", start, end_of_scan)
+        if end == -1:
+            end = end_of_scan
+        yield text[start:end].rstrip("\r")
+        start = end + 1
+
 
 def extract_metadata(text: str) -> Dict[str, Any]:
     """
-    Extracts Date, From, To, and Subject from email text using Regex.
-    Expected format is standard email header style.
+    Extracts Date, From, To, Cc and Subject (plus threading headers) from the
+    leading header block of a plain-text email, in a single pass.
+
+    Only the header section at the top is read: it ends at the first blank
+    line, the first line that is not a header, or a reply separator, so a
+    "From:" or "Re:" inside quoted text below is never picked up. Folded
+    (indented continuation) lines are unfolded and repeated To/Cc headers are
+    combined. Unknown headers inside the block are skipped.
+    """
+    metadata: Dict[str, Any] = {}
+    current = None
+    in_block = False
+
+    for line in _iter_lines(text, _MAX_HEADER_SCAN):
+        if not line.strip():
+            if in_block:
+                break
+            continue  # blank lines before the headers
+        if line[0] in " \t" and in_block:
+            if current:
+                metadata[current] += " " + line.strip()
+            continue
+        if _REPLY_SEPARATOR.match(line.lstrip()):
+            if in_block:
+                break
+            continue  # a forward pasted as-is: its headers follow the separator
+        match = _HEADER_LINE.match(line)
+        if not match:
+            break
+        in_block = True
+        current = _HEADER_KEYS.get(match.group(1).lower())
+        if current is None:
+            continue
+        value = match.group(2).strip()
+        if current in metadata:
+            if current in _LIST_HEADERS and value:
+                separator = " " if current == "References" else ", "
+                metadata[current] = f"{metadata[current]}{separator}{value}"
+            else:
+                current = None  # first occurrence wins, ignore its continuation lines too
+        else:
+            metadata[current] = value
+
+    return {k: v for k, v in metadata.items() if v}
+
+
+def header_block_end(text: str) -> int:
+    """Offset of the first line after the leading header block (0 if there is none)."""
+    first_line = text.lstrip().split("\n", 1)[0]
+    if not _HEADER_LINE.match(first_line):
+        return 0
+    end = _BLANK_LINE.search(text)
+    return end.end() if end else len(text)
+
+
+def parse_recipients(metadata: Dict[str, Any]) -> List[str]:
+    """All addresses from To and Cc, de-duplicated, in header order."""
+    addresses = []
+    for _, address in getaddresses([metadata.get("To") or "", metadata.get("Cc") or ""]):
+        if address and address not in addresses:
+            addresses.append(address)
+    return addresses
+
+
+def parse_date(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parses an email Date/Sent header into a naive UTC datetime (the form the
+    emails.date column stores). Accepts RFC 2822, ISO 8601 and the common
+    Outlook/US formats; returns None if the value is not recognisable.
     """
+    if not value:
+        return None
+    value = value.strip()
+    parsed = None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        pass
+    if parsed is None:
+        for fmt in _DATE_FORMATS:
+            try:
+                parsed = datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+    # Last: the RFC 2822 parser is lenient and would e.g. drop an AM/PM marker
+    if parsed is None:
+        try:
+            parsed = parsedate_to_datetime(value)
+        except (TypeError, ValueError, IndexError):
+            pass
+    if parsed is None:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+@dataclass
+class AttachmentPart:
+    """An attachment as found in a message: its decoded bytes, not yet turned into text."""
+    filename: str
+    content_type: str
+    charset: Optional[str]
+    payload: bytes
+    # Set instead of a payload when the part is not kept (e.g. over the size limit)
+    skipped: Optional[str] = None
+
+
+class _HTMLText(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.pieces: List[str] = []
+        self._hidden = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _HTML_HIDDEN:
+            self._hidden += 1
+        elif tag in _HTML_BREAKS:
+            self.pieces.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _HTML_HIDDEN:
+            self._hidden = max(0, self._hidden - 1)
+        elif tag in _HTML_BREAKS:
+            self.pieces.append("\n")
+
+    def handle_data(self, data):
+        if not self._hidden:
+            self.pieces.append(data)
+
+
+def html_to_text(html: str) -> str:
+    """Visible text of an HTML document, one line per block element."""
+    parser = _HTMLText()
+    parser.feed(html)
+    parser.close()
+    text = _HTML_SPACES.sub(" ", "".join(parser.pieces))
+    return _HTML_BLANK_LINES.sub("\n\n", "\n".join(line.strip() for line in text.split("\n"))).strip()
+
+
+def decode_text(payload: bytes, charset: Optional[str]) -> str:
+    try:
+        return payload.decode(charset or "utf-8", errors="replace")
+    except LookupError:  # unknown charset name
+        return payload.decode("utf-8", errors="replace")
+
+
+def _message_metadata(msg: Message) -> Dict[str, Any]:
     metadata = {}
-    
-    # Regex patterns (basic implementation, can be improved)
-    date_pattern = r"(?:Date|Sent):\s*(.*)"
-    from_pattern = r"(?:From|Sender):\s*(.*)"
-    to_pattern = r"(?:To|Recipient):\s*(.*)"
-    subject_pattern = r"(?:Subject|Re):\s*(.*)"
-    
-    # Search
-    date_match = re.search(date_pattern, text, re.IGNORECASE)
-    from_match = re.search(from_pattern, text, re.IGNORECASE)
-    to_match = re.search(to_pattern, text, re.IGNORECASE)
-    subject_match = re.search(subject_pattern, text, re.IGNORECASE)
-    
-    if date_match:
-        metadata["Date"] = date_match.group(1).strip()
-    if from_match:
-        metadata["From"] = from_match.group(1).strip()
-    if to_match:
-        metadata["To"] = to_match.group(1).strip()
-    if subject_match:
-        metadata["Subject"] = subject_match.group(1).strip()
-        
+    metadata["Subject"] = msg.get("Subject", "No Subject")
+    metadata["From"] = msg.get("From", "Unknown")
+    metadata["To"] = msg.get("To", "Unknown")
+    metadata["Date"] = msg.get("Date")
+    if msg.get("Cc"):
+        metadata["Cc"] = msg.get("Cc")
+    # Threading headers, used to group reply chains before review
+    for header in ("Message-ID", "In-Reply-To", "References"):
+        if msg.get(header):
+            metadata[header] = msg.get(header)
     return metadata
+
+
+def _leaf_parts(part: Message) -> Iterator[Message]:
+    """Non-multipart parts of a message; attached messages are not descended into."""
+    if part.get_content_type() == "message/rfc822" or not part.is_multipart():
+        yield part
+        return
+    for sub in part.get_payload():
+        yield from _leaf_parts(sub)
+
+
+def _is_attachment(part: Message) -> bool:
+    return (
+        part.get_content_disposition() == "attachment"
+        or bool(part.get_filename())
+        or part.get_content_type() == "message/rfc822"
+    )
+
+
+def _attachment_part(part: Message, index: int, max_bytes: int) -> AttachmentPart:
+    content_type = part.get_content_type()
+    filename = part.get_filename() or f"attachment-{index}"
+    if content_type == "message/rfc822":
+        inner = part.get_payload()
+        payload = inner[0].as_bytes() if inner else b""
+        if not part.get_filename():
+            # Forwarded messages rarely have a filename; their subject says more
+            filename = f"{(inner[0].get('Subject') if inner else None) or filename}.eml"
+    else:
+        # Base64 is 4 characters per 3 bytes; skip oversized parts before decoding them
+        encoded = part.get_payload()
+        if isinstance(encoded, str) and len(encoded) * 3 // 4 > max_bytes:
+            return AttachmentPart(filename, content_type, None, b"", skipped=f"larger than {max_bytes} bytes")
+        payload = part.get_payload(decode=True) or b""
+    if len(payload) > max_bytes:
+        return AttachmentPart(filename, content_type, None, b"", skipped=f"larger than {max_bytes} bytes")
+    return AttachmentPart(filename, content_type, part.get_content_charset(), payload)
+
+
+def parse_message(msg: Message, max_attachment_bytes: int = MAX_ATTACHMENT_BYTES) -> Tuple[str, Dict[str, Any], List[AttachmentPart]]:
+    """
+    Splits a parsed message into (text_body, metadata, attachments).
+    The body is the first inline text/plain part, else the first inline
+    text/html part converted to text, else any inline text/* part. Parts
+    with a filename, an attachment disposition, or an attached message are
+    attachments, returned as bytes for app/uploads.py to turn into text.
+    """
+    metadata = _message_metadata(msg)
+    if not msg.is_multipart():
+        payload = msg.get_payload(decode=True)
+        text_body = decode_text(payload, msg.get_content_charset()) if payload else ""
+        if msg.get_content_type() == "text/html":
+            text_body = html_to_text(text_body)
+        return text_body, metadata, []
+
+    inline: List[Message] = []
+    attachments: List[AttachmentPart] = []
+    for part in _leaf_parts(msg):
+        if _is_attachment(part):
+            attachments.append(_attachment_part(part, len(attachments) + 1, max_attachment_bytes))
+        elif part.get_content_maintype() == "text":
+            inline.append(part)
+
+    text_body = ""
+    for wanted in ("text/plain", "text/html", None):
+        for part in inline:
+            if wanted and part.get_content_type() != wanted:
+                continue
+            payload = part.get_payload(decode=True)
+            if payload:
+                text_body = decode_text(payload, part.get_content_charset())
+                if part.get_content_type() == "text/html":
+                    text_body = html_to_text(text_body)
+                break
+        if text_body:
+            break
+    return text_body, metadata, attachments
+
+
+def parse_eml(content: bytes) -> Tuple[str, Dict[str, Any]]:
+    """
+    Parses a raw RFC 822 message into (text_body, metadata); attachments are ignored.
+    """
+    text_body, metadata, _ = parse_message(email.message_from_bytes(content))
+    return text_body, metadata
+
+
+def parse_eml_file(fp: BinaryIO, max_attachment_bytes: int = MAX_ATTACHMENT_BYTES) -> Tuple[str, Dict[str, Any], List[AttachmentPart]]:
+    """
+    Same as parse_message, reading the message from a file in chunks, so
+    the raw upload never has to be held in memory as one piece.
+    """
+    parser = BytesFeedParser()
+    while True:
+        chunk = fp.read(_READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        parser.feed(chunk)
+    return parse_message(parser.close(), max_attachment_bytes)
+
+
+def parse_document(filename: str, content: bytes) -> Tuple[str, Dict[str, Any]]:
+    """
+    Parses an uploaded .eml or plain text document into (text_body, metadata).
+    """
+    if filename.lower().endswith(".eml"):
+        return parse_eml(content)
+    # Assume text file
+    return content.decode(errors="replace"), {"Subject": filename.lower()}
+
+
+def parse_upload(filename: str, fp: BinaryIO, max_attachment_bytes: int = MAX_ATTACHMENT_BYTES) -> Tuple[str, Dict[str, Any], List[AttachmentPart]]:
+    """
+    parse_document for an upload spooled to a file, plus the attachments of
+    an .eml (a .txt has none).
+    """
+    if filename.lower().endswith(".eml"):
+        return parse_eml_file(fp, max_attachment_bytes)
+    return parse_document(filename, fp.read()) + ([],)
+
+
+def iter_mbox(fp: BinaryIO) -> Iterator[Tuple[str, bytes]]:
+    """
+    Streams messages out of an mbox file one at a time.
+    Messages are delimited by lines starting with "From "; ">From " escapes
+    (mboxrd) are undone. Only one message is held in memory at a time.
+    """
+    index = 0
+    lines = []
+    for line in fp:
+        if line.startswith(b"From "):
+            if lines:
+                index += 1
+                yield f"message-{index:06d}.eml", b"".join(lines)
+            lines = []
+            continue
+        if line.startswith(b">") and line.lstrip(b">").startswith(b"From "):
+            line = line[1:]
+        lines.append(line)
+    if lines:
+        index += 1
+        yield f"message-{index:06d}.eml", b"".join(lines)
+
+
+def iter_zip(fp: BinaryIO) -> Iterator[Tuple[str, bytes]]:
+    """
+    Streams .eml and .txt members out of a zip archive, one member at a time.
+    """
+    with zipfile.ZipFile(fp) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            name = info.filename
+            if not name.lower().endswith((".eml", ".txt")):
+                continue
+            # Skip macOS resource forks that ride along in zipped folders
+            if name.startswith("__MACOSX/") or name.rsplit("/", 1)[-1].startswith("._"):
+                continue
+            yield name, archive.read(info)
+
+
+def iter_mailbox_documents(filename: str, fp: BinaryIO) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Yields (text_body, metadata) for every message in an mbox or zip upload.
+    """
+    if filename.lower().endswith(".zip"):
+        members = iter_zip(fp)
+    else:
+        members = iter_mbox(fp)
+
+    for name, content in members:
+        if name.lower().endswith(".eml"):
+            yield parse_eml(content)
+        else:
+            yield parse_document(name.rsplit("/", 1)[-1], content)
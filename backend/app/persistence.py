@@ -0,0 +1,207 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache import CachedResult, result_cache
+from .database import SessionLocal
+from .metrics import DOCUMENTS, span
+from .models import Email, PrivilegeLog
+from .parsing import parse_date
+from .redaction import resolve_spans
+from .schemas import ProcessingResult
+
+# Documents buffered by the bulk writer before one multi-row INSERT
+PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", "200"))
+
+
+def _pg_text(value: Any) -> Any:
+    # Postgres text cannot hold NUL; U+FFFD keeps character offsets (redaction spans) as they were
+    return value.replace("\x00", "\ufffd") if isinstance(value, str) else value
+
+
+def email_values(text: str, metadata: Dict[str, Any], user_id: int | None) -> Dict[str, Any]:
+    return {
+        "sender": _pg_text(metadata.get("From", "Unknown")),
+        "recipient": _pg_text(metadata.get("To", "Unknown")),
+        "cc": _pg_text(metadata.get("Cc")),
+        "subject": _pg_text(metadata.get("Subject", "No Subject")),
+        "body": _pg_text(text),
+        "user_id": user_id,
+        # The message's own Date header when it can be parsed, else the time of ingestion
+        "date": parse_date(metadata.get("Date")) or datetime.utcnow(),
+    }
+
+
+def log_values(
+    result: ProcessingResult,
+    body: str,
+    redaction_items: Optional[List[str]] = None,
+    resolved_only: bool = False,
+    **extra: Any,
+) -> Dict[str, Any]:
+    """
+    Log row values for an analysed document. Redaction passages are located
+    in `body` (the stored email body) here, once; resolved_only drops those
+    that do not occur in it.
+    """
+    if redaction_items is None:
+        redaction_items = result.redacted_text
+    with span("redaction.resolve"):
+        spans = resolve_spans(body, redaction_items)
+    if resolved_only:
+        spans = [s for s in spans if s["start"] is not None]
+    mode = (result.token_usage or {}).get("mode")
+    values = {
+        "is_privileged": result.is_privileged,
+        "privilege_type": result.privilege_type,
+        "log_description": result.log_description,
+        "reasoning": result.reasoning,
+        "redaction_spans": spans or None,
+        "propagated_from_email_id": None,
+        "cluster_relation": None,
+        "cluster_similarity": None,
+        "needs_spot_check": False,
+        "token_usage": result.token_usage,
+        "pipeline_fingerprint": result.pipeline_fingerprint,
+        "decided_by": mode if mode in ("cache", "triage") else "llm",
+    }
+    values.update(extra)
+    DOCUMENTS.inc(decided_by=values["decided_by"])
+    return values
+
+
+async def insert_email_with_log(db: AsyncSession, email: Dict[str, Any], log: Dict[str, Any]) -> int:
+    """
+    Inserts an email and its privilege log entry in a single statement:
+
+        WITH new_email AS (INSERT INTO emails ... RETURNING id)
+        INSERT INTO privilege_logs (email_id, ...) SELECT id, ... FROM new_email
+
+    One round trip instead of insert/commit/refresh/insert/commit, and the two
+    rows can never be separated by a crash. Returns the email id.
+    """
+    new_email = insert(Email).values(**email).returning(Email.id).cte("new_email")
+    columns = list(log)
+    stmt = (
+        insert(PrivilegeLog)
+        .from_select(
+            ["email_id", *columns],
+            select(
+                new_email.c.id,
+                *[literal(log[name], type_=PrivilegeLog.__table__.c[name].type) for name in columns],
+            ),
+        )
+        .returning(PrivilegeLog.email_id)
+    )
+    result = await db.execute(stmt)
+    return result.scalar_one()
+
+
+class BulkResultWriter:
+    """
+    Buffers analysed documents and writes them in batches: one multi-row
+    INSERT for emails (ids returned in input order), one for their log entries
+    and one for new cache entries, all in a single transaction per batch.
+
+    Groups keep a representative together with the cluster members that copy
+    its result, so members can point at the representative's new id.
+    """
+
+    def __init__(self, batch_size: int = PERSIST_BATCH_SIZE):
+        self.batch_size = batch_size
+        # (email values, log values, [(member email values, member log values)])
+        self._groups: List[Tuple[Dict[str, Any], Dict[str, Any], List[Tuple[Dict[str, Any], Dict[str, Any]]]]] = []
+        self._cache_entries: List[Tuple[str, CachedResult]] = []
+        self._buffered = 0
+        self._lock = asyncio.Lock()
+        self.written = 0
+        self.batches = 0
+        # Documents lost to a failed batch, and why
+        self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    async def add(
+        self,
+        email: Dict[str, Any],
+        log: Dict[str, Any],
+        members: Optional[List[Tuple[Dict[str, Any], Dict[str, Any]]]] = None,
+        cache_entry: Optional[Tuple[str, CachedResult]] = None,
+    ) -> None:
+        members = members or []
+        self._groups.append((email, log, members))
+        if cache_entry:
+            self._cache_entries.append(cache_entry)
+        self._buffered += 1 + len(members)
+        if self._buffered >= self.batch_size:
+            await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Writes everything buffered so far; returns the number of documents
+        written. If the batch fails, its groups are retried one at a time in
+        their own transactions, so a bad document costs only its own group.
+        Groups that still fail are counted in `failed` instead of raising, so
+        they do not abort the import.
+        """
+        async with self._lock:
+            groups, cache_entries = self._groups, self._cache_entries
+            self._groups, self._cache_entries, self._buffered = [], [], 0
+            if not groups:
+                return 0
+            self.batches += 1
+            try:
+                written = await self._write(groups, cache_entries)
+            except Exception as e:
+                print(f"Error writing batch of {sum(1 + len(members) for _, _, members in groups)} documents, "
+                      f"retrying them one at a time: {e}")
+                written = await self._write_one_by_one(groups, cache_entries)
+            self.written += written
+            return written
+
+    async def _write(self, groups, cache_entries) -> int:
+        emails = []
+        for email, _, members in groups:
+            emails.append(email)
+            emails.extend(member_email for member_email, _ in members)
+
+        async with SessionLocal() as db, span("db.flush_batch", rows=len(emails)):
+            await result_cache.put_many(db, cache_entries)
+            result = await db.execute(
+                insert(Email).returning(Email.id, sort_by_parameter_order=True),
+                emails,
+            )
+            ids = iter(result.scalars().all())
+
+            logs = []
+            for _, log, members in groups:
+                representative_id = next(ids)
+                logs.append({**log, "email_id": representative_id})
+                for _, member_log in members:
+                    logs.append({**member_log, "email_id": next(ids), "propagated_from_email_id": representative_id})
+            await db.execute(insert(PrivilegeLog), logs)
+            await db.commit()
+        return len(emails)
+
+    async def _write_one_by_one(self, groups, cache_entries) -> int:
+        written = 0
+        if cache_entries:
+            try:
+                async with SessionLocal() as db:
+                    await result_cache.put_many(db, cache_entries)
+                    await db.commit()
+            except Exception as e:
+                # Only the cache entries are lost; the documents are still written below
+                print(f"Error writing {len(cache_entries)} cache entries: {e}")
+        for group in groups:
+            try:
+                written += await self._write([group], [])
+            except Exception as e:
+                documents = 1 + len(group[2])
+                print(f"Error writing document {group[0].get('subject')!r} with {documents - 1} cluster member(s): {e}")
+                self.failed += documents
+                self.errors.append({"batch": self.batches, "documents": documents, "error": str(e)})
+        return written
@@ -0,0 +1,150 @@
+import hashlib
+import os
+import re
+from dataclasses import dataclass, field
+from typing import List
+
+from .governor import estimate_tokens
+from .parsing import header_block_end
+
+PREPROCESS_STRIP_QUOTED = os.getenv("PREPROCESS_STRIP_QUOTED", "true").lower() in ("1", "true", "yes")
+# Largest body (in estimated tokens) sent to a chain in one call; longer bodies are chunked
+LLM_CHUNK_TOKENS = int(os.getenv("LLM_CHUNK_TOKENS", "6000"))
+# Hard cap on chunks per document; anything beyond is not sent to the LLM
+LLM_MAX_CHUNKS = int(os.getenv("LLM_MAX_CHUNKS", "16"))
+# Bump when the stripping or chunking rules below change what the chains are sent
+PREPROCESS_VERSION = "1"
+
+# Start of the quoted history in a reply or forward
+_QUOTE_START = re.compile(
+    r"^[ \t]*(?:-{2,}\s*(?:Original Message|Forwarded message)\s*-{2,}"
+    r"|On\s.{1,200}\swrote:"
+    r"|From:\s.+\n[ \t]*(?:Sent|Date):\s)",
+    re.IGNORECASE | re.MULTILINE,
+)
+_QUOTED_LINE = re.compile(r"^[ \t]*>")
+# RFC 3676 signature separator and mobile client footers
+_SIGNATURE_START = re.compile(r"^(?:-- ?|Sent from my \w+.*)$", re.MULTILINE)
+# Confidentiality boilerplate; it talks about being "privileged and
+# confidential" on every email and only misleads the judge.
+_DISCLAIMER = re.compile(
+    r"intended (?:solely )?(?:only )?(?:for the )?(?:use of the )?(?:named )?(?:recipient|addressee|individual)"
+    r"|received this (?:e-?mail|message|communication) in error"
+    r"|confidentiality notice|legal disclaimer",
+    re.IGNORECASE,
+)
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n")
+
+
+@dataclass
+class PreparedBody:
+    text: str
+    chunks: List[str]
+    raw_tokens: int
+    tokens: int
+    removed: List[str] = field(default_factory=list)  # what was stripped: quoted, signature, disclaimer
+    truncated: bool = False  # more than LLM_MAX_CHUNKS chunks; the tail was dropped
+
+
+def strip_quoted_history(text: str) -> str:
+    """Cuts the body at the first reply/forward separator or ">"-quoted line."""
+    # From:/Date: in the message's own header block is not a quote
+    start = header_block_end(text)
+    cut = len(text)
+    match = _QUOTE_START.search(text, start)
+    if match:
+        cut = match.start()
+    position = start
+    for line in text[start:cut].splitlines(keepends=True):
+        if _QUOTED_LINE.match(line):
+            cut = position
+            break
+        position += len(line)
+    return text[:cut]
+
+
+def strip_signature(text: str) -> str:
+    match = _SIGNATURE_START.search(text)
+    return text[:match.start()] if match else text
+
+
+def strip_disclaimers(text: str) -> str:
+    paragraphs = _PARAGRAPH_BREAK.split(text)
+    return "\n\n".join(p for p in paragraphs if not _DISCLAIMER.search(p))
+
+
+def split_chunks(text: str, max_tokens: int = LLM_CHUNK_TOKENS) -> List[str]:
+    """
+    Splits at paragraph boundaries into chunks of at most `max_tokens`
+    (estimated); a single paragraph that is too long is cut at line and then
+    character boundaries.
+    """
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return [text]
+
+    pieces: List[str] = []
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        while len(paragraph) > max_chars:
+            cut = paragraph.rfind("\n", 0, max_chars)
+            if cut <= 0:
+                cut = paragraph.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            pieces.append(paragraph[:cut])
+            paragraph = paragraph[cut:].lstrip()
+        pieces.append(paragraph)
+
+    chunks: List[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def preprocess_fingerprint() -> str:
+    """Changes whenever prepare_body could produce different chunks for the same email."""
+    settings = f"{PREPROCESS_VERSION}|{PREPROCESS_STRIP_QUOTED}|{LLM_CHUNK_TOKENS}|{LLM_MAX_CHUNKS}"
+    return hashlib.sha256(settings.encode("utf-8")).hexdigest()[:12]
+
+
+def prepare_body(text: str) -> PreparedBody:
+    """
+    Reduces a body to what the chains need to see, and chunks it if it is
+    still larger than LLM_CHUNK_TOKENS. If stripping would leave nothing (a
+    bare forward), the original text is used.
+    """
+    raw_tokens = estimate_tokens(text)
+    removed = []
+    body = text
+
+    if PREPROCESS_STRIP_QUOTED:
+        stripped = strip_quoted_history(body)
+        if stripped.strip() and len(stripped) < len(body):
+            body = stripped
+            removed.append("quoted")
+    for name, strip in (("signature", strip_signature), ("disclaimer", strip_disclaimers)):
+        stripped = strip(body)
+        if stripped.strip() and len(stripped) < len(body):
+            body = stripped
+            removed.append(name)
+    body = body.strip()
+
+    chunks = split_chunks(body)
+    truncated = len(chunks) > LLM_MAX_CHUNKS
+    if truncated:
+        chunks = chunks[:LLM_MAX_CHUNKS]
+    return PreparedBody(
+        text=body,
+        chunks=chunks,
+        raw_tokens=raw_tokens,
+        tokens=sum(estimate_tokens(c) for c in chunks),
+        removed=removed,
+        truncated=truncated,
+    )
@@ -0,0 +1,218 @@
+import os
+import re
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Replaces each redacted passage in rendered documents
+REDACTION_MARKER = os.getenv("REDACTION_MARKER", "[REDACTED]")
+# Below this many distinct passages the str.find scans win on a body of any size
+MATCHER_MIN_PATTERNS = 400
+# Costs measured with benchmarks/bench_redaction.py (CPython 3.11, nanoseconds):
+# an automaton pass per body character, building it per pattern character, and
+# a str.find scan per body character per pattern
+_AUTOMATON_NS_PER_CHAR = 100
+_AUTOMATON_BUILD_NS_PER_CHAR = 700
+_FIND_NS_PER_CHAR = 0.25
+
+# Whitespace runs other than a single plain space; only these shift offsets when collapsed
+_WHITESPACE_RUN = re.compile(r"[^\S ]\s*| \s+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_whitespace(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class CollapsedText:
+    """
+    `text` with every whitespace run collapsed to one space, and the mapping
+    of offsets in the collapsed text back to the original.
+    """
+
+    __slots__ = ("text", "_positions", "_removed")
+
+    def __init__(self, original: str):
+        pieces = []
+        # Per collapsed run: its offset in the collapsed text, and the characters removed up to and including it
+        self._positions: List[int] = []
+        self._removed: List[int] = []
+        last = removed = 0
+        for match in _WHITESPACE_RUN.finditer(original):
+            start, end = match.span()
+            pieces.append(original[last:start])
+            pieces.append(" ")
+            if end - start > 1:
+                self._positions.append(start - removed)
+                removed += end - start - 1
+                self._removed.append(removed)
+            last = end
+        pieces.append(original[last:])
+        self.text = "".join(pieces)
+
+    def original_offset(self, offset: int) -> int:
+        # Every run collapsed before `offset` shifted it left
+        runs = bisect_left(self._positions, offset)
+        return offset + (self._removed[runs - 1] if runs else 0)
+
+
+class RedactionMatcher:
+    """
+    Aho-Corasick automaton over whitespace-normalised patterns: one pass over
+    a document finds every occurrence of every pattern, however many there are.
+    In pure Python that pass costs more than a few str.find scans, so it is
+    only used for large pattern sets (see find_patterns).
+    """
+
+    def __init__(self, patterns: Sequence[str]):
+        self.patterns = list(patterns)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[int, ...]] = [()]
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                following = self._goto[state].get(char)
+                if following is None:
+                    following = len(self._goto)
+                    self._goto[state][char] = following
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = following
+            self._output[state] += (index,)
+
+        # Failure links, breadth first: the longest proper suffix that is also a prefix
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, following in self._goto[state].items():
+                queue.append(following)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[following] = self._goto[fallback].get(char, 0)
+                self._output[following] += self._output[self._fail[following]]
+
+    def find(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        """Yields (pattern index, start, end) for every occurrence, overlapping ones included."""
+        goto, fail, output, lengths = self._goto, self._fail, self._output, [len(p) for p in self.patterns]
+        root = goto[0]
+        state = 0
+        for position, char in enumerate(text):
+            if state:
+                while state and char not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(char, 0)
+            else:
+                state = root.get(char, 0)
+                if not state:
+                    continue
+            if output[state]:
+                end = position + 1
+                for index in output[state]:
+                    yield index, end - lengths[index], end
+
+
+def _find_each(text: str, patterns: Sequence[str]) -> Iterator[Tuple[int, int, int]]:
+    """Same results as RedactionMatcher.find, one C-level scan per pattern."""
+    for index, pattern in enumerate(patterns):
+        start = text.find(pattern)
+        while start != -1:
+            yield index, start, start + len(pattern)
+            start = text.find(pattern, start + 1)
+
+
+def use_automaton(text: str, patterns: Sequence[str]) -> bool:
+    """
+    Whether one automaton pass is expected to beat a str.find scan per
+    pattern. The scans' cost grows with patterns times body length, the
+    automaton's with body length plus its build, so it only pays off for
+    many patterns on a long body (about 600 on a 1 MB body, none below
+    roughly 300 KB).
+    """
+    if len(patterns) < MATCHER_MIN_PATTERNS:
+        return False
+    scans = _FIND_NS_PER_CHAR * len(patterns) * len(text)
+    automaton = _AUTOMATON_NS_PER_CHAR * len(text) + _AUTOMATON_BUILD_NS_PER_CHAR * sum(len(p) for p in patterns)
+    return automaton < scans
+
+
+def find_patterns(text: str, patterns: Sequence[str]) -> Iterator[Tuple[int, int, int]]:
+    if use_automaton(text, patterns):
+        return RedactionMatcher(patterns).find(text)
+    return _find_each(text, patterns)
+
+
+def resolve_spans(body: str, items: Optional[Sequence[str]]) -> List[dict]:
+    """
+    Span records ({"text", "start", "end"}, offsets into `body`) for every
+    occurrence of each redaction item, matched with whitespace differences
+    ignored. Items that do not occur keep a record with null offsets, so
+    nothing the model flagged is lost.
+    """
+    items = [item for item in (items or []) if item and item.strip()]
+    if not items:
+        return []
+    # Normalised pattern -> the items it stands for (the model may repeat itself)
+    patterns: Dict[str, List[str]] = {}
+    for item in items:
+        patterns.setdefault(normalize_whitespace(item), []).append(item)
+    texts = [group[0] for group in patterns.values()]
+
+    collapsed = CollapsedText(body)
+    found = set()
+    spans = []
+    for index, start, end in find_patterns(collapsed.text, list(patterns)):
+        found.add(index)
+        spans.append({
+            "text": texts[index],
+            "start": collapsed.original_offset(start),
+            "end": collapsed.original_offset(end - 1) + 1,
+        })
+    spans.sort(key=lambda span: (span["start"], span["end"]))
+    spans.extend({"text": text, "start": None, "end": None} for index, text in enumerate(texts) if index not in found)
+    return spans
+
+
+def redaction_texts(spans: Optional[Sequence[dict]]) -> Optional[List[str]]:
+    """The distinct redacted passages, in document order (unresolved ones last)."""
+    if not spans:
+        return None
+    return list(dict.fromkeys(span["text"] for span in spans))
+
+
+def unresolved_texts(spans: Optional[Sequence[dict]]) -> List[str]:
+    return [span["text"] for span in spans or () if span.get("start") is None]
+
+
+def render_redacted(body: str, spans: Optional[Sequence[dict]], marker: str = REDACTION_MARKER) -> Tuple[str, int]:
+    """
+    The body with each resolved span replaced by `marker`, built in one pass;
+    overlapping or adjacent spans become a single marker. Returns (text,
+    passages redacted).
+    """
+    ranges = sorted(
+        (span["start"], span["end"]) for span in spans or ()
+        if span.get("start") is not None and 0 <= span["start"] < span["end"] <= len(body)
+    )
+    pieces = []
+    cursor = redacted = 0
+    current = None
+    for start, end in ranges:
+        if current and start <= current[1]:
+            current[1] = max(current[1], end)
+            continue
+        if current:
+            pieces.append(body[cursor:current[0]])
+            pieces.append(marker)
+            cursor = current[1]
+            redacted += 1
+        current = [start, end]
+    if current:
+        pieces.append(body[cursor:current[0]])
+        pieces.append(marker)
+        cursor = current[1]
+        redacted += 1
+    pieces.append(body[cursor:])
+    return "".join(pieces), redacted
@@ -0,0 +1,331 @@
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, case, func, literal, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache import CachedResult, make_cache_key, result_cache
+from .chains import current_pipeline_fingerprint
+from .database import SessionLocal
+from .governor import llm_priority, llm_usage, llm_user, PRIORITY_BULK
+from .metrics import span
+from .models import Email, PrivilegeLog
+from .persistence import log_values
+from .preprocessing import prepare_body
+from .redaction import redaction_texts
+from .routes.processing import run_pipeline, rerun_stages, propagated_log_values
+from .schemas import ProcessingResult
+
+# Stale entries re-reviewed, then written, per batch
+REREVIEW_BATCH_SIZE = int(os.getenv("REREVIEW_BATCH_SIZE", "50"))
+REREVIEW_CONCURRENCY = int(os.getenv("REREVIEW_CONCURRENCY", "8"))
+
+# Only the first few failures are echoed back; the counters cover the rest
+_MAX_REPORTED_ERRORS = 20
+
+FULL = "full"
+# Stages that can be rerun on their own, on top of a judge result that is still current
+PARTIAL_STAGES = ("writer", "redactor")
+
+
+def planned_stages(fingerprint: Optional[dict], is_privileged: bool, current: Dict[str, str]) -> Tuple[str, ...]:
+    """
+    What a stored entry needs to match the current pipeline: ("full",) when
+    the judge's (or the fused chain's) inputs changed, so the verdict itself
+    may change; else the writer and/or redactor, if their fingerprints
+    differ; () when it is up to date. Triage decisions do not depend on the
+    prompts or the model and are never stale.
+    """
+    if not fingerprint:
+        return (FULL,)
+    if "triage" in fingerprint:
+        return ()
+    decided_by = "fused" if "fused" in fingerprint else "judge"
+    if fingerprint.get(decided_by) != current[decided_by] or fingerprint.get("preprocess") != current["preprocess"]:
+        return (FULL,)
+    if decided_by == "fused" or not is_privileged:
+        return ()
+    return tuple(stage for stage in PARTIAL_STAGES if fingerprint.get(stage) != current[stage])
+
+
+def _stale_conditions(current: Dict[str, str]):
+    """planned_stages as SQL: (needs a full rerun, {stage: needs that stage rerun})."""
+    fingerprint = PrivilegeLog.pipeline_fingerprint
+
+    def differs(key: str):
+        return fingerprint[key].astext.is_distinct_from(current[key])
+
+    staged = and_(~fingerprint.has_key("fused"), ~fingerprint.has_key("triage"))
+    full = or_(
+        fingerprint.is_(None),
+        and_(fingerprint.has_key("fused"), or_(differs("fused"), differs("preprocess"))),
+        and_(staged, or_(differs("judge"), differs("preprocess"))),
+    )
+    partial = {
+        stage: and_(PrivilegeLog.is_privileged.is_(True), staged, differs(stage))
+        for stage in PARTIAL_STAGES
+    }
+    return full, partial
+
+
+def _scope(user_id: Optional[int]):
+    # Propagated copies are refreshed with their representative, never re-reviewed themselves
+    conditions = [PrivilegeLog.propagated_from_email_id.is_(None)]
+    if user_id is not None:
+        conditions.append(Email.user_id == user_id)
+    return and_(*conditions)
+
+
+async def stale_counts(db: AsyncSession, user_id: Optional[int]) -> Dict[str, Any]:
+    """Stale entries by the work they need; an entry needing a full rerun is counted only there."""
+    current = current_pipeline_fingerprint()
+    full, partial = _stale_conditions(current)
+    result = await db.execute(
+        select(
+            func.count().filter(or_(full, *partial.values())),
+            func.count().filter(full),
+            *(func.count().filter(and_(~full, condition)) for condition in partial.values()),
+        )
+        .select_from(PrivilegeLog)
+        .join(Email, Email.id == PrivilegeLog.email_id)
+        .where(_scope(user_id))
+    )
+    stale, full_count, *stage_counts = result.one()
+    return {
+        "stale": stale,
+        FULL: full_count,
+        **dict(zip(PARTIAL_STAGES, stage_counts)),
+        "fingerprint": current,
+    }
+
+
+def _rerun_mode(fingerprint: Optional[dict], token_usage: Optional[dict]) -> Optional[str]:
+    # Keep the mode the entry was produced with; unknown provenance gets PIPELINE_MODE
+    mode = (token_usage or {}).get("mode")
+    if (fingerprint and "fused" in fingerprint) or mode in ("fused", "fused_fallback"):
+        return "fused"
+    if fingerprint or mode == "staged":
+        return "staged"
+    return None
+
+
+def _flagged_chunks(prepared, token_usage: Optional[dict]) -> Optional[List[int]]:
+    """The chunks the judge flagged, or None if the stored entry does not say."""
+    if len(prepared.chunks) == 1:
+        return [0]
+    flagged = (token_usage or {}).get("flagged_chunks")
+    if not flagged or any(i >= len(prepared.chunks) for i in flagged):
+        return None
+    return flagged
+
+
+async def _rereview_entry(row, current: Dict[str, str], slots: asyncio.Semaphore):
+    """
+    Brings one stored entry up to date, rerunning only what planned_stages
+    asks for. Nothing is written here.
+    Returns (row, stages, result, cache entry, error).
+    """
+    async with slots:
+        # Runs in its own task, so this only affects this entry's LLM calls
+        llm_priority.set(PRIORITY_BULK)
+        llm_user.set(row.user_id)
+        body = row.body or ""
+        metadata = {"From": row.sender, "To": row.recipient, "Cc": row.cc, "Subject": row.subject}
+        stages = planned_stages(row.pipeline_fingerprint, row.is_privileged, current)
+        prepared = flagged = None
+        if stages != (FULL,):
+            prepared = prepare_body(body)
+            flagged = _flagged_chunks(prepared, row.token_usage)
+            if flagged is None:
+                # Cannot tell which chunks the writer and redactor saw: judge again
+                stages = (FULL,)
+
+        if stages == (FULL,):
+            try:
+                outcome = await run_pipeline(body, metadata, mode=_rerun_mode(row.pipeline_fingerprint, row.token_usage))
+            except HTTPException as e:
+                return row, stages, None, None, str(e.detail)
+            except Exception as e:
+                print(f"Error re-reviewing email {row.email_id}: {e}")
+                return row, stages, None, None, str(e)
+            return row, stages, outcome.result, outcome.cache_entry, None
+
+        usage = {"calls": 0, "input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+        usage_token = llm_usage.set(usage)
+        try:
+            rerun = await rerun_stages(prepared, flagged, row.reasoning, stages)
+        finally:
+            llm_usage.reset(usage_token)
+        failed = [stage for stage in stages if stage not in rerun]
+        error = f"{', '.join(failed)} failed" if failed else None
+        if not rerun:
+            return row, stages, None, None, error
+
+        fingerprint = dict(row.pipeline_fingerprint)
+        # A stage that returned nothing keeps its old fingerprint and stays stale
+        fingerprint.update({stage: current[stage] for stage, value in rerun.items() if value is not None})
+        result = ProcessingResult(
+            email_id=row.email_id,
+            metadata=metadata,
+            is_privileged=row.is_privileged,
+            privilege_type=row.privilege_type,
+            reasoning=row.reasoning,
+            log_description=rerun.get("writer", row.log_description),
+            redacted_text=rerun.get("redactor", redaction_texts(row.redaction_spans)),
+            token_usage={**(row.token_usage or {}), "rereview": {**usage, "stages": list(rerun)}},
+            pipeline_fingerprint=fingerprint,
+        )
+        cache_entry = None
+        if not planned_stages(fingerprint, result.is_privileged, current):
+            cache_entry = (make_cache_key(body, metadata), CachedResult(
+                is_privileged=result.is_privileged,
+                privilege_type=result.privilege_type,
+                reasoning=result.reasoning,
+                log_description=result.log_description,
+                redaction_items=result.redacted_text,
+                stages=tuple(stage for stage in ("judge", *PARTIAL_STAGES) if stage in fingerprint),
+            ))
+        return row, stages, result, cache_entry, error
+
+
+async def _write_batch(updated: List[Tuple[Any, ProcessingResult]], cache_entries: list) -> int:
+    """
+    Writes re-reviewed entries, and refreshes the propagated copies of each
+    from its new result, in one transaction. Returns the copies refreshed.
+    """
+    async with SessionLocal() as db, span("db.rereview_batch", rows=len(updated)):
+        await result_cache.put_many(db, cache_entries)
+        results = {}
+        values = []
+        for row, result in updated:
+            result.email_id = row.email_id
+            results[row.email_id] = result
+            values.append({"id": row.id, **log_values(result, row.body or "")})
+        await db.execute(update(PrivilegeLog), values)
+
+        copies = (await db.execute(
+            select(
+                PrivilegeLog.id,
+                PrivilegeLog.propagated_from_email_id,
+                PrivilegeLog.cluster_relation,
+                PrivilegeLog.cluster_similarity,
+                Email.body,
+            )
+            .join(Email, Email.id == PrivilegeLog.email_id)
+            .where(PrivilegeLog.propagated_from_email_id.in_(list(results)))
+        )).all()
+        if copies:
+            await db.execute(update(PrivilegeLog), [
+                {"id": copy.id, **propagated_log_values(
+                    copy.body or "", results[copy.propagated_from_email_id], copy.cluster_relation, copy.cluster_similarity
+                )}
+                for copy in copies
+            ])
+        await db.commit()
+    return len(copies)
+
+
+async def run_rereview(
+    user_id: Optional[int],
+    batch_size: int = REREVIEW_BATCH_SIZE,
+    concurrency: int = REREVIEW_CONCURRENCY,
+    limit: Optional[int] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Re-reviews the entries made with older prompts, model or pre-processing,
+    privileged ones first, and yields a progress record after each batch.
+    Each batch is committed before the next is read, so an interrupted run
+    loses at most one batch: up-to-date entries no longer match, and the
+    next run carries on with what is left. Entries that fail are skipped for
+    the rest of the run and stay stale.
+    """
+    current = current_pipeline_fingerprint()
+    full, partial = _stale_conditions(current)
+    priority = case((PrivilegeLog.is_privileged.is_(True), 0), else_=1).label("priority")
+    query = (
+        select(
+            priority,
+            PrivilegeLog.id,
+            PrivilegeLog.email_id,
+            PrivilegeLog.is_privileged,
+            PrivilegeLog.privilege_type,
+            PrivilegeLog.reasoning,
+            PrivilegeLog.log_description,
+            PrivilegeLog.redaction_spans,
+            PrivilegeLog.token_usage,
+            PrivilegeLog.pipeline_fingerprint,
+            Email.sender,
+            Email.recipient,
+            Email.cc,
+            Email.subject,
+            Email.body,
+            Email.user_id,
+        )
+        .join(Email, Email.id == PrivilegeLog.email_id)
+        .where(_scope(user_id), or_(full, *partial.values()))
+        .order_by(priority, PrivilegeLog.id)
+    )
+
+    slots = asyncio.Semaphore(concurrency)
+    counts = {"selected": 0, "rereviewed": 0, FULL: 0, **{stage: 0 for stage in PARTIAL_STAGES},
+              "changed": 0, "propagated": 0, "failed": 0, "llm_calls": 0}
+    errors: List[Dict[str, Any]] = []
+    batches = 0
+    after = None
+    started = time.perf_counter()
+
+    def progress(event: str) -> Dict[str, Any]:
+        return {"event": event, "batches": batches, **counts,
+                "elapsed_seconds": round(time.perf_counter() - started, 2)}
+
+    while limit is None or counts["selected"] < limit:
+        page = query
+        if after is not None:
+            page = page.where(tuple_(priority, PrivilegeLog.id) > tuple_(literal(after[0]), literal(after[1])))
+        size = batch_size if limit is None else min(batch_size, limit - counts["selected"])
+        # Short session: no connection is held while the LLM runs
+        async with SessionLocal() as db:
+            rows = (await db.execute(page.limit(size))).all()
+        if not rows:
+            break
+        after = (rows[-1].priority, rows[-1].id)
+        counts["selected"] += len(rows)
+
+        updated = []
+        cache_entries = []
+        for row, stages, result, cache_entry, error in await asyncio.gather(
+            *(_rereview_entry(row, current, slots) for row in rows)
+        ):
+            if error:
+                if len(errors) < _MAX_REPORTED_ERRORS:
+                    errors.append({"email_id": row.email_id, "stages": list(stages), "error": error})
+            if result is None:
+                counts["failed"] += 1
+                continue
+            updated.append((row, result))
+            if cache_entry:
+                cache_entries.append(cache_entry)
+            for stage in stages:
+                counts[stage] += 1
+            counts["changed"] += result.is_privileged != row.is_privileged
+            usage = result.token_usage or {}
+            counts["llm_calls"] += usage.get("rereview", usage).get("calls", 0)
+
+        if updated:
+            try:
+                counts["propagated"] += await _write_batch(updated, cache_entries)
+                counts["rereviewed"] += len(updated)
+            except Exception as e:
+                print(f"Error writing re-review batch of {len(updated)} entries: {e}")
+                counts["failed"] += len(updated)
+                if len(errors) < _MAX_REPORTED_ERRORS:
+                    errors.append({"batch": batches + 1, "entries": len(updated), "error": str(e)})
+        batches += 1
+        yield progress("batch")
+
+    summary = progress("complete")
+    summary["errors"] = errors
+    yield summary
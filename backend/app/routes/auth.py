@@ -1,17 +1,21 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from datetime import timedelta
-from typing import Annotated
+from typing import Annotated, Awaitable, TypeVar
 
 from .. import models, schemas, database, auth_utils
+from ..user_cache import user_cache, CurrentUser
+
+T = TypeVar("T")
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login")
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(database.get_db)]):
+def _decode_token(token: str) -> dict:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -22,17 +26,75 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: An
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-        token_data = schemas.TokenData(username=username)
     except auth_utils.jwt.JWTError:
         raise credentials_exception
-    
-    result = await db.execute(select(models.User).where(models.User.username == token_data.username))
-    user = result.scalar_one_or_none()
-    
-    if user is None:
-        raise credentials_exception
+    return payload
+
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> CurrentUser:
+    """
+    Resolves the token's user through the in-process user cache; the users
+    table is only queried on a miss, with a session opened just for that.
+    """
+    payload = _decode_token(token)
+    token_data = schemas.TokenData(username=payload["sub"])
+
+    user = user_cache.get(token_data.username)
+    if user is not None:
+        return user
+
+    async with database.SessionLocal() as db:
+        result = await db.execute(select(models.User).where(models.User.username == token_data.username))
+        row = result.scalar_one_or_none()
+
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = CurrentUser.from_model(row)
+    user_cache.put(user)
     return user
 
+async def get_current_user_id(token: Annotated[str, Depends(oauth2_scheme)]) -> int:
+    """
+    Stateless path for endpoints that only need the user id: tokens issued
+    with a `uid` claim are trusted as-is (the signature and expiry are
+    checked), older tokens fall back to get_current_user.
+    """
+    payload = _decode_token(token)
+    uid = payload.get("uid")
+    if isinstance(uid, int):
+        user_cache.token_only += 1
+        return uid
+    return (await get_current_user(token)).id
+
+async def get_admin_user(current_user: Annotated[CurrentUser, Depends(get_current_user)]) -> CurrentUser:
+    """
+    For operator actions that affect every user's data or every API process;
+    only the usernames in ADMIN_USERNAMES pass.
+    """
+    if current_user.username not in auth_utils.ADMIN_USERNAMES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Operator access required")
+    return current_user
+
+async def _hash_or_503(awaitable: Awaitable[T]) -> T:
+    try:
+        return await awaitable
+    except auth_utils.HashPoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent logins, retry shortly",
+            headers={"Retry-After": "1"},
+        )
+
+def _issue_token(user: models.User) -> dict:
+    access_token_expires = timedelta(minutes=auth_utils.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = auth_utils.create_access_token(
+        data={"sub": user.username, "uid": user.id}, expires_delta=access_token_expires
+    )
+    return {"access_token": access_token, "token_type": "bearer"}
+
 @router.post("/signup", response_model=schemas.Token)
 async def signup(user: schemas.UserCreate, db: AsyncSession = Depends(database.get_db)):
     # Check if user already exists
@@ -41,36 +103,46 @@ async def signup(user: schemas.UserCreate, db: AsyncSession = Depends(database.g
     if existing_user:
         raise HTTPException(status_code=400, detail="Username or email already registered")
 
-    hashed_password = auth_utils.get_password_hash(user.password)
+    # Give the connection back before the (slow, possibly queued) hash
+    await db.close()
+
+    hashed_password = await _hash_or_503(auth_utils.password_hasher.hash(user.password))
     new_user = models.User(username=user.username, email=user.email, hashed_password=hashed_password)
     db.add(new_user)
-    await db.commit()
+    try:
+        await db.commit()
+    except IntegrityError:
+        # A concurrent signup took the name or email while the password was hashed
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Username or email already registered")
     await db.refresh(new_user)
-
-    access_token_expires = timedelta(minutes=auth_utils.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = auth_utils.create_access_token(
-        data={"sub": new_user.username}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return _issue_token(new_user)
 
 @router.post("/login", response_model=schemas.Token)
 async def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: AsyncSession = Depends(database.get_db)):
     result = await db.execute(select(models.User).where(models.User.username == form_data.username))
     user = result.scalar_one_or_none()
-    
-    if not user or not auth_utils.verify_password(form_data.password, user.hashed_password):
+    # Give the connection back before the (slow, possibly queued) hash check
+    await db.close()
+
+    if not user or not await _hash_or_503(auth_utils.password_hasher.verify(form_data.password, user.hashed_password)):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    access_token_expires = timedelta(minutes=auth_utils.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = auth_utils.create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+
+    return _issue_token(user)
 
 @router.get("/users/me")
-async def read_users_me(current_user: Annotated[models.User, Depends(get_current_user)]):
+async def read_users_me(current_user: Annotated[CurrentUser, Depends(get_current_user)]):
     return {"username": current_user.username, "email": current_user.email}
+
+@router.get("/cache/stats")
+async def user_cache_stats(user_id: Annotated[int, Depends(get_current_user_id)]):
+    """
+    User cache counters; queries_avoided is the number of users lookups
+    served from the cache or the token's uid claim. Also reports the
+    bcrypt pool's load and rejections.
+    """
+    return {**user_cache.stats(), "password_hashing": auth_utils.password_hasher.stats()}
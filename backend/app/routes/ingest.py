@@ -0,0 +1,211 @@
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Iterator, List, Tuple, Dict, Any
+from collections import deque
+import asyncio
+import itertools
+import json
+import os
+import time
+import zipfile
+
+from ..routes.auth import get_current_user_id
+from ..routes.processing import run_pipeline, propagated_values, PipelineOutcome
+from ..persistence import BulkResultWriter, email_values, log_values
+from ..parsing import iter_mailbox_documents
+from ..clustering import cluster_documents, Cluster
+from ..governor import llm_priority, llm_user, PRIORITY_BULK
+from ..uploads import spool_upload
+
+router = APIRouter()
+
+BULK_MAX_CONCURRENCY = int(os.getenv("BULK_MAX_CONCURRENCY", "8"))
+BULK_PROGRESS_BATCH_SIZE = int(os.getenv("BULK_PROGRESS_BATCH_SIZE", "50"))
+# Documents grouped together for near-duplicate/thread clustering
+BULK_CLUSTER_WINDOW = int(os.getenv("BULK_CLUSTER_WINDOW", "1000"))
+
+# Only the first few failures are echoed back; the counters cover the rest
+_MAX_REPORTED_ERRORS = 20
+
+
+async def _process_cluster(
+    index: int,
+    text: str,
+    metadata: Dict[str, Any],
+    members: List[Tuple[str, Dict[str, Any], str, float]],
+    user_id: int,
+) -> Tuple[int, str | None, PipelineOutcome | None]:
+    """
+    Runs a cluster's representative through the pipeline. No connection is
+    held while the LLM runs; nothing is written here, the caller hands the
+    outcome to the batched writer.
+    Returns (index, error, outcome).
+    """
+    # Runs in its own task, so this only affects this document's LLM calls
+    llm_priority.set(PRIORITY_BULK)
+    llm_user.set(user_id)
+    try:
+        outcome = await run_pipeline(text, metadata)
+        return index, None, outcome
+    except HTTPException as e:
+        return index, str(e.detail), None
+    except Exception as e:
+        print(f"Error processing document {index}: {e}")
+        return index, str(e), None
+
+
+def _read_window(documents: Iterator[Tuple[str, Dict[str, Any]]], size: int) -> List[Tuple[str, Dict[str, Any]]]:
+    return list(itertools.islice(documents, size))
+
+
+async def run_bulk_ingest(
+    documents: Iterator[Tuple[str, Dict[str, Any]]],
+    user_id: int,
+    concurrency: int,
+    batch_size: int,
+    cluster: bool = True,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Pulls documents lazily from the iterator and keeps at most `concurrency`
+    of them in flight. Yields a progress record every `batch_size` finished
+    documents and a final summary.
+
+    With `cluster`, documents are read in windows of BULK_CLUSTER_WINDOW and
+    grouped into near-duplicates and reply threads first; only one message
+    per group goes to the LLM and the rest inherit its result, flagged for
+    spot-check.
+
+    Results are written by a BulkResultWriter in batches of PERSIST_BATCH_SIZE
+    documents, one transaction per batch.
+    """
+    started = time.perf_counter()
+    pending: set[asyncio.Task] = set()
+    ready: deque = deque()
+    # index -> (text, metadata, members) of documents still in flight
+    in_flight: Dict[int, Tuple[str, Dict[str, Any], list]] = {}
+    writer = BulkResultWriter()
+    window_size = BULK_CLUSTER_WINDOW if cluster else max(concurrency, 1)
+    submitted = succeeded = failed = skipped = propagated = 0
+    batch = 0
+    errors = []
+    exhausted = False
+
+    def progress(event: str) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - started
+        done = succeeded + failed + propagated
+        failed_total = failed + writer.failed
+        return {
+            "event": event,
+            "batch": batch,
+            "submitted": submitted,
+            "succeeded": succeeded,
+            "failed": failed_total,
+            "persisted": writer.written,
+            "skipped": skipped,
+            "propagated": propagated,
+            "elapsed_seconds": round(elapsed, 3),
+            "docs_per_second": round(done / elapsed, 3) if elapsed else 0.0,
+        }
+
+    try:
+        while True:
+            while len(pending) < concurrency:
+                if not ready:
+                    if exhausted:
+                        break
+                    # Parsing/decompression and clustering are blocking work, keep them off the event loop
+                    window = await run_in_threadpool(_read_window, documents, window_size)
+                    exhausted = len(window) < window_size
+                    docs = [doc for doc in window if doc[0].strip()]
+                    skipped += len(window) - len(docs)
+                    if cluster and len(docs) > 1:
+                        clusters = await run_in_threadpool(cluster_documents, docs)
+                    else:
+                        clusters = [Cluster(representative=i) for i in range(len(docs))]
+                    for group in clusters:
+                        members = [(*docs[m.index], m.relation, m.similarity) for m in group.members]
+                        ready.append((docs[group.representative], members))
+                    continue
+
+                (text, metadata), members = ready.popleft()
+                submitted += 1
+                in_flight[submitted] = (text, metadata, members)
+                pending.add(asyncio.create_task(_process_cluster(submitted, text, metadata, members, user_id)))
+
+            if not pending:
+                break
+
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                index, error, outcome = task.result()
+                text, metadata, members = in_flight.pop(index)
+                if error is None:
+                    succeeded += 1
+                    propagated += len(members)
+                    result = outcome.result
+                    await writer.add(
+                        email_values(text, result.metadata, user_id),
+                        log_values(result, text),
+                        [
+                            propagated_values(member_text, member_metadata, result, relation, similarity, user_id)
+                            for member_text, member_metadata, relation, similarity in members
+                        ],
+                        outcome.cache_entry,
+                    )
+                else:
+                    failed += 1
+                    if len(errors) < _MAX_REPORTED_ERRORS:
+                        errors.append({"document": index, "error": error})
+                if (succeeded + failed) % batch_size == 0:
+                    batch += 1
+                    yield progress("batch")
+    finally:
+        # Client went away or the iterator blew up: don't leave orphaned LLM calls running
+        for task in pending:
+            task.cancel()
+        # Whatever finished is still written, even if the client disconnected
+        await writer.flush()
+
+    summary = progress("complete")
+    summary["errors"] = errors + writer.errors[:_MAX_REPORTED_ERRORS]
+    yield summary
+
+
+@router.post("/upload/batch")
+async def upload_mailbox(
+    file: UploadFile = File(...),
+    concurrency: int = Query(BULK_MAX_CONCURRENCY, ge=1),
+    batch_size: int = Query(BULK_PROGRESS_BATCH_SIZE, ge=1),
+    cluster: bool = True,
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Upload an mbox file or a zip of .eml/.txt files.
+    Messages are processed concurrently and progress is streamed back as
+    newline-delimited JSON, one record per finished batch.
+    Near-duplicates and quoted thread messages are reviewed once unless cluster=false.
+    """
+    filename = (file.filename or "").lower()
+    if not filename.endswith((".zip", ".mbox", ".mbx")):
+        raise HTTPException(status_code=400, detail="Expected an .mbox or .zip file")
+
+    # The request's UploadFile is closed once the handler returns, so keep our own copy
+    # for the lifetime of the streaming response.
+    spool = await spool_upload(file)
+    if filename.endswith(".zip") and not zipfile.is_zipfile(spool):
+        spool.close()
+        raise HTTPException(status_code=400, detail="Uploaded file is not a valid zip archive")
+    spool.seek(0)
+
+    concurrency = min(concurrency, BULK_MAX_CONCURRENCY)
+
+    async def event_stream():
+        try:
+            documents = iter_mailbox_documents(filename, spool)
+            async for record in run_bulk_ingest(documents, user_id, concurrency, batch_size, cluster):
+                yield json.dumps(record) + "\n"
+        finally:
+            spool.close()
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
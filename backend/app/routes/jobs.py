@@ -0,0 +1,115 @@
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Literal, Optional
+import asyncio
+import json
+
+from ..database import get_db, SessionLocal
+from ..routes.auth import get_current_user_id
+from ..models import AnalysisJob
+from ..schemas import EmailInput, JobStatus
+from ..jobs import enqueue_job, TERMINAL_STATUSES
+from .processing import input_overrides, parse_spooled_upload
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+# How often the status stream re-reads the job row
+STATUS_POLL_SECONDS = 1.0
+
+
+def _to_status(job: AnalysisJob) -> JobStatus:
+    return JobStatus(
+        job_id=job.id,
+        status=job.status,
+        attempts=job.attempts,
+        max_attempts=job.max_attempts,
+        last_error=job.last_error,
+        email_id=job.email_id,
+        result=job.result,
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+    )
+
+
+async def _get_user_job(db: AsyncSession, job_id: int, user_id: int) -> AnalysisJob:
+    job = await db.get(AnalysisJob, job_id)
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/analyze", response_model=JobStatus, status_code=status.HTTP_202_ACCEPTED)
+async def submit_analyze_job(
+    email_input: EmailInput,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Queue an email for analysis and return immediately with the job id.
+    """
+    job = await enqueue_job(db, email_input.text, input_overrides(email_input), user_id, mode=email_input.mode)
+    return _to_status(job)
+
+
+@router.post("/upload", response_model=JobStatus, status_code=status.HTTP_202_ACCEPTED)
+async def submit_upload_job(
+    file: UploadFile = File(...),
+    mode: Optional[Literal["staged", "fused"]] = None,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Queue an uploaded .eml or .txt file for analysis. The file is spooled
+    and parsed like on /upload; an .eml's attachments are kept with the job
+    and analysed by the worker as documents linked to the email.
+    """
+    text_body, metadata, attachments = await parse_spooled_upload(file)
+    job = await enqueue_job(db, text_body, metadata, user_id, mode=mode, attachments=attachments)
+    return _to_status(job)
+
+
+@router.get("/{job_id}", response_model=JobStatus)
+async def get_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Poll a job's status; `result` holds the ProcessingResult once it succeeded.
+    """
+    job = await _get_user_job(db, job_id, user_id)
+    return _to_status(job)
+
+
+@router.get("/{job_id}/events")
+async def stream_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Server-sent events: one `status` event whenever the job changes,
+    ending after it succeeds or fails for good.
+    """
+    await _get_user_job(db, job_id, user_id)
+
+    async def event_stream():
+        last_seen = None
+        while True:
+            # Short-lived session per poll so the stream holds no connection while idle
+            async with SessionLocal() as session:
+                job = await _get_user_job(session, job_id, user_id)
+                payload = _to_status(job).model_dump(mode="json")
+            if payload != last_seen:
+                last_seen = payload
+                yield f"event: status\ndata: {json.dumps(payload)}\n\n"
+            if payload["status"] in TERMINAL_STATUSES:
+                break
+            await asyncio.sleep(STATUS_POLL_SECONDS)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
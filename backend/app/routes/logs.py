@@ -0,0 +1,299 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, literal, literal_column, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from ..database import SessionLocal, get_db
+from ..metrics import span
+from ..redaction import REDACTION_MARKER, redaction_texts, render_redacted, unresolved_texts
+from ..routes.auth import get_current_user_id
+from ..models import Email, PrivilegeLog
+from ..schemas import LogDetail, LogEntry, LogPage, RedactedDocument
+from typing import List, Literal, Optional
+from datetime import date, datetime, timedelta, time as time_of_day
+import base64
+import json
+import os
+
+router = APIRouter(prefix="/logs", tags=["logs"])
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Characters of the body ts_headline looks at for a search snippet
+SNIPPET_BODY_CHARS = 20000
+# Must match the configuration of the emails.search_vector column for the GIN index to be used
+SEARCH_CONFIG = literal_column("'english'::regconfig")
+# Documents fetched per round trip when rendering a production set; bodies can be large
+RENDER_CHUNK_SIZE = int(os.getenv("RENDER_CHUNK_SIZE", "200"))
+
+LIST_COLUMNS = (
+    Email.id,
+    Email.date,
+    Email.sender,
+    Email.recipient,
+    Email.subject,
+    PrivilegeLog.is_privileged,
+    PrivilegeLog.privilege_type,
+    PrivilegeLog.log_description,
+    PrivilegeLog.decided_by,
+    PrivilegeLog.propagated_from_email_id,
+    PrivilegeLog.needs_spot_check,
+)
+
+
+def apply_log_filters(
+    query,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    privilege_type: Optional[str] = None,
+):
+    """
+    Date range (inclusive, by day) and privilege type filters shared by the
+    log listing and the CSV export. privilege_type "Not Privileged" selects
+    the non-privileged rows.
+    """
+    if date_from:
+        query = query.where(Email.date >= datetime.combine(date_from, time_of_day.min))
+    if date_to:
+        query = query.where(Email.date < datetime.combine(date_to + timedelta(days=1), time_of_day.min))
+    if privilege_type:
+        if privilege_type.lower() == "not privileged":
+            query = query.where(PrivilegeLog.is_privileged.is_(False))
+        else:
+            query = query.where(PrivilegeLog.is_privileged.is_(True), PrivilegeLog.privilege_type == privilege_type)
+    return query
+
+
+def _encode_cursor(sort: str, row) -> str:
+    position = [row.date.isoformat() if row.date else None, row.id] if sort == "date" else [row.id]
+    return base64.urlsafe_b64encode(json.dumps([sort, *position]).encode()).decode()
+
+
+def _decode_cursor(cursor: str, sort: str) -> list:
+    try:
+        cursor_sort, *position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if cursor_sort != sort:
+            raise ValueError("cursor was issued for another sort order")
+        if sort == "date":
+            return [datetime.fromisoformat(position[0]), int(position[1])]
+        return [int(position[0])]
+    except (ValueError, TypeError, IndexError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+
+def _keyset_page(query, sort: str, order: str, cursor: Optional[str]):
+    """Orders the query by the sort key and, given a cursor, starts it right after that row."""
+    # (date, id) is a total order even when several emails share a date
+    key = tuple_(Email.date, Email.id) if sort == "date" else Email.id
+    if cursor:
+        position = _decode_cursor(cursor, sort)
+        after = tuple_(*[literal(p) for p in position]) if sort == "date" else position[0]
+        query = query.where(key > after if order == "asc" else key < after)
+    if sort == "date":
+        query = query.where(Email.date.is_not(None))
+    sort_columns = [Email.date, Email.id] if sort == "date" else [Email.id]
+    return query.order_by(*[c.asc() if order == "asc" else c.desc() for c in sort_columns])
+
+
+def _entry_fields(row) -> dict:
+    return {
+        "email_id": row.id,
+        "date": row.date,
+        "sender": row.sender,
+        "recipient": row.recipient,
+        "subject": row.subject,
+        "is_privileged": row.is_privileged,
+        "privilege_type": row.privilege_type,
+        "log_description": row.log_description,
+        "decided_by": row.decided_by,
+        "propagated_from_email_id": row.propagated_from_email_id,
+        "needs_spot_check": row.needs_spot_check,
+    }
+
+
+def control_number(email_id: int) -> str:
+    return f"CTRL{email_id:06d}"
+
+
+def _redacted_document(email_id: int, body: Optional[str], spans: Optional[list], marker: str) -> RedactedDocument:
+    text, redactions = render_redacted(body or "", spans, marker)
+    return RedactedDocument(
+        email_id=email_id,
+        control_number=control_number(email_id),
+        text=text,
+        redactions=redactions,
+        unresolved=unresolved_texts(spans),
+    )
+
+
+@router.get("", response_model=LogPage)
+async def list_logs(
+    q: Optional[str] = Query(None, description="Full-text search over subject and body (web search syntax: quotes, OR, -term)"),
+    sender: Optional[str] = Query(None, description="Case-insensitive substring of the sender"),
+    recipient: Optional[str] = Query(None, description="Case-insensitive substring of the recipients"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    privilege_type: Optional[str] = None,
+    is_privileged: Optional[bool] = None,
+    needs_spot_check: Optional[bool] = None,
+    sort: Literal["id", "date"] = "id",
+    order: Literal["asc", "desc"] = "asc",
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    One page of the privilege log, newest or oldest first by id or by date.
+    Pages use keyset pagination: pass the returned next_cursor to get the
+    next page (with the same filters, sort and order). Every page costs the
+    same however deep it is, unlike OFFSET.
+    """
+    query = (
+        select(*LIST_COLUMNS)
+        .join(PrivilegeLog, Email.id == PrivilegeLog.email_id)
+        .where(Email.user_id == user_id)
+    )
+    query = apply_log_filters(query, date_from, date_to, privilege_type)
+    if is_privileged is not None:
+        query = query.where(PrivilegeLog.is_privileged.is_(is_privileged))
+    if needs_spot_check is not None:
+        query = query.where(PrivilegeLog.needs_spot_check.is_(needs_spot_check))
+    if sender:
+        query = query.where(Email.sender.icontains(sender, autoescape=True))
+    if recipient:
+        query = query.where(Email.recipient.icontains(recipient, autoescape=True))
+    if q:
+        tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+        query = query.where(Email.search_vector.op("@@")(tsquery))
+        snippet_source = func.coalesce(Email.subject, "") + " \n" + func.left(func.coalesce(Email.body, ""), SNIPPET_BODY_CHARS)
+        query = query.add_columns(
+            func.ts_headline(SEARCH_CONFIG, snippet_source, tsquery, "MaxFragments=2, MaxWords=20, MinWords=8").label("snippet")
+        )
+
+    query = _keyset_page(query, sort, order, cursor)
+
+    # One extra row tells whether there is a next page
+    result = await db.execute(query.limit(limit + 1))
+    rows = result.all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = [LogEntry(**_entry_fields(row), snippet=row.snippet if q else None) for row in rows]
+    return LogPage(items=items, next_cursor=_encode_cursor(sort, rows[-1]) if has_more else None)
+
+
+@router.get("/redacted")
+async def render_production_set(
+    email_id: Optional[List[int]] = Query(None, description="Only these emails (repeat the parameter)"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    privilege_type: Optional[str] = None,
+    is_privileged: Optional[bool] = None,
+    marker: str = Query(REDACTION_MARKER, max_length=200, description="Text that replaces each redacted passage"),
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Redacted documents for a production set, streamed as JSON lines (one
+    RedactedDocument per line, in id order). Select the set by id and/or by
+    the same filters as the log listing. Bodies are read from a server-side
+    cursor in chunks, so any number of documents can be rendered.
+    """
+    query = (
+        select(Email.id, Email.body, PrivilegeLog.redaction_spans)
+        .join(PrivilegeLog, Email.id == PrivilegeLog.email_id)
+        .where(Email.user_id == user_id)
+        .order_by(Email.id)
+    )
+    query = apply_log_filters(query, date_from, date_to, privilege_type)
+    if email_id:
+        query = query.where(Email.id.in_(email_id))
+    if is_privileged is not None:
+        query = query.where(PrivilegeLog.is_privileged.is_(is_privileged))
+
+    async def ndjson_stream():
+        # As in the CSV export, the session must outlive the request's dependencies
+        async with SessionLocal() as session, span("render.redacted") as render_span:
+            rendered = 0
+            result = await session.stream(query.execution_options(yield_per=RENDER_CHUNK_SIZE))
+            async for rows in result.partitions():
+                rendered += len(rows)
+                render_span.set(documents=rendered)
+                yield "".join(
+                    _redacted_document(row_id, body, spans, marker).model_dump_json() + "\n"
+                    for row_id, body, spans in rows
+                )
+
+    return StreamingResponse(
+        ndjson_stream(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=redacted_documents.jsonl"},
+    )
+
+
+@router.get("/{email_id}/redacted", response_model=RedactedDocument)
+async def render_document(
+    email_id: int,
+    marker: str = Query(REDACTION_MARKER, max_length=200, description="Text that replaces each redacted passage"),
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    The email body with every redacted passage replaced by the marker, built
+    in one pass from the stored offsets.
+    """
+    query = (
+        select(Email.body, PrivilegeLog.redaction_spans)
+        .join(PrivilegeLog, Email.id == PrivilegeLog.email_id)
+        .where(Email.id == email_id, Email.user_id == user_id)
+    )
+    row = (await db.execute(query)).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Log entry not found")
+    return _redacted_document(email_id, row.body, row.redaction_spans, marker)
+
+
+@router.get("/{email_id}", response_model=LogDetail)
+async def get_log(
+    email_id: int,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Full privilege log entry for one email, with reasoning, redactions and the body,
+    plus the documents extracted from its attachments (or the email it was attached to).
+    """
+    query = (
+        select(
+            *LIST_COLUMNS,
+            Email.body,
+            PrivilegeLog.reasoning,
+            PrivilegeLog.redaction_spans,
+            PrivilegeLog.cluster_relation,
+            PrivilegeLog.cluster_similarity,
+            PrivilegeLog.token_usage,
+            PrivilegeLog.pipeline_fingerprint,
+            Email.parent_email_id,
+        )
+        .join(PrivilegeLog, Email.id == PrivilegeLog.email_id)
+        .where(Email.id == email_id, Email.user_id == user_id)
+    )
+    row = (await db.execute(query)).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Log entry not found")
+    attachment_ids = (await db.execute(
+        select(Email.id).where(Email.parent_email_id == email_id, Email.user_id == user_id).order_by(Email.id)
+    )).scalars().all()
+    return LogDetail(
+        **_entry_fields(row),
+        reasoning=row.reasoning,
+        redacted_text=redaction_texts(row.redaction_spans),
+        redaction_spans=row.redaction_spans,
+        cluster_relation=row.cluster_relation,
+        cluster_similarity=row.cluster_similarity,
+        token_usage=row.token_usage,
+        pipeline_fingerprint=row.pipeline_fingerprint,
+        parent_email_id=row.parent_email_id,
+        attachment_email_ids=attachment_ids,
+        body=row.body,
+    )
@@ -1,214 +1,965 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from langchain_core.exceptions import OutputParserException
+from pydantic import ValidationError
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from ..database import get_db
-from ..routes.auth import get_current_user
-from ..models import Email, PrivilegeLog, User
-from ..schemas import EmailInput, ProcessingResult
-from ..parsing import extract_metadata
-from ..chains import get_judge_chain, get_writer_chain, get_redactor_chain
-import email
+from ..auth_utils import ADMIN_USERNAMES
+from ..database import get_db, SessionLocal
+from ..routes.auth import get_admin_user, get_current_user, get_current_user_id
+from ..models import Email, PrivilegeLog
+from ..schemas import AttachmentResult, EmailInput, ProcessingResult
+from ..parsing import AttachmentPart, extract_metadata, parse_upload
+from ..chains import get_judge_chain, get_writer_chain, get_redactor_chain, get_fused_chain, chain_registry, FusedAnalysis, pipeline_fingerprint
+from ..cache import result_cache, make_cache_key, CachedResult
+from ..coordination import broadcaster
+from ..governor import governor, is_rate_limit_error, llm_usage, llm_user
+from ..triage import join_recipients, triage, train_triage
+from ..user_cache import CurrentUser
+from ..metrics import span
+from ..preprocessing import prepare_body, PreparedBody, LLM_CHUNK_TOKENS
+from ..persistence import insert_email_with_log, email_values, log_values
+from ..redaction import redaction_texts
+from ..uploads import ATTACHMENT_MAX_BYTES, ATTACHMENT_MAX_COUNT, ExtractedAttachment, attachment_extractor, spool_upload
+from .logs import apply_log_filters, control_number
+from typing import Awaitable, Callable, List, Literal, Optional, Tuple, TypeVar
+from dataclasses import dataclass
+from datetime import date
+import asyncio
+import os
 import io
 import csv
+import json
+import time
+
+T = TypeVar("T")
 
 router = APIRouter()
 
-async def process_and_save_email(text: str, metadata_override: dict, db: AsyncSession, user_id: int | None = None) -> ProcessingResult:
+# "staged": judge, then writer + redactor. "fused": one call returning all three,
+# falling back to staged when its output does not validate. Overridable per request.
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "staged")
+PIPELINE_MODES = ("staged", "fused")
+
+# Comment line sent on an idle progress stream so proxies keep the connection open
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+
+# Called with (event, data) as each stage of an analysis finishes; see /analyze/stream
+ProgressCallback = Callable[[str, dict], None]
+
+# Rows fetched from the server-side cursor (and flushed to the client) per chunk
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "2000"))
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
+async def _timed(timings: dict, stage: str, awaitable: Awaitable[T]) -> T:
     """
-    Shared logic to process email text, run chains, and save to DB.
-    metadata_override can contain keys: Date, From, To, Subject
+    Awaits a pipeline stage and records its wall time in milliseconds,
+    whether it succeeds or fails, plus a `pipeline.<stage>` tracing span.
     """
-    # 1. Metadata Extraction (Deterministic) from text
+    started = time.perf_counter()
+    try:
+        async with span(f"pipeline.{stage}"):
+            return await awaitable
+    finally:
+        timings[stage] = _elapsed_ms(started)
+
+def _recipients(metadata: dict) -> str:
+    return join_recipients(metadata.get("To"), metadata.get("Cc"))
+
+def _merge_metadata(text: str, metadata_override: dict) -> dict:
+    """Header values parsed from the text, overridden by any non-empty supplied value."""
     metadata = extract_metadata(text)
-    
-    # ... (unchanged metadata merge logic) ...
     for k, v in metadata_override.items():
         if v:
             metadata[k] = v
-            
-    sender = metadata.get("From", "Unknown")
-    recipient = metadata.get("To", "Unknown")
-    subject = metadata.get("Subject", "No Subject")
-    date_val = metadata.get("Date") 
-    
-    # 3. Privilege Classification
+    return metadata
+
+async def _gather_reraise(*awaitables):
+    """gather() that lets every call finish, then raises the first error, if any."""
+    results = await asyncio.gather(*awaitables, return_exceptions=True)
+    for outcome in results:
+        if isinstance(outcome, Exception):
+            raise outcome
+    return results
+
+def _merge_redactions(parts) -> list:
+    items = []
+    for part in parts:
+        for item in part.get("items", []):
+            if item not in items:
+                items.append(item)
+    return items
+
+def _emit_verdict(progress: Optional[ProgressCallback], source: str, is_privileged, privilege_type, reasoning, description, redaction_items):
+    """Judge, description and redaction events at once, for decisions that did not go through the staged chains."""
+    if progress is None:
+        return
+    progress("judge", {"source": source, "is_privileged": is_privileged, "privilege_type": privilege_type, "reasoning": reasoning})
+    if is_privileged:
+        progress("description", {"log_description": description})
+        progress("redactions", {"items": redaction_items or []})
+
+async def _emit_when_done(awaitable: Awaitable[T], emit: Callable[[T], None]) -> T:
+    result = await awaitable
+    emit(result)
+    return result
+
+async def _stream_judge(judge_chain, inputs: dict, progress: ProgressCallback) -> dict:
+    """
+    Judge call that streams: the parser yields the JSON as it grows, and each
+    new piece of the reasoning is sent as a `reasoning` event.
+    """
+    result = {}
+    sent = ""
+    async for partial in judge_chain.astream(inputs):
+        result = partial
+        reasoning = partial.get("reasoning")
+        if isinstance(reasoning, str) and len(reasoning) > len(sent) and reasoning.startswith(sent):
+            progress("reasoning", {"delta": reasoning[len(sent):]})
+            sent = reasoning
+    if "is_privileged" not in result:
+        raise OutputParserException(f"Judge output could not be parsed: {result}")
+    return result
+
+async def _run_chains(prepared: PreparedBody, sender: str, recipient: str, subject: str, timings: dict, progress: Optional[ProgressCallback] = None):
+    """
+    Judge, then (if privileged) writer and redactor, over the pre-processed body.
+    Oversized bodies arrive as several chunks: each chunk is judged
+    concurrently, the email is privileged if any chunk is, and only the
+    flagged chunks go to the redactor.
+    With a progress callback, the judge's reasoning is streamed (single-chunk
+    bodies) and an event is sent as each chain finishes.
+    Returns (is_privileged, privilege_type, reasoning, description, redaction_items, complete).
+    """
+    chunks = prepared.chunks
     judge_chain = get_judge_chain()
+    judge_inputs = [{
+        "sender": sender,
+        "recipient": recipient,
+        "subject": subject,
+        "body": chunk
+    } for chunk in chunks]
     try:
-        # ASYNC LANGCHAIN CALL
-        judge_result = await judge_chain.ainvoke({
-            "sender": sender,
-            "recipient": recipient,
-            "subject": subject,
-            "body": text
-        })
+        # ASYNC LANGCHAIN CALLS, one per chunk
+        if progress and len(chunks) == 1:
+            judge_results = [await _timed(timings, "judge", _stream_judge(judge_chain, judge_inputs[0], progress))]
+        else:
+            judge_results = await _timed(timings, "judge", _gather_reraise(*(
+                judge_chain.ainvoke(inputs) for inputs in judge_inputs
+            )))
     except Exception as e:
         print(f"Error in judge chain: {e}")
+        if is_rate_limit_error(e):
+            raise HTTPException(status_code=503, detail="LLM quota exhausted, retry later", headers={"Retry-After": "30"})
         raise HTTPException(status_code=500, detail=f"LLM Classification Error: {str(e)}")
 
-    is_privileged = judge_result.get("is_privileged", False)
-    privilege_type = judge_result.get("privilege_type")
-    reasoning = judge_result.get("reasoning")
+    flagged = [i for i, r in enumerate(judge_results) if r.get("is_privileged", False)]
+    is_privileged = bool(flagged)
+    usage = llm_usage.get()
+    if usage is not None and len(chunks) > 1:
+        # Ends up in token_usage, so a re-review can rerun the writer or redactor on the same chunks
+        usage["flagged_chunks"] = flagged
+    if len(chunks) == 1:
+        privilege_type = judge_results[0].get("privilege_type")
+        reasoning = judge_results[0].get("reasoning")
+    else:
+        shown = flagged or range(len(chunks))
+        privilege_type = judge_results[flagged[0]].get("privilege_type") if flagged else None
+        reasoning = " ".join(f"[Part {i + 1}/{len(chunks)}] {judge_results[i].get('reasoning')}" for i in shown)
+    if progress:
+        progress("judge", {"source": "llm", "is_privileged": is_privileged, "privilege_type": privilege_type, "reasoning": reasoning})
 
     description = None
     redaction_items = None
+    complete = True
 
-    # 4. If Privileged, run other chains
+    # 4. If Privileged, run writer and redactor concurrently.
+    # Neither depends on the other's output, so a privileged email costs
+    # one judge round trip plus the slower of the two.
     if is_privileged:
-        # Writer
-        writer_chain = get_writer_chain()
-        # ASYNC LANGCHAIN CALL
-        writer_result = await writer_chain.ainvoke({
+        # The writer sees the privileged parts, within one chunk's budget
+        writer_body = "\n\n".join(chunks[i] for i in flagged)[:LLM_CHUNK_TOKENS * 4]
+        writer_call = _timed(timings, "writer", get_writer_chain().ainvoke({
             "reasoning": reasoning,
-            "body": text
-        })
-        description = writer_result.get("log_description")
+            "body": writer_body
+        }))
+        redactor_call = _timed(timings, "redactor", _gather_reraise(*(
+            get_redactor_chain().ainvoke({"body": chunks[i]}) for i in flagged
+        )))
+        if progress:
+            writer_call = _emit_when_done(writer_call, lambda out: progress("description", {"log_description": out.get("log_description")}))
+            redactor_call = _emit_when_done(redactor_call, lambda parts: progress("redactions", {"items": _merge_redactions(parts)}))
+        writer_outcome, redactor_outcome = await asyncio.gather(writer_call, redactor_call, return_exceptions=True)
+
+        # Partial failure keeps whatever succeeded; the result is not cached
+        # so a re-upload gets another chance at the missing stage.
+        if isinstance(writer_outcome, Exception):
+            print(f"Error in writer chain: {writer_outcome}")
+            complete = False
+            if progress:
+                progress("description", {"log_description": None, "error": str(writer_outcome)})
+        else:
+            description = writer_outcome.get("log_description")
+
+        if isinstance(redactor_outcome, Exception):
+            print(f"Error in redactor chain: {redactor_outcome}")
+            complete = False
+            if progress:
+                progress("redactions", {"items": None, "error": str(redactor_outcome)})
+        else:
+            redaction_items = _merge_redactions(redactor_outcome)
+
+    return is_privileged, privilege_type, reasoning, description, redaction_items, complete
 
-        # Redactor
-        redactor_chain = get_redactor_chain()
-        # ASYNC LANGCHAIN CALL
-        redactor_result = await redactor_chain.ainvoke({
-            "body": text
+async def _run_fused(prepared: PreparedBody, sender: str, recipient: str, subject: str, timings: dict, progress: Optional[ProgressCallback] = None):
+    """
+    Single-call variant of _run_chains for bodies that fit in one chunk.
+    Returns the same tuple, or None if the model's answer does not validate
+    (unparseable JSON, schema mismatch, or privileged without a description),
+    in which case the caller falls back to the staged chains.
+    """
+    try:
+        raw = await _timed(timings, "fused", get_fused_chain().ainvoke({
+            "sender": sender,
+            "recipient": recipient,
+            "subject": subject,
+            "body": prepared.chunks[0]
+        }))
+        analysis = FusedAnalysis.model_validate(raw)
+    except (OutputParserException, ValidationError) as e:
+        print(f"Fused output failed validation, falling back to staged chains: {e}")
+        return None
+    except Exception as e:
+        print(f"Error in fused chain: {e}")
+        if is_rate_limit_error(e):
+            raise HTTPException(status_code=503, detail="LLM quota exhausted, retry later", headers={"Retry-After": "30"})
+        raise HTTPException(status_code=500, detail=f"LLM Classification Error: {str(e)}")
+
+    if not analysis.is_privileged:
+        verdict = (False, analysis.privilege_type, analysis.reasoning, None, None, True)
+    elif not analysis.log_description:
+        print("Fused output is privileged without a log description, falling back to staged chains")
+        return None
+    else:
+        verdict = (True, analysis.privilege_type, analysis.reasoning, analysis.log_description, analysis.items, True)
+    _emit_verdict(progress, "llm", *verdict[:5])
+    return verdict
+
+async def rerun_stages(prepared: PreparedBody, flagged: List[int], reasoning: Optional[str], stages: Tuple[str, ...]) -> dict:
+    """
+    Runs just the writer and/or redactor for an already judged email, on the
+    chunks the judge flagged, with the stored reasoning. Returns the new
+    outputs by stage ({"writer": description, "redactor": items}); a stage
+    that fails is missing from the result.
+    """
+    chunks = prepared.chunks
+    calls = {}
+    if "writer" in stages:
+        calls["writer"] = get_writer_chain().ainvoke({
+            "reasoning": reasoning,
+            "body": "\n\n".join(chunks[i] for i in flagged)[:LLM_CHUNK_TOKENS * 4]
         })
-        redaction_items = redactor_result.get("items", [])
-
-    # 5. Save to DB (Async)
-    db_email = Email(
-        sender=sender,
-        recipient=recipient,
-        subject=subject,
-        body=text,
-        user_id=user_id
-    )
-    db.add(db_email)
-    await db.commit()
-    await db.refresh(db_email)
+    if "redactor" in stages:
+        calls["redactor"] = _gather_reraise(*(get_redactor_chain().ainvoke({"body": chunks[i]}) for i in flagged))
+    outcomes = await asyncio.gather(*calls.values(), return_exceptions=True)
 
-    db_log = PrivilegeLog(
-        email_id=db_email.id,
-        is_privileged=is_privileged,
-        privilege_type=privilege_type,
-        log_description=description,
-        reasoning=reasoning,
-        redacted_text=str(redaction_items) if redaction_items else None
-    )
-    db.add(db_log)
-    await db.commit()
+    rerun = {}
+    for stage, outcome in zip(calls, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"Error in {stage} chain: {outcome}")
+        elif stage == "writer":
+            rerun[stage] = outcome.get("log_description")
+        else:
+            rerun[stage] = _merge_redactions(outcome)
+    return rerun
 
-    return ProcessingResult(
+def result_stages(mode: str, is_privileged: bool, description: Optional[str], redaction_items: Optional[List[str]]) -> Tuple[str, ...]:
+    """
+    The chains a result came from, for its pipeline fingerprint. A writer or
+    redactor that failed is left out, so the re-review retries just that stage.
+    """
+    if mode == "fused":
+        return ("fused",)
+    stages = ("judge",)
+    if is_privileged:
+        if description is not None:
+            stages += ("writer",)
+        if redaction_items is not None:
+            stages += ("redactor",)
+    return stages
+
+@dataclass
+class PipelineOutcome:
+    result: ProcessingResult
+    # Set when the chains ran to completion and the result should be cached
+    cache_entry: Optional[Tuple[str, CachedResult]] = None
+
+async def _cached_result(cache_key: str) -> Optional[CachedResult]:
+    # Own short session: its connection is back in the pool before any LLM call
+    async with SessionLocal() as session:
+        return await result_cache.get(session, cache_key)
+
+async def run_pipeline(
+    text: str,
+    metadata_override: dict,
+    mode: Optional[str] = None,
+    progress: Optional[ProgressCallback] = None
+) -> PipelineOutcome:
+    """
+    Runs metadata extraction, the result cache and the LLM chains for one
+    document without writing anything. A database connection is held only
+    for the cache lookup, never across LLM calls.
+    metadata_override can contain keys: Date, From, To, Subject
+    mode is "staged" or "fused" (default PIPELINE_MODE).
+    progress, if given, is called as each stage finishes.
+    """
+    mode = mode or PIPELINE_MODE
+    timings = {}
+    started = time.perf_counter()
+
+    # 1. Metadata Extraction (Deterministic) from text
+    with span("parse.metadata"):
+        metadata = _merge_metadata(text, metadata_override)
+            
+    sender = metadata.get("From", "Unknown")
+    recipient = metadata.get("To", "Unknown")
+    subject = metadata.get("Subject", "No Subject")
+    if progress:
+        progress("metadata", {"metadata": metadata})
+    
+    # 2. Result cache: exact duplicates skip every LLM call
+    cache_key = make_cache_key(text, metadata, pipeline_mode=mode)
+    cached = await _timed(timings, "cache_lookup", _cached_result(cache_key))
+    cache_entry = None
+    # 3a. Local triage on a cache miss: confidently non-privileged documents skip the LLM
+    triaged = None
+    if cached is None:
+        with span("triage"):
+            triaged = triage.assess(sender, _recipients(metadata), subject, text)
+
+    if cached is not None:
+        is_privileged = cached.is_privileged
+        privilege_type = cached.privilege_type
+        reasoning = cached.reasoning
+        description = cached.log_description
+        redaction_items = cached.redaction_items
+        token_usage = {"calls": 0, "mode": "cache"}
+        # Only complete results are cached, under the current prompts and model. A fused
+        # request can hit a staged result (fallback, chunked body): stamp what produced it.
+        fingerprint = pipeline_fingerprint(*cached.stages)
+        _emit_verdict(progress, "cache", is_privileged, privilege_type, reasoning, description, redaction_items)
+    elif triaged.auto_negative:
+        is_privileged = False
+        privilege_type = None
+        reasoning = f"Auto-classified as not privileged by local triage (privilege score {triaged.score:.3f}); no attorney parties or legal terms."
+        description = None
+        redaction_items = None
+        token_usage = {"calls": 0, "mode": "triage", "triage_score": round(triaged.score, 4)}
+        fingerprint = {"triage": "local"}
+        _emit_verdict(progress, "triage", is_privileged, privilege_type, reasoning, description, redaction_items)
+    else:
+        # 3. Pre-processing: drop quoted history, signatures and disclaimers, chunk if still too long
+        with span("preprocess") as preprocess_span:
+            prepared = prepare_body(text)
+            preprocess_span.set(chunks=len(prepared.chunks))
+        usage = {"calls": 0, "input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+        usage_token = llm_usage.set(usage)
+        try:
+            verdict = None
+            # Chunked bodies always take the staged path
+            if mode == "fused" and len(prepared.chunks) == 1:
+                verdict = await _run_fused(prepared, sender, recipient, subject, timings, progress)
+                mode_used = "fused" if verdict else "fused_fallback"
+            else:
+                mode_used = "staged"
+            if verdict is None:
+                verdict = await _run_chains(prepared, sender, recipient, subject, timings, progress)
+        finally:
+            llm_usage.reset(usage_token)
+        is_privileged, privilege_type, reasoning, description, redaction_items, complete = verdict
+        token_usage = {
+            **usage,
+            "mode": mode_used,
+            "raw_tokens_estimate": prepared.raw_tokens,
+            "sent_tokens_estimate": prepared.tokens,
+            "chunks": len(prepared.chunks),
+            "removed": prepared.removed,
+            "truncated": prepared.truncated,
+        }
+        stages = result_stages(mode_used, is_privileged, description, redaction_items)
+        fingerprint = pipeline_fingerprint(*stages)
+
+        if complete:
+            cache_entry = (cache_key, CachedResult(
+                is_privileged=is_privileged,
+                privilege_type=privilege_type,
+                reasoning=reasoning,
+                log_description=description,
+                redaction_items=redaction_items,
+                stages=stages,
+            ))
+
+    timings["pipeline"] = _elapsed_ms(started)
+    result = ProcessingResult(
         metadata=metadata,
         is_privileged=is_privileged,
         privilege_type=privilege_type,
         log_description=description,
         reasoning=reasoning,
-        redacted_text=redaction_items
+        redacted_text=redaction_items,
+        timings=timings,
+        token_usage=token_usage,
+        pipeline_fingerprint=fingerprint,
+    )
+    return PipelineOutcome(result=result, cache_entry=cache_entry)
+
+async def process_and_save_email(
+    text: str,
+    metadata_override: dict,
+    db: AsyncSession,
+    user_id: int | None = None,
+    commit: bool = True,
+    mode: Optional[str] = None,
+    progress: Optional[ProgressCallback] = None,
+    attachments: Optional[List[AttachmentPart]] = None
+) -> ProcessingResult:
+    """
+    Shared logic to process email text, run chains, and save to DB.
+    metadata_override can contain keys: Date, From, To, Subject
+    The cache entry, email and log row are written in one transaction. With
+    commit=False the transaction is left open for the caller (the job worker
+    commits it together with the job's completion).
+    db is not touched until the persistence step, so a session that has not
+    been used yet checks out its connection only after the LLM calls.
+    attachments (from an uploaded .eml) are extracted and analysed while the
+    email itself is, and stored in the same transaction as child documents.
+    """
+    started = time.perf_counter()
+    # The governor queues this document's LLM calls (attachments included) as this user's
+    user_token = llm_user.set(user_id)
+    attachment_timings = {}
+    attachment_task = None
+    if attachments:
+        attachment_task = asyncio.create_task(_timed(
+            attachment_timings, "attachments", _analyze_attachments(attachments, metadata_override, user_id, mode)
+        ))
+    try:
+        outcome = await run_pipeline(text, metadata_override, mode=mode, progress=progress)
+        result = outcome.result
+
+        # 5. Save to DB (Async): one statement for email + log, one commit
+        persist_started = time.perf_counter()
+        async with span("db.insert"):
+            if outcome.cache_entry:
+                await result_cache.put(db, *outcome.cache_entry)
+            result.email_id = await insert_email_with_log(
+                db,
+                email_values(text, result.metadata, user_id),
+                log_values(result, text),
+            )
+        if attachment_task:
+            documents = await attachment_task
+            async with span("db.insert_attachments", documents=len(documents)):
+                result.attachments = await _save_attachments(db, documents, result.email_id, user_id, progress)
+            result.timings.update(attachment_timings)
+    finally:
+        llm_user.reset(user_token)
+        if attachment_task and not attachment_task.done():
+            attachment_task.cancel()
+    if commit:
+        async with span("db.commit"):
+            await db.commit()
+    result.timings["persist"] = _elapsed_ms(persist_started)
+    result.timings["total"] = _elapsed_ms(started)
+    if progress:
+        progress("persisted", {"email_id": result.email_id, "committed": commit})
+    return result
+
+@dataclass
+class _AttachmentDocument:
+    """An attachment, or an attachment of an attached message, on its way to the log."""
+    attachment: ExtractedAttachment
+    # Index of the document it came with in the upload's list; None for the uploaded email
+    parent: Optional[int]
+    metadata: dict
+    skipped: Optional[str] = None
+    # Index of the first document in this upload with the same bytes
+    duplicate_of: Optional[int] = None
+    # The matter's earlier review of the same bytes
+    reviewed: Optional[ProcessingResult] = None
+    outcome: Optional[PipelineOutcome] = None
+    error: Optional[str] = None
+
+def _attachment_documents(attachments: List[ExtractedAttachment], metadata: dict) -> List[_AttachmentDocument]:
+    """
+    Flattens extracted attachments, depth first. A file attachment is dated
+    and addressed like the message it came with and titled by its filename;
+    an attached message keeps its own headers.
+    """
+    documents: List[_AttachmentDocument] = []
+    analysed = 0
+
+    def add(attachment: ExtractedAttachment, parent: Optional[int], enclosing: dict):
+        nonlocal analysed
+        if attachment.metadata:
+            document_metadata = attachment.metadata
+        else:
+            document_metadata = {key: enclosing[key] for key in ("From", "To", "Cc", "Date") if enclosing.get(key)}
+            document_metadata["Subject"] = attachment.filename
+        document = _AttachmentDocument(attachment, parent, document_metadata, skipped=attachment.skipped)
+        if not document.skipped:
+            if analysed >= ATTACHMENT_MAX_COUNT:
+                document.skipped = f"more than {ATTACHMENT_MAX_COUNT} attachments"
+            else:
+                analysed += 1
+        documents.append(document)
+        # What an attached message carries goes with the message if it is stored, else with its parent
+        inner_parent = parent if document.skipped else len(documents) - 1
+        for inner in attachment.attachments:
+            add(inner, inner_parent, document_metadata)
+
+    for attachment in attachments:
+        add(attachment, None, metadata)
+    return documents
+
+async def _reviewed_attachments(user_id: int | None, hashes: List[str]) -> dict:
+    """sha256 -> the result of the first document in the matter reviewed from that attachment."""
+    if not hashes:
+        return {}
+    # Own short session, like the cache lookup
+    async with SessionLocal() as session:
+        rows = (await session.execute(
+            select(
+                Email.id,
+                Email.attachment_sha256,
+                PrivilegeLog.is_privileged,
+                PrivilegeLog.privilege_type,
+                PrivilegeLog.log_description,
+                PrivilegeLog.reasoning,
+                PrivilegeLog.redaction_spans,
+                PrivilegeLog.token_usage,
+                PrivilegeLog.pipeline_fingerprint,
+            )
+            .join(PrivilegeLog, Email.id == PrivilegeLog.email_id)
+            .where(
+                Email.user_id == user_id,
+                Email.attachment_sha256.in_(hashes),
+                PrivilegeLog.propagated_from_email_id.is_(None),
+            )
+            .order_by(Email.id)
+        )).all()
+    reviewed = {}
+    for row in rows:
+        reviewed.setdefault(row.attachment_sha256, ProcessingResult(
+            email_id=row.id,
+            metadata={},
+            is_privileged=row.is_privileged,
+            privilege_type=row.privilege_type,
+            log_description=row.log_description,
+            reasoning=row.reasoning,
+            redacted_text=redaction_texts(row.redaction_spans),
+            token_usage=row.token_usage,
+            pipeline_fingerprint=row.pipeline_fingerprint,
+        ))
+    return reviewed
+
+async def _analyze_attachments(
+    parts: List[AttachmentPart],
+    metadata_override: dict,
+    user_id: int | None,
+    mode: Optional[str]
+) -> List[_AttachmentDocument]:
+    """
+    Extracts the attachments' text in the worker pool and runs each distinct
+    one through the pipeline. An attachment already reviewed in the matter,
+    or seen earlier in this upload, is not sent to the LLM again.
+    Nothing is written here.
+    """
+    documents = _attachment_documents(await attachment_extractor.extract(parts), metadata_override)
+    first = {}
+    for index, document in enumerate(documents):
+        if document.skipped:
+            continue
+        if document.attachment.sha256 in first:
+            document.duplicate_of = first[document.attachment.sha256]
+        else:
+            first[document.attachment.sha256] = index
+    reviewed = await _reviewed_attachments(user_id, list(first))
+    for sha256, index in first.items():
+        documents[index].reviewed = reviewed.get(sha256)
+
+    async def analyze(document: _AttachmentDocument):
+        try:
+            document.outcome = await run_pipeline(document.attachment.text, document.metadata, mode=mode)
+        except HTTPException as e:
+            document.error = str(e.detail)
+        except Exception as e:
+            print(f"Error processing attachment {document.attachment.filename}: {e}")
+            document.error = str(e)
+
+    await asyncio.gather(*(analyze(documents[index]) for index in first.values() if documents[index].reviewed is None))
+    return documents
+
+async def _save_attachments(
+    db: AsyncSession,
+    documents: List[_AttachmentDocument],
+    email_id: int,
+    user_id: int | None,
+    progress: Optional[ProgressCallback] = None
+) -> List[AttachmentResult]:
+    """
+    Inserts the analysed attachments as documents linked to their parent,
+    in the caller's transaction. Duplicates get a copy of the earlier
+    review, like near-duplicates in a bulk upload.
+    """
+    ids: List[Optional[int]] = []
+    # Per first occurrence: the result its duplicates copy
+    sources = {}
+    entries = []
+    for index, document in enumerate(documents):
+        attachment = document.attachment
+        parent = document.parent
+        while parent is not None and ids[parent] is None:
+            parent = documents[parent].parent
+        entry = AttachmentResult(
+            filename=attachment.filename,
+            content_type=attachment.content_type,
+            size=attachment.size,
+            sha256=attachment.sha256,
+            parent_email_id=email_id if parent is None else ids[parent],
+            skipped=document.skipped,
+            error=document.error,
+        )
+        source = document.reviewed if document.duplicate_of is None else sources.get(document.duplicate_of)
+        log = None
+        if document.outcome:
+            if document.outcome.cache_entry:
+                await result_cache.put(db, *document.outcome.cache_entry)
+            log = log_values(document.outcome.result, attachment.text)
+        elif source:
+            log = propagated_log_values(attachment.text, source, "duplicate_attachment", 1.0)
+            entry.duplicate_of = source.email_id
+        elif document.duplicate_of is not None:
+            entry.error = documents[document.duplicate_of].error
+
+        if log is None:
+            ids.append(None)
+        else:
+            email = email_values(attachment.text, document.metadata, user_id)
+            email.update(parent_email_id=entry.parent_email_id, attachment_sha256=attachment.sha256)
+            entry.email_id = await insert_email_with_log(db, email, log)
+            entry.is_privileged = log["is_privileged"]
+            entry.privilege_type = log["privilege_type"]
+            ids.append(entry.email_id)
+            if document.outcome:
+                document.outcome.result.email_id = entry.email_id
+                sources[index] = document.outcome.result
+            elif document.duplicate_of is None:
+                sources[index] = source
+        entries.append(entry)
+        if progress:
+            progress("attachment", entry.model_dump())
+    return entries
+
+def propagated_log_values(text: str, source: ProcessingResult, relation: str, similarity: float) -> dict:
+    """
+    Log entry for a document that was not sent to the LLM because it is a
+    near-duplicate of, or quoted in full by, an already reviewed message.
+    The source's decision is copied over and flagged for a human spot-check.
+    """
+    # Only redactions that actually occur in this copy make sense here
+    return log_values(
+        source,
+        text,
+        resolved_only=True,
+        propagated_from_email_id=source.email_id,
+        cluster_relation=relation,
+        cluster_similarity=similarity,
+        needs_spot_check=True,
+        # No LLM calls were made for this copy
+        token_usage=None,
+        decided_by="propagated",
+    )
+
+def propagated_values(
+    text: str,
+    metadata_override: dict,
+    source: ProcessingResult,
+    relation: str,
+    similarity: float,
+    user_id: int | None = None
+) -> Tuple[dict, dict]:
+    """
+    Email and log values for a cluster member that reuses the result of its
+    already reviewed representative (see propagated_log_values).
+    """
+    metadata = _merge_metadata(text, metadata_override)
+    return email_values(text, metadata, user_id), propagated_log_values(text, source, relation, similarity)
+
+def input_overrides(email_input: EmailInput) -> dict:
+    overrides = {}
+    if email_input.date: overrides["Date"] = email_input.date
+    if email_input.sender: overrides["From"] = email_input.sender
+    if email_input.recipient: overrides["To"] = email_input.recipient
+    if email_input.subject: overrides["Subject"] = email_input.subject
+    return overrides
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _progress_stream(
+    text: str,
+    metadata_override: dict,
+    user_id: int,
+    mode: Optional[str],
+    attachments: Optional[List[AttachmentPart]] = None
+) -> StreamingResponse:
+    """
+    Runs process_and_save_email in a task and relays its progress as
+    server-sent events, ending with `result` (the ProcessingResult) or
+    `error`. A comment line goes out every SSE_KEEPALIVE_SECONDS while a
+    stage is running. If the client disconnects, the analysis is cancelled.
+    """
+    async def event_stream():
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def analyze():
+            # Own session: the request's dependencies are torn down before a streaming body finishes
+            async with SessionLocal() as session:
+                return await process_and_save_email(
+                    text, metadata_override, session, user_id=user_id, mode=mode,
+                    progress=lambda event, data: queue.put_nowait((event, data)),
+                    attachments=attachments,
+                )
+
+        task = asyncio.create_task(analyze())
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None:
+                    break
+                yield _sse(*item)
+
+            try:
+                result = task.result()
+            except HTTPException as e:
+                yield _sse("error", {"status_code": e.status_code, "detail": e.detail})
+            except Exception as e:
+                print(f"Error in streamed analysis: {e}")
+                yield _sse("error", {"status_code": 500, "detail": str(e)})
+            else:
+                yield _sse("result", result.model_dump(mode="json"))
+        finally:
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: nginx would otherwise hold events back
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
+async def parse_spooled_upload(file: UploadFile) -> Tuple[str, dict, List[AttachmentPart]]:
+    """
+    Spools the upload (to disk past UPLOAD_SPOOL_MAX_BYTES) and parses it
+    from there, off the event loop.
+    """
+    spool = await spool_upload(file)
+    try:
+        with span("parse.document"):
+            return await run_in_threadpool(parse_upload, file.filename or "", spool, ATTACHMENT_MAX_BYTES)
+    finally:
+        spool.close()
+
 @router.post("/analyze", response_model=ProcessingResult)
 async def analyze_email(
     email_input: EmailInput, 
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    user_id: int = Depends(get_current_user_id)
 ):
     """
     Existing JSON endpoint.
     """
-    overrides = {}
-    if email_input.date: overrides["Date"] = email_input.date
-    if email_input.sender: overrides["From"] = email_input.sender
-    if email_input.recipient: overrides["To"] = email_input.recipient
-    if email_input.subject: overrides["Subject"] = email_input.subject
-    
-    return await process_and_save_email(email_input.text, overrides, db, user_id=current_user.id)
+    return await process_and_save_email(email_input.text, input_overrides(email_input), db, user_id=user_id, mode=email_input.mode)
 
 @router.post("/upload", response_model=ProcessingResult)
 async def upload_email(
     file: UploadFile = File(...), 
+    mode: Optional[Literal["staged", "fused"]] = None,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    user_id: int = Depends(get_current_user_id)
 ):
     """
     Upload .eml or .txt file to be processed.
+    mode selects the staged or fused pipeline (default PIPELINE_MODE).
+    Text, HTML and attached messages in an .eml's attachments are analysed
+    too, each as its own document linked to the email (see `attachments`).
     """
-    content = await file.read()
-    filename = file.filename.lower()
-    
-    text_body = ""
-    metadata = {}
-    
-    if filename.endswith(".eml"):
-        msg = email.message_from_bytes(content)
-        
-        metadata["Subject"] = msg.get("Subject", "No Subject")
-        metadata["From"] = msg.get("From", "Unknown")
-        metadata["To"] = msg.get("To", "Unknown")
-        metadata["Date"] = msg.get("Date")
-        
-        if msg.is_multipart():
-            for part in msg.walk():
-                if part.get_content_type() == "text/plain":
-                    payload = part.get_payload(decode=True)
-                    if payload:
-                        text_body = payload.decode(errors="replace")
-                        break
-            if not text_body:
-                 for part in msg.walk():
-                    if part.get_content_maintype() == 'text':
-                         payload = part.get_payload(decode=True)
-                         if payload:
-                            text_body = payload.decode(errors="replace")
-                            break
-        else:
-             payload = msg.get_payload(decode=True)
-             if payload:
-                text_body = payload.decode(errors="replace")
-                
+    text_body, metadata, attachments = await parse_spooled_upload(file)
+    return await process_and_save_email(text_body, metadata, db, user_id=user_id, mode=mode, attachments=attachments)
+
+@router.post("/analyze/stream")
+async def analyze_email_stream(
+    email_input: EmailInput,
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Same as /analyze, answered as server-sent events while the analysis runs:
+    metadata, reasoning (judge reasoning as it is generated), judge,
+    description, redactions, persisted, then result (or error).
+    """
+    return _progress_stream(email_input.text, input_overrides(email_input), user_id, email_input.mode)
+
+@router.post("/upload/stream")
+async def upload_email_stream(
+    file: UploadFile = File(...),
+    mode: Optional[Literal["staged", "fused"]] = None,
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Same as /upload, answered as server-sent events (see /analyze/stream),
+    with an `attachment` event per attachment before `persisted`.
+    """
+    text_body, metadata, attachments = await parse_spooled_upload(file)
+    return _progress_stream(text_body, metadata, user_id, mode, attachments)
+
+@router.get("/cache/stats")
+async def cache_stats(user_id: int = Depends(get_current_user_id)):
+    """
+    Hit/miss counters of the LLM result cache for this process.
+    """
+    return result_cache.stats()
+
+@router.get("/triage/stats")
+async def triage_stats(user_id: int = Depends(get_current_user_id)):
+    """
+    Local pre-classifier: documents seen, auto-decided without an LLM call, and the holdout evaluation of the current model.
+    """
+    return triage.stats()
+
+@router.post("/triage/train")
+async def retrain_triage(admin: CurrentUser = Depends(get_admin_user)):
+    """
+    Retrains the pre-classifier on the latest LLM decisions and returns its holdout evaluation.
+    The new model is only used if there was enough data. Operators only: the
+    model is trained on every user's decisions and used for all of them.
+    """
+    evaluation = await train_triage()
+    # The other API processes retrain from the same rows (multi-worker mode)
+    await broadcaster.publish("triage_retrained")
+    return evaluation
+
+@router.get("/llm/stats")
+async def llm_stats(current_user: CurrentUser = Depends(get_current_user)):
+    """
+    Current state of the LLM governor: AIMD concurrency limit, queue by priority
+    and by user, 429 counts. Only operators see other users' queues.
+    """
+    stats = governor.stats()
+    if current_user.username not in ADMIN_USERNAMES:
+        stats["users"] = {user: flow for user, flow in stats["users"].items() if user == str(current_user.id)}
+    return stats
+
+@router.post("/chains/reload")
+async def reload_chains(admin: CurrentUser = Depends(get_admin_user)):
+    """
+    Rebuild the chains from the current prompts (PROMPTS_DIR overrides).
+    Cached results from the previous prompt version stop matching; use
+    /cache/evict to delete them. Operators only: it changes the prompts for
+    every user and every API process.
+    """
+    changed = chain_registry.reload()
+    # The other API processes rebuild theirs too (multi-worker mode)
+    await broadcaster.publish("chains_reloaded")
+    return {"changed": changed, "prompt_version": chain_registry.prompt_version}
+
+@router.post("/cache/evict")
+async def evict_cache(
+    all_entries: bool = False,
+    db: AsyncSession = Depends(get_db),
+    admin: CurrentUser = Depends(get_admin_user)
+):
+    """
+    Drop cached results made with an older prompt or pipeline version, or another model.
+    Pass all_entries=true to empty the cache completely. The cache is shared
+    by all users, so only operators (ADMIN_USERNAMES) may evict.
+    """
+    if all_entries:
+        evicted = await result_cache.clear(db)
     else:
-        # Assume text file
-        text_body = content.decode(errors="replace")
-        metadata["Subject"] = filename
-    
-    return await process_and_save_email(text_body, metadata, db, user_id=current_user.id)
+        evicted = await result_cache.evict_stale(db)
+    return {"evicted": evicted, **result_cache.stats()}
 
 @router.get("/export")
 async def export_privilege_log(
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    privilege_type: Optional[str] = None,
+    user_id: int = Depends(get_current_user_id)
 ):
     """
     Generate CSV of the privilege log.
-    Async DB query.
+    Rows are streamed from a server-side cursor in chunks, so memory use and
+    time-to-first-byte do not grow with the size of the log.
+    Optional filters: date_from/date_to (inclusive, YYYY-MM-DD) and
+    privilege_type (e.g. "Attorney-Client", or "Not Privileged").
     """
-    # Async Query filtered by user
+    # Only the columns the CSV needs; loading full Email rows would drag every body along
     query = (
-        select(Email, PrivilegeLog)
+        select(
+            Email.id,
+            Email.date,
+            Email.sender,
+            Email.recipient,
+            PrivilegeLog.is_privileged,
+            PrivilegeLog.privilege_type,
+            PrivilegeLog.log_description,
+        )
         .join(PrivilegeLog, Email.id == PrivilegeLog.email_id)
-        .where(Email.user_id == current_user.id)
+        .where(Email.user_id == user_id)
+        .order_by(Email.id)
     )
-    result = await db.execute(query)
-    results = result.all()
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    writer.writerow(["DocID", "Date", "Author", "Recipient", "Privilege Type", "Description"])
-    
-    for email_row, log_row in results:
-        doc_id = f"CTRL{email_row.id:06d}"
-        date_str = email_row.date.strftime("%Y-%m-%d") if email_row.date else ""
-        
-        writer.writerow([
-            doc_id,
-            date_str,
-            email_row.sender,
-            email_row.recipient,
-            log_row.privilege_type if log_row.is_privileged else "Not Privileged",
-            log_row.log_description if log_row.log_description else ""
-        ])
-    
-    output.seek(0)
+    query = apply_log_filters(query, date_from, date_to, privilege_type)
+
+    async def csv_stream():
+        output = io.StringIO()
+        writer = csv.writer(output)
+
+        writer.writerow(["DocID", "Date", "Author", "Recipient", "Privilege Type", "Description"])
+        yield output.getvalue()
+
+        # The session lives inside the generator: the request's dependencies are
+        # torn down before a streaming body finishes.
+        async with SessionLocal() as session, span("export") as export_span:
+            exported = 0
+            result = await session.stream(query.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+            async for rows in result.partitions():
+                exported += len(rows)
+                export_span.set(rows=exported)
+                output.seek(0)
+                output.truncate()
+                for email_id, email_date, sender, recipient, is_privileged, log_privilege_type, log_description in rows:
+                    writer.writerow([
+                        control_number(email_id),
+                        email_date.strftime("%Y-%m-%d") if email_date else "",
+                        sender,
+                        recipient,
+                        log_privilege_type if is_privileged else "Not Privileged",
+                        log_description if log_description else ""
+                    ])
+                yield output.getvalue()
+
     return StreamingResponse(
-        iter([output.getvalue()]),
+        csv_stream(),
         media_type="text/csv",
         headers={"Content-Disposition": "attachment; filename=privilege_log.csv"}
     )
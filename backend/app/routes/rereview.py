@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+import json
+
+from ..database import get_db
+from ..routes.auth import get_current_user_id
+from ..rereview import run_rereview, stale_counts, REREVIEW_BATCH_SIZE, REREVIEW_CONCURRENCY
+
+router = APIRouter(prefix="/rereview", tags=["rereview"])
+
+
+@router.get("/stale")
+async def stale_entries(
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Log entries made with older prompts, model or pre-processing: how many
+    need a full rerun (the verdict may change) and how many only a new
+    description or new redactions. Includes the current pipeline fingerprint.
+    """
+    return await stale_counts(db, user_id)
+
+
+@router.post("")
+async def rereview(
+    batch_size: int = Query(REREVIEW_BATCH_SIZE, ge=1),
+    concurrency: int = Query(REREVIEW_CONCURRENCY, ge=1),
+    limit: Optional[int] = Query(None, ge=1),
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Re-review the stale entries, privileged ones first, rerunning only the
+    stages whose fingerprint changed. Progress is streamed back as
+    newline-delimited JSON, one record per committed batch. An interrupted
+    run can simply be started again; limit caps the entries taken this run.
+    """
+    concurrency = min(concurrency, REREVIEW_CONCURRENCY)
+
+    async def event_stream():
+        async for record in run_rereview(user_id, batch_size, concurrency, limit):
+            yield json.dumps(record) + "\n"
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 from datetime import datetime
 
 class EmailInput(BaseModel):
@@ -11,6 +11,9 @@ class EmailInput(BaseModel):
     recipient: Optional[str] = None
     subject: Optional[str] = None
 
+    # "staged" (judge, writer, redactor) or "fused" (one call); defaults to PIPELINE_MODE
+    mode: Optional[Literal["staged", "fused"]] = None
+
 class PrivilegeLogOutput(BaseModel):
     is_privileged: bool
     privilege_type: Optional[str] = None
@@ -21,8 +24,72 @@ class PrivilegeLogOutput(BaseModel):
     class Config:
         from_attributes = True
 
+class AttachmentResult(BaseModel):
+    filename: str
+    content_type: str
+    size: int
+    sha256: Optional[str] = None
+    email_id: Optional[int] = None # The attachment's own document, when its text was analysed
+    parent_email_id: Optional[int] = None # The email (or attached message) it came with
+    is_privileged: Optional[bool] = None
+    privilege_type: Optional[str] = None
+    duplicate_of: Optional[int] = None # Document with the same attachment whose result was reused
+    skipped: Optional[str] = None # Why no text was extracted
+    error: Optional[str] = None
+
 class ProcessingResult(PrivilegeLogOutput):
+    email_id: Optional[int] = None
     metadata: Dict[str, Any]
+    timings: Optional[Dict[str, float]] = None # Per-stage wall time in ms (judge, writer, redactor, persist, ...)
+    token_usage: Optional[Dict[str, Any]] = None # LLM calls and tokens for this document, plus pre-processing savings
+    pipeline_fingerprint: Optional[Dict[str, str]] = None # Model, pre-processing and per-chain hashes the result came from
+    attachments: Optional[List[AttachmentResult]] = None # Uploaded .eml only, in message order (nested ones after their message)
+
+class JobStatus(BaseModel):
+    job_id: int
+    status: str # queued, running, succeeded, failed
+    attempts: int
+    max_attempts: int
+    last_error: Optional[str] = None
+    email_id: Optional[int] = None
+    result: Optional[Dict[str, Any]] = None # ProcessingResult once succeeded
+    created_at: datetime
+    updated_at: datetime
+
+class LogEntry(BaseModel):
+    email_id: int
+    date: Optional[datetime] = None
+    sender: Optional[str] = None
+    recipient: Optional[str] = None
+    subject: Optional[str] = None
+    is_privileged: bool
+    privilege_type: Optional[str] = None
+    log_description: Optional[str] = None
+    decided_by: Optional[str] = None # llm, cache, triage, propagated
+    propagated_from_email_id: Optional[int] = None
+    needs_spot_check: bool = False
+    snippet: Optional[str] = None # Matching text around the search terms, only for ?q= searches
+
+class LogPage(BaseModel):
+    items: List[LogEntry]
+    next_cursor: Optional[str] = None # Pass as ?cursor= for the next page; None on the last page
+
+class RedactionSpan(BaseModel):
+    text: str # The passage as the model returned it
+    start: Optional[int] = None # Character offsets into the body; None if the passage was not found in it
+    end: Optional[int] = None
+
+class LogDetail(LogEntry):
+    reasoning: Optional[str] = None
+    redacted_text: Optional[List[str]] = None
+    redaction_spans: Optional[List[RedactionSpan]] = None
+    cluster_relation: Optional[str] = None
+    cluster_similarity: Optional[float] = None
+    token_usage: Optional[Dict[str, Any]] = None
+    pipeline_fingerprint: Optional[Dict[str, str]] = None
+    parent_email_id: Optional[int] = None
+    attachment_email_ids: List[int] = []
+    body: Optional[str] = None
 
 class UserCreate(BaseModel):
     username: str
@@ -39,3 +106,10 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     username: Optional[str] = None
+
+class RedactedDocument(BaseModel):
+    email_id: int
+    control_number: str # CTRL000123, as in the privilege log export
+    text: str # Body with every resolved span replaced by the marker
+    redactions: int # Passages replaced (overlapping spans count once)
+    unresolved: List[str] = [] # Passages the model flagged that are not in the body; review by hand
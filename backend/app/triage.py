@@ -0,0 +1,283 @@
+import asyncio
+import math
+import os
+import random
+import re
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from email.utils import getaddresses
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, or_, select
+
+from .database import SessionLocal
+from .models import Email, PrivilegeLog
+
+TRIAGE_ENABLED = os.getenv("TRIAGE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Auto-decide "not privileged" only below this model probability of privilege
+TRIAGE_NEGATIVE_THRESHOLD = float(os.getenv("TRIAGE_NEGATIVE_THRESHOLD", "0.05"))
+# The model is not used until it has seen this many LLM decisions (and some positives)
+TRIAGE_MIN_TRAINING = int(os.getenv("TRIAGE_MIN_TRAINING", "200"))
+TRIAGE_MIN_POSITIVES = int(os.getenv("TRIAGE_MIN_POSITIVES", "20"))
+TRIAGE_TRAINING_LIMIT = int(os.getenv("TRIAGE_TRAINING_LIMIT", "20000"))
+TRIAGE_TRAIN_ON_STARTUP = os.getenv("TRIAGE_TRAIN_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+# Comma-separated; any party at these domains/addresses always goes to the LLM
+ATTORNEY_DOMAINS = {d.strip().lower() for d in os.getenv("ATTORNEY_DOMAINS", "").split(",") if d.strip()}
+ATTORNEY_ADDRESSES = {a.strip().lower() for a in os.getenv("ATTORNEY_ADDRESSES", "").split(",") if a.strip()}
+
+# Only the start of a body is looked at; enough to classify, cheap on huge forwards
+TRIAGE_MAX_CHARS = 20000
+VOCABULARY_SIZE = 5000
+HOLDOUT_SHARE = 0.2
+
+_TOKEN = re.compile(r"[a-z][a-z0-9']{2,}")
+# Address or domain parts that suggest a lawyer is a party
+_LEGAL_PARTY = re.compile(r"law|legal|llp|attorney|counsel|lawyer|esq", re.IGNORECASE)
+# Body/subject terms that always warrant an LLM look
+_LEGAL_TERMS = re.compile(
+    r"\b(privileged|attorney|counsel|legal advice|litigation|lawsuit|subpoena|settlement|"
+    r"work product|in anticipation of|deposition|esq\.?)\b",
+    re.IGNORECASE,
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text[:TRIAGE_MAX_CHARS].lower())
+
+
+def _addresses(*fields: Optional[str]) -> List[str]:
+    return [address.lower() for _, address in getaddresses([f or "" for f in fields]) if address]
+
+
+def join_recipients(to: Optional[str], cc: Optional[str]) -> str:
+    """The recipients legal_signals sees: To and Cc, the same at training and at assessment time."""
+    return ", ".join(v for v in (to, cc) if v)
+
+
+def legal_signals(sender: str, recipients: str, subject: str, body: str) -> List[str]:
+    """Reasons a document must not be auto-decided; empty if there are none."""
+    signals = []
+    for address in _addresses(sender, recipients):
+        domain = address.rsplit("@", 1)[-1]
+        if address in ATTORNEY_ADDRESSES or domain in ATTORNEY_DOMAINS:
+            signals.append(f"attorney party {address}")
+        elif _LEGAL_PARTY.search(address):
+            signals.append(f"legal-looking address {address}")
+    match = _LEGAL_TERMS.search(subject or "") or _LEGAL_TERMS.search(body[:TRIAGE_MAX_CHARS])
+    if match:
+        signals.append(f"legal term '{match.group(0)}'")
+    return signals
+
+
+class TfidfVectorizer:
+    """Sublinear TF-IDF over the most frequent terms, L2-normalised sparse vectors."""
+
+    def __init__(self, vocabulary_size: int = VOCABULARY_SIZE):
+        self.vocabulary_size = vocabulary_size
+        self.vocabulary: Dict[str, int] = {}
+        self.idf: List[float] = []
+
+    def fit(self, documents: Sequence[List[str]]) -> "TfidfVectorizer":
+        document_frequency = Counter()
+        for tokens in documents:
+            document_frequency.update(set(tokens))
+        terms = [term for term, _ in document_frequency.most_common(self.vocabulary_size)]
+        self.vocabulary = {term: i for i, term in enumerate(terms)}
+        count = len(documents)
+        self.idf = [math.log((count + 1) / (document_frequency[term] + 1)) + 1 for term in terms]
+        return self
+
+    def transform(self, tokens: List[str]) -> Dict[int, float]:
+        vector = {}
+        for term, tf in Counter(tokens).items():
+            index = self.vocabulary.get(term)
+            if index is not None:
+                vector[index] = (1 + math.log(tf)) * self.idf[index]
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        if norm:
+            vector = {i: v / norm for i, v in vector.items()}
+        return vector
+
+
+class LogisticRegression:
+    """Binary logistic regression on sparse vectors, trained with SGD; classes are balanced."""
+
+    def __init__(self, features: int, epochs: int = 15, learning_rate: float = 0.5, l2: float = 1e-4, seed: int = 13):
+        self.weights = [0.0] * features
+        self.bias = 0.0
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.seed = seed
+
+    def predict_proba(self, x: Dict[int, float]) -> float:
+        z = self.bias + sum(self.weights[i] * v for i, v in x.items())
+        if z < -30:
+            return 0.0
+        return 1.0 / (1.0 + math.exp(-z))
+
+    def fit(self, X: List[Dict[int, float]], y: List[int]) -> "LogisticRegression":
+        positives = sum(y) or 1
+        negatives = (len(y) - sum(y)) or 1
+        class_weight = {1: len(y) / (2 * positives), 0: len(y) / (2 * negatives)}
+        order = list(range(len(X)))
+        rng = random.Random(self.seed)
+        for epoch in range(self.epochs):
+            rng.shuffle(order)
+            rate = self.learning_rate / (1 + epoch)
+            for n in order:
+                x, label = X[n], y[n]
+                gradient = (self.predict_proba(x) - label) * class_weight[label]
+                for i, v in x.items():
+                    self.weights[i] -= rate * (gradient * v + self.l2 * self.weights[i])
+                self.bias -= rate * gradient
+        return self
+
+
+def _score(vectorizer: TfidfVectorizer, model: LogisticRegression, subject: str, body: str) -> float:
+    return model.predict_proba(vectorizer.transform(tokenize(f"{subject}\n{body}")))
+
+
+@dataclass
+class TriageDecision:
+    auto_negative: bool
+    score: Optional[float]  # model probability of privilege, None without a model
+    signals: List[str]
+
+
+def _in_holdout(key: str) -> bool:
+    return zlib.crc32(key.encode("utf-8")) % 100 < HOLDOUT_SHARE * 100
+
+
+class Triage:
+    """
+    Local pre-classifier run before the judge chain.
+
+    Documents with any attorney party or legal term always go to the LLM.
+    For the rest, a TF-IDF + logistic regression model trained on earlier LLM
+    decisions estimates the probability of privilege; below
+    TRIAGE_NEGATIVE_THRESHOLD the document is recorded as not privileged
+    without an LLM call. Until enough decisions exist to train on, nothing is
+    auto-decided.
+    """
+
+    def __init__(self, enabled: bool = TRIAGE_ENABLED, threshold: float = TRIAGE_NEGATIVE_THRESHOLD):
+        self.enabled = enabled
+        self.threshold = threshold
+        # Swapped as one tuple so a concurrent assess() never mixes two trainings
+        self.classifier: Optional[Tuple[TfidfVectorizer, LogisticRegression]] = None
+        self.evaluation: Dict[str, object] = {}
+        self.trained_at: Optional[float] = None
+        self.seen = 0
+        self.auto_decided = 0
+        self.gated = 0  # sent to the LLM because of a legal signal
+
+    def assess(self, sender: str, recipients: str, subject: str, body: str) -> TriageDecision:
+        if not self.enabled:
+            return TriageDecision(False, None, [])
+        self.seen += 1
+        signals = legal_signals(sender, recipients, subject, body)
+        if signals:
+            self.gated += 1
+            return TriageDecision(False, None, signals)
+        classifier = self.classifier
+        if classifier is None:
+            return TriageDecision(False, None, [])
+        vectorizer, model = classifier
+        score = _score(vectorizer, model, subject, body)
+        auto_negative = score < self.threshold
+        if auto_negative:
+            self.auto_decided += 1
+        return TriageDecision(auto_negative, score, [])
+
+    def fit(self, rows: Sequence[Tuple[str, str, str, str, bool]]) -> Dict[str, object]:
+        """
+        Trains on (sender, recipients, subject, body, is_privileged) rows and
+        evaluates on a deterministic holdout. Installs the model only if there
+        is enough data. Returns the evaluation.
+        """
+        train, holdout = [], []
+        for row in rows:
+            (holdout if _in_holdout(f"{row[0]}|{row[2]}|{row[3][:200]}") else train).append(row)
+        positives = sum(1 for row in train if row[4])
+        evaluation: Dict[str, object] = {"training_rows": len(train), "training_positives": positives, "holdout_rows": len(holdout)}
+        if len(train) < TRIAGE_MIN_TRAINING or positives < TRIAGE_MIN_POSITIVES:
+            evaluation["status"] = "insufficient_data"
+            self.evaluation = evaluation
+            return evaluation
+
+        token_lists = [tokenize(f"{r[2]}\n{r[3]}") for r in train]
+        vectorizer = TfidfVectorizer().fit(token_lists)
+        X = [vectorizer.transform(tokens) for tokens in token_lists]
+        model = LogisticRegression(len(vectorizer.vocabulary)).fit(X, [int(r[4]) for r in train])
+
+        # Holdout: what the full triage (gates + model) would have done
+        auto_negative = missed_privileged = privileged = 0
+        for sender, recipients, subject, body, is_privileged in holdout:
+            privileged += is_privileged
+            if legal_signals(sender, recipients, subject, body):
+                continue
+            if _score(vectorizer, model, subject, body) < self.threshold:
+                auto_negative += 1
+                missed_privileged += is_privileged
+
+        evaluation.update({
+            "status": "trained",
+            "threshold": self.threshold,
+            # Of the documents triage would auto-decide, the share that really were not privileged
+            "negative_precision": round(1 - missed_privileged / auto_negative, 4) if auto_negative else None,
+            # Of the privileged documents, the share still sent to the LLM
+            "privileged_recall": round(1 - missed_privileged / privileged, 4) if privileged else None,
+            "holdout_llm_call_reduction": round(auto_negative / len(holdout), 4) if holdout else None,
+        })
+        self.classifier = (vectorizer, model)
+        self.evaluation = evaluation
+        self.trained_at = time.time()
+        return evaluation
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "model_ready": self.classifier is not None,
+            "threshold": self.threshold,
+            "seen": self.seen,
+            "auto_decided": self.auto_decided,
+            "sent_for_legal_signal": self.gated,
+            "llm_call_reduction": (self.auto_decided / self.seen) if self.seen else 0.0,
+            "trained_at": self.trained_at,
+            "evaluation": self.evaluation,
+        }
+
+
+async def load_training_rows(limit: int = TRIAGE_TRAINING_LIMIT) -> List[Tuple[str, str, str, str, bool]]:
+    """
+    Latest LLM decisions; triage, cache and propagated results are left out
+    so the model never learns from itself.
+
+    The rows come from every user: there is one model per deployment, since
+    a single matter rarely has enough decisions to train on. The model only
+    ever answers "not privileged" for a document and never returns what it
+    was trained on, and retraining is limited to operators.
+    """
+    stmt = (
+        select(Email.sender, Email.recipient, Email.cc, Email.subject, func.left(Email.body, TRIAGE_MAX_CHARS), PrivilegeLog.is_privileged)
+        .join(PrivilegeLog, PrivilegeLog.email_id == Email.id)
+        .where(PrivilegeLog.propagated_from_email_id.is_(None))
+        .where(or_(PrivilegeLog.decided_by.is_(None), PrivilegeLog.decided_by == "llm"))
+        .order_by(PrivilegeLog.id.desc())
+        .limit(limit)
+    )
+    async with SessionLocal() as db:
+        result = await db.execute(stmt)
+        return [(s or "", join_recipients(to, cc), subj or "", body or "", bool(p)) for s, to, cc, subj, body, p in result.all()]
+
+
+triage = Triage()
+
+
+async def train_triage() -> Dict[str, object]:
+    """Retrains the module-level triage model from the database (fitting runs in a thread)."""
+    rows = await load_training_rows()
+    return await asyncio.to_thread(triage.fit, rows)
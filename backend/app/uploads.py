@@ -0,0 +1,148 @@
+import asyncio
+import email
+import hashlib
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from .parsing import AttachmentPart, MAX_ATTACHMENT_BYTES, decode_text, html_to_text, parse_message
+
+# Uploads up to this size stay in memory while being copied, larger ones go to disk
+UPLOAD_SPOOL_MAX_BYTES = int(os.getenv("UPLOAD_SPOOL_MAX_BYTES", str(16 * 1024 * 1024)))
+# Processes turning attachments into text; 0 does it in a thread of the API process
+ATTACHMENT_WORKERS = int(os.getenv("ATTACHMENT_WORKERS", "2"))
+# Larger attachments are listed as skipped without being decoded
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(MAX_ATTACHMENT_BYTES)))
+# Attachments analysed per upload, those of attached messages included; the rest are skipped
+ATTACHMENT_MAX_COUNT = int(os.getenv("ATTACHMENT_MAX_COUNT", "50"))
+# Messages attached to attached messages are opened this many levels deep
+ATTACHMENT_MAX_DEPTH = 3
+
+_TEXT_EXTENSIONS = (".txt", ".csv", ".md", ".log", ".json", ".xml")
+_HTML_EXTENSIONS = (".html", ".htm")
+
+
+async def spool_upload(file: UploadFile) -> tempfile.SpooledTemporaryFile:
+    """
+    Copies an upload into a temporary file that moves to disk past
+    UPLOAD_SPOOL_MAX_BYTES, rewound for reading. The caller closes it.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_BYTES)
+    await run_in_threadpool(shutil.copyfileobj, file.file, spool)
+    spool.seek(0)
+    return spool
+
+
+@dataclass
+class ExtractedAttachment:
+    filename: str
+    content_type: str
+    size: int
+    # Of the attachment's bytes; identical files attached to different emails share it
+    sha256: Optional[str]
+    text: Optional[str] = None
+    # Headers of an attached message
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    # The attachments of an attached message
+    attachments: List["ExtractedAttachment"] = field(default_factory=list)
+    # Why no text was extracted
+    skipped: Optional[str] = None
+
+
+def extract_attachment(part: AttachmentPart, depth: int = 1, max_bytes: int = ATTACHMENT_MAX_BYTES) -> ExtractedAttachment:
+    """
+    Text of one attachment: text files are decoded, HTML is reduced to its
+    visible text, and attached messages (message/rfc822 or .eml) are parsed
+    like an uploaded .eml, their own attachments included. Other types are
+    listed as skipped. Runs in the worker pool.
+    """
+    if part.skipped:
+        return ExtractedAttachment(part.filename, part.content_type, 0, None, skipped=part.skipped)
+    extracted = ExtractedAttachment(part.filename, part.content_type, len(part.payload), hashlib.sha256(part.payload).hexdigest())
+    name = part.filename.lower()
+    if part.content_type == "message/rfc822" or name.endswith(".eml"):
+        extracted.text, extracted.metadata, inner = parse_message(email.message_from_bytes(part.payload), max_bytes)
+        if depth < ATTACHMENT_MAX_DEPTH:
+            extracted.attachments = [extract_attachment(inner_part, depth + 1, max_bytes) for inner_part in inner]
+        else:
+            extracted.attachments = [
+                ExtractedAttachment(inner_part.filename, inner_part.content_type, len(inner_part.payload), None,
+                                    skipped=f"nested more than {ATTACHMENT_MAX_DEPTH} messages deep")
+                for inner_part in inner
+            ]
+    elif part.content_type == "text/html" or name.endswith(_HTML_EXTENSIONS):
+        extracted.text = html_to_text(decode_text(part.payload, part.charset))
+    elif part.content_type.startswith("text/") or name.endswith(_TEXT_EXTENSIONS):
+        extracted.text = decode_text(part.payload, part.charset)
+    else:
+        extracted.skipped = f"no text extraction for {part.content_type}"
+    if extracted.text is not None and not extracted.text.strip():
+        extracted.text = None
+        extracted.skipped = "no text"
+    return extracted
+
+
+def _extract_or_error(part: AttachmentPart):
+    try:
+        return extract_attachment(part)
+    except Exception as e:
+        return e
+
+
+class AttachmentExtractor:
+    """
+    Turns attachments into text in a pool of worker processes. Decoding and
+    HTML stripping are CPU work: in the pool they run in parallel, and a
+    large attachment does not stall the event loop. The processes are
+    started on first use.
+    """
+
+    def __init__(self, workers: int = ATTACHMENT_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that runs an event loop and threads is not safe
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def extract(self, parts: List[AttachmentPart]) -> List[ExtractedAttachment]:
+        if not parts:
+            return []
+        if self.workers > 0:
+            loop = asyncio.get_running_loop()
+            pool = self._pool()
+            outcomes = await asyncio.gather(
+                *(loop.run_in_executor(pool, extract_attachment, part) for part in parts), return_exceptions=True
+            )
+        else:
+            outcomes = await asyncio.to_thread(lambda: [_extract_or_error(part) for part in parts])
+        results = []
+        for part, outcome in zip(parts, outcomes):
+            if isinstance(outcome, BrokenProcessPool):
+                # A worker died (e.g. out of memory): the next upload gets a fresh pool
+                self.shutdown()
+            if isinstance(outcome, Exception):
+                # A malformed attachment (or a crashed worker) costs that attachment, not the upload
+                print(f"Error extracting attachment {part.filename}: {outcome}")
+                outcome = ExtractedAttachment(part.filename, part.content_type, len(part.payload), None,
+                                              skipped=f"extraction failed: {outcome}")
+            results.append(outcome)
+        return results
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+attachment_extractor = AttachmentExtractor()
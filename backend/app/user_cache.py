@@ -0,0 +1,130 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from .coordination import broadcaster
+from .models import User
+
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "1024"))
+
+# Session.info key of the usernames changed in the session's transaction
+_CHANGED_USERS = "user_cache_changed"
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """
+    What request handlers need from the authenticated user. Deliberately not
+    the ORM object: it is shared between requests and outlives any session,
+    and the password hash has no business sitting in a cache.
+    """
+    id: int
+    username: str
+    email: str
+
+    @classmethod
+    def from_model(cls, user: User) -> "CurrentUser":
+        return cls(id=user.id, username=user.username, email=user.email)
+
+
+class UserCache:
+    """
+    In-process LRU cache of authenticated users keyed on username, with a TTL
+    so changes made outside the app are picked up within USER_CACHE_TTL_SECONDS.
+    Changes made through the ORM invalidate immediately, in every process in
+    multi-worker mode (see below).
+    """
+
+    def __init__(self, ttl: float = USER_CACHE_TTL_SECONDS, max_size: int = USER_CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple[float, CurrentUser]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.invalidations = 0
+        # Requests authenticated from the token's uid claim alone
+        self.token_only = 0
+
+    def get(self, username: str) -> Optional[CurrentUser]:
+        entry = self._entries.get(username)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, user = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[username]
+            self.expired += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(username)
+        self.hits += 1
+        return user
+
+    def put(self, user: CurrentUser) -> None:
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+        self._entries[user.username] = (time.monotonic() + self.ttl, user)
+        self._entries.move_to_end(user.username)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+
+    def invalidate(self, username: str) -> None:
+        if self._entries.pop(username, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "invalidations": self.invalidations,
+            "token_only": self.token_only,
+            # Every hit and every uid-claim request is a users SELECT not run
+            "queries_avoided": self.hits + self.token_only,
+        }
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user(mapper, connection, target: User) -> None:
+    # A rename leaves the old name cached too
+    names = {target.username, *(inspect(target).attrs.username.history.deleted or ())}
+    for name in names:
+        user_cache.invalidate(name)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_CHANGED_USERS, set()).update(names)
+
+
+@event.listens_for(Session, "after_commit")
+def _broadcast_invalidations(session: Session) -> None:
+    # Only once committed: another process reloading the user earlier would cache the old row
+    for name in session.info.pop(_CHANGED_USERS, ()):
+        user_cache.invalidate(name)
+        broadcaster.publish_soon("user_invalidated", username=name)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_invalidations(session: Session) -> None:
+    session.info.pop(_CHANGED_USERS, None)
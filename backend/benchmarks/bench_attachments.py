@@ -0,0 +1,132 @@
+"""
+Benchmark: parsing an uploaded .eml with large attachments, and extracting
+their text.
+
+Builds a message with --attachments text and HTML attachments of --size
+bytes each, then measures:
+
+- parse: the old path (the whole upload read into bytes, then parsed)
+  against the spooled one (copied to a temporary file, parsed from it in
+  chunks), as wall time and peak Python memory (tracemalloc)
+- extract: attachment text extraction inline against the process pool, for
+  each --workers count
+
+No database or LLM is needed.
+
+    cd backend
+    python -m benchmarks.bench_attachments --attachments 8 --size 4000000 --workers 0 2 4
+"""
+import argparse
+import asyncio
+import email
+import io
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from email.message import EmailMessage
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+WORDS = (
+    "shipment budget quarterly vendor contract review office move schedule invoice meeting "
+    "counsel advised settlement claim indemnification draft agreement strategy exposure"
+).split()
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--attachments", type=int, default=8, help="attachments in the message, half of them HTML")
+    parser.add_argument("--size", type=int, default=2_000_000, help="bytes per attachment")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4], help="pool sizes; 0 extracts inline")
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args(argv)
+
+
+def make_message(rng: random.Random, attachments: int, size: int) -> bytes:
+    msg = EmailMessage()
+    msg["Subject"] = "Quarterly package"
+    msg["From"] = "ceo@corp.com"
+    msg["To"] = "board@corp.com"
+    msg.set_content("The quarterly package is attached.")
+    for index in range(attachments):
+        words = []
+        length = 0
+        while length < size:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        text = " ".join(words)
+        if index % 2:
+            html = "".join(f"<p>{text[i:i + 400]}</p>\n" for i in range(0, len(text), 400))
+            msg.add_attachment(html.encode(), maintype="text", subtype="html", filename=f"page-{index}.html")
+        else:
+            msg.add_attachment(text.encode(), maintype="text", subtype="plain", filename=f"notes-{index}.txt")
+    return msg.as_bytes()
+
+
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    value = fn()
+    elapsed = (time.perf_counter() - started) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, elapsed, peak / 1e6
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.path.insert(0, str(BACKEND_DIR))
+    from app.parsing import parse_eml_file, parse_message
+    from app.uploads import AttachmentExtractor
+
+    raw = make_message(random.Random(7), args.attachments, args.size)
+    with tempfile.NamedTemporaryFile(suffix=".eml") as upload:
+        upload.write(raw)
+        upload.flush()
+        del raw
+        print(f"message: {Path(upload.name).stat().st_size / 1e6:.1f} MB, {args.attachments} attachments\n")
+
+        def read_whole():
+            with open(upload.name, "rb") as f:
+                content = f.read()
+            return parse_message(email.message_from_bytes(content))
+
+        def spooled():
+            with open(upload.name, "rb") as f, tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024) as spool:
+                while chunk := f.read(1024 * 1024):
+                    spool.write(chunk)
+                spool.seek(0)
+                return parse_eml_file(spool)
+
+        print(f"{'parse':>10} {'ms':>8} {'peak MB':>8}")
+        for label, fn in (("read()", read_whole), ("spooled", spooled)):
+            samples = [measure(fn) for _ in range(args.repeat)]
+            parts = samples[0][0][2]
+            print(f"{label:>10} {min(s[1] for s in samples):>8.1f} {max(s[2] for s in samples):>8.1f}")
+
+    async def extract(workers: int):
+        extractor = AttachmentExtractor(workers)
+        try:
+            if workers:
+                await extractor.extract(parts[:1])  # start the processes outside the timing
+            samples = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                results = await extractor.extract(parts)
+                samples.append((time.perf_counter() - started) * 1000)
+            return min(samples), sum(len(r.text or "") for r in results)
+        finally:
+            extractor.shutdown()
+
+    print(f"\n{'workers':>10} {'ms':>8} {'chars':>10}")
+    for workers in args.workers:
+        elapsed, chars = asyncio.run(extract(workers))
+        print(f"{workers:>10} {elapsed:>8.1f} {chars:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Microbenchmark: per-request cost of building the judge/writer/redactor chains
+versus reusing the ones held by the chain registry.
+
+Runs offline against the fake LLM (zero latency), so the numbers are pure
+framework overhead.
+
+    cd backend
+    python -m benchmarks.bench_chains --iterations 2000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("LLM_PROVIDER", "fake")
+# Keep the governor's quota out of the measurement
+os.environ.setdefault("LLM_RPM", "1e9")
+os.environ.setdefault("LLM_TPM", "1e12")
+
+from app.chains import CHAIN_SPECS, DEFAULT_PROMPTS, build_chain, chain_registry  # noqa: E402
+
+SAMPLE = {
+    "sender": "alex.attorney@lawfirm.com",
+    "recipient": "sarah.generalcounsel@corp.com",
+    "subject": "Strategy for Smith v. Jones Litigation",
+    "reasoning": "Communication from counsel providing legal advice.",
+    "body": "I advise that we do not admit to any liability. " * 20,
+}
+
+
+def build_all():
+    return {
+        name: build_chain(schema, DEFAULT_PROMPTS[system_key], DEFAULT_PROMPTS[user_key])
+        for name, (schema, system_key, user_key) in CHAIN_SPECS.items()
+    }
+
+
+def time_per_call(fn, iterations: int) -> list:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return samples
+
+
+async def time_requests(get_chains, iterations: int) -> list:
+    """One simulated privileged request: three chain lookups/builds plus three invocations."""
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        chains = get_chains()
+        await chains["judge"].ainvoke(SAMPLE)
+        await chains["writer"].ainvoke(SAMPLE)
+        await chains["redactor"].ainvoke(SAMPLE)
+        samples.append((time.perf_counter() - started) * 1e6)
+    return samples
+
+
+def report(label: str, samples: list) -> float:
+    median = statistics.median(samples)
+    p95 = sorted(samples)[int(len(samples) * 0.95) - 1]
+    print(f"{label:<38} median {median:>9.1f} us   p95 {p95:>9.1f} us")
+    return median
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    chain_registry.build()
+    registry_chains = lambda: {name: chain_registry.get(name) for name in CHAIN_SPECS}
+
+    print(f"{args.iterations} iterations, fake LLM\n")
+    build = report("construct 3 chains (per request)", time_per_call(build_all, args.iterations))
+    lookup = report("registry lookup of 3 chains", time_per_call(registry_chains, args.iterations))
+
+    rebuilt = report("request, chains rebuilt", asyncio.run(time_requests(build_all, args.iterations)))
+    reused = report("request, chains from registry", asyncio.run(time_requests(registry_chains, args.iterations)))
+
+    print(f"\nConstruction overhead saved per request: {build - lookup:.1f} us")
+    print(f"End-to-end (fake LLM) speedup: {rebuilt / reused:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark: LLM governor admission under a mix of users.
+
+Drives the governor directly with simulated calls (--latency-ms each, at
+--concurrency slots; no database, model or API key needed) in three
+scenarios:
+
+- flood: one user keeps --flood interactive calls outstanding (a script
+  hammering /analyze, large .eml uploads), while another user sends one
+  interactive call every --interval-ms. Reports the second user's wait for a
+  slot.
+- bulk: one user's --flood document bulk job is running when a second user
+  starts a --small document job. Reports when the small job finishes.
+- cap: the flood scenario with the flooding user capped at --cap calls.
+
+Each runs with per-user fair queuing and with every call in one queue,
+which is how the governor admitted calls before (FIFO within a priority).
+
+    cd backend
+    python -m benchmarks.bench_fairness --flood 200 --concurrency 8 --latency-ms 50
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--flood", type=int, default=200, help="calls the heavy user keeps queued")
+    parser.add_argument("--small", type=int, default=50, help="documents in the second user's bulk job")
+    parser.add_argument("--probes", type=int, default=40, help="interactive calls of the light user")
+    parser.add_argument("--interval-ms", type=float, default=100.0, help="gap between the light user's calls")
+    parser.add_argument("--concurrency", type=int, default=8, help="governor slots")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="simulated LLM latency per call")
+    parser.add_argument("--cap", type=int, default=4, help="concurrency cap of the heavy user in the cap scenario")
+    return parser.parse_args(argv)
+
+
+def percentile(values, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def call(governor, args, rng, priority, user, fair):
+    """One simulated LLM call; returns the seconds spent waiting for a slot."""
+    queued = time.monotonic()
+    async with governor.slot(100, priority=priority, user=user if fair else None):
+        waited = time.monotonic() - queued
+        await asyncio.sleep(args.latency_ms / 1000 * rng.uniform(0.8, 1.2))
+    return waited
+
+
+def make_governor(args, fair: bool, cap: int = 0):
+    from app.governor import LLMGovernor
+
+    return LLMGovernor(
+        rpm=1e9, tpm=1e12, max_concurrency=args.concurrency, min_concurrency=args.concurrency,
+        user_weights={}, user_max_concurrency=0, user_concurrency={"1": cap} if cap and fair else {},
+        user_tpm=0, user_tpm_overrides={},
+    )
+
+
+async def flood(args, fair: bool, cap: int = 0):
+    from app.governor import PRIORITY_INTERACTIVE
+
+    governor = make_governor(args, fair, cap)
+    rng = random.Random(7)
+
+    async def heavy_caller():
+        while True:
+            await call(governor, args, rng, PRIORITY_INTERACTIVE, 1, fair)
+
+    heavy = [asyncio.create_task(heavy_caller()) for _ in range(args.flood)]
+    await asyncio.sleep(args.latency_ms / 1000 * 5)
+    waits = []
+    for _ in range(args.probes):
+        waits.append(await call(governor, args, rng, PRIORITY_INTERACTIVE, 2, fair))
+        await asyncio.sleep(args.interval_ms / 1000)
+    for task in heavy:
+        task.cancel()
+    await asyncio.gather(*heavy, return_exceptions=True)
+    return [w * 1000 for w in waits]
+
+
+async def bulk(args, fair: bool):
+    from app.governor import PRIORITY_BULK
+
+    governor = make_governor(args, fair)
+    rng = random.Random(7)
+    started = time.monotonic()
+    heavy = [asyncio.create_task(call(governor, args, rng, PRIORITY_BULK, 1, fair)) for _ in range(args.flood)]
+    await asyncio.sleep(args.latency_ms / 1000 * 5)
+    small_started = time.monotonic()
+    await asyncio.gather(*(call(governor, args, rng, PRIORITY_BULK, 2, fair) for _ in range(args.small)))
+    small_seconds = time.monotonic() - small_started
+    await asyncio.gather(*heavy)
+    return small_seconds, time.monotonic() - started
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    print(f"{args.concurrency} slots, {args.latency_ms:.0f} ms per call\n")
+    print(f"Light user's interactive calls while the heavy user keeps {args.flood} queued (wait for a slot, ms)")
+    print(f"{'scheduler':>24} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for label, fair, cap in (("one queue (before)", False, 0), ("per-user fair", True, 0),
+                             (f"fair, heavy capped at {args.cap}", True, args.cap)):
+        waits = asyncio.run(flood(args, fair, cap))
+        print(f"{label:>24} {statistics.median(waits):>8.1f} {percentile(waits, 95):>8.1f} "
+              f"{percentile(waits, 99):>8.1f} {max(waits):>8.1f}")
+
+    print(f"\nSecond user's {args.small}-document bulk job during the heavy user's {args.flood} (seconds)")
+    print(f"{'scheduler':>24} {'small job':>10} {'both':>8}")
+    for label, fair in (("one queue (before)", False), ("per-user fair", True)):
+        small_seconds, total = asyncio.run(bulk(args, fair))
+        print(f"{label:>24} {small_seconds:>10.2f} {total:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark: staged (judge -> writer + redactor) versus fused (one call) pipeline.
+
+Runs every document in test_examples/ through both modes, without the
+database or the result cache, and compares latency, LLM calls, input tokens
+and how often the two modes agree.
+
+Uses the fake LLM by default (set --latency-ms to something realistic);
+run with LLM_PROVIDER=google and GOOGLE_API_KEY set to measure the real model,
+where the agreement rate is the number that matters.
+
+    cd backend
+    python -m benchmarks.bench_fused --latency-ms 800 --repeat 3
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from pathlib import Path
+
+EXAMPLES_DIR = Path(__file__).resolve().parent.parent.parent / "test_examples"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=500.0, help="fake LLM latency per call")
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the corpus")
+    return parser.parse_args()
+
+
+def jaccard(a, b) -> float:
+    a, b = set(a or []), set(b or [])
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+async def run_mode(mode: str, text: str) -> dict:
+    from app.governor import llm_usage
+    from app.parsing import extract_metadata
+    from app.preprocessing import prepare_body
+    from app.routes.processing import _run_chains, _run_fused
+
+    metadata = extract_metadata(text)
+    prepared = prepare_body(text)
+    args = (prepared, metadata.get("From", "Unknown"), metadata.get("To", "Unknown"), metadata.get("Subject", "No Subject"), {})
+    usage = {"calls": 0, "input_tokens": 0}
+    token = llm_usage.set(usage)
+    started = time.perf_counter()
+    try:
+        verdict = None
+        if mode == "fused":
+            verdict = await _run_fused(*args)
+        fallback = mode == "fused" and verdict is None
+        if verdict is None:
+            verdict = await _run_chains(*args)
+    finally:
+        llm_usage.reset(token)
+    is_privileged, privilege_type, _, description, items, _ = verdict
+    return {
+        "latency_ms": (time.perf_counter() - started) * 1000,
+        "calls": usage["calls"],
+        "input_tokens": usage["input_tokens"],
+        "fallback": fallback,
+        "is_privileged": is_privileged,
+        "privilege_type": privilege_type,
+        "description": description,
+        "items": items,
+    }
+
+
+async def main_async(args):
+    from app.chains import chain_registry
+
+    chain_registry.build()
+    documents = [(path.name, path.read_text()) for path in sorted(EXAMPLES_DIR.glob("*.txt"))]
+    results = {"staged": [], "fused": []}
+    agreement = {"is_privileged": 0, "privilege_type": 0, "redactions": []}
+    pairs = 0
+
+    for _ in range(args.repeat):
+        for name, text in documents:
+            staged, fused = await asyncio.gather(run_mode("staged", text), run_mode("fused", text))
+            results["staged"].append(staged)
+            results["fused"].append(fused)
+            pairs += 1
+            agreement["is_privileged"] += staged["is_privileged"] == fused["is_privileged"]
+            agreement["privilege_type"] += staged["privilege_type"] == fused["privilege_type"]
+            if staged["is_privileged"] and fused["is_privileged"]:
+                agreement["redactions"].append(jaccard(staged["items"], fused["items"]))
+            if staged["is_privileged"] != fused["is_privileged"]:
+                print(f"  disagreement on {name}: staged={staged['is_privileged']} fused={fused['is_privileged']}")
+
+    print(f"{pairs} documents, {os.environ.get('LLM_PROVIDER')} LLM\n")
+    print(f"{'mode':<8} {'p50 ms':>9} {'p95 ms':>9} {'calls/doc':>10} {'input tok/doc':>14} {'fallbacks':>10}")
+    for mode, rows in results.items():
+        latencies = sorted(r["latency_ms"] for r in rows)
+        p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+        print(f"{mode:<8} {statistics.median(latencies):>9.1f} {p95:>9.1f} "
+              f"{statistics.fmean(r['calls'] for r in rows):>10.2f} "
+              f"{statistics.fmean(r['input_tokens'] for r in rows):>14.0f} "
+              f"{sum(r['fallback'] for r in rows):>10}")
+
+    redactions = agreement["redactions"]
+    overlap = f"{statistics.fmean(redactions):.0%}" if redactions else "n/a"
+    print(f"\nAgreement: is_privileged {agreement['is_privileged'] / pairs:.0%}, "
+          f"privilege_type {agreement['privilege_type'] / pairs:.0%}, "
+          f"redaction overlap (Jaccard, both privileged) {overlap}")
+
+
+def main():
+    args = parse_args()
+    os.environ.setdefault("LLM_PROVIDER", "fake")
+    os.environ.setdefault("FAKE_LLM_LATENCY_MS", str(args.latency_ms))
+    os.environ.setdefault("LLM_RPM", "1e9")
+    os.environ.setdefault("LLM_TPM", "1e12")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
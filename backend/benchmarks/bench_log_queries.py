@@ -0,0 +1,175 @@
+"""
+Benchmark: /logs page latency on a large matter.
+
+Seeds --rows synthetic emails with privilege logs for one user (plus the same
+number for a second user, so per-user filtering matters) directly in SQL,
+then times list/search pages through the API: the first page, a page deep
+into the log reached by cursor, date-sorted pages, filters and full-text
+search. With --explain it prints the query plan of each case.
+
+Needs DATABASE_URL pointing at a scratch Postgres database. Seeding is
+skipped when the benchmark user already has at least --rows logs.
+
+    cd backend
+    python -m benchmarks.bench_log_queries --rows 2000000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+BENCH_USERNAME = "bench-log-queries"
+
+SEED_SQL = """
+WITH inserted AS (
+    INSERT INTO emails (sender, recipient, date, subject, body, user_id)
+    SELECT
+        'person' || (n % 5000) || '@' || (CASE WHEN n % 50 = 0 THEN 'lawfirm.com' ELSE 'corp.com' END),
+        'team' || (n % 300) || '@corp.com',
+        timestamp '2020-01-01' + (n % 1500) * interval '1 day' + (n % 86400) * interval '1 second',
+        (ARRAY['Quarterly report', 'Server maintenance', 'Re: Smith v. Jones strategy', 'Lunch order', 'Vendor invoice'])[n % 5 + 1] || ' #' || n,
+        repeat('Routine business update about shipments, budgets and the office move. ', 20)
+            || (CASE WHEN n % 97 = 0 THEN ' Counsel advised we settle the indemnification claim. ' ELSE '' END)
+            || ' reference ' || md5(n::text),
+        CAST(:user_id AS integer)
+    FROM generate_series(CAST(:start AS integer), CAST(:stop AS integer)) AS n
+    RETURNING id, subject
+)
+INSERT INTO privilege_logs (email_id, is_privileged, privilege_type, log_description, decided_by, needs_spot_check)
+SELECT
+    id,
+    subject LIKE 'Re: Smith%',
+    CASE WHEN subject LIKE 'Re: Smith%' THEN 'Attorney-Client' END,
+    CASE WHEN subject LIKE 'Re: Smith%' THEN 'Email requesting legal advice regarding litigation.' END,
+    'llm',
+    false
+FROM inserted
+"""
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="logs for the benchmark user")
+    parser.add_argument("--seed-batch", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=10, help="timed requests per case")
+    parser.add_argument("--deep-pages", type=int, default=20, help="pages followed by cursor for the deep-page case")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--explain", action="store_true", help="print EXPLAIN ANALYZE for each case")
+    return parser.parse_args(argv)
+
+
+async def seed(engine, user_ids, rows: int, batch: int) -> None:
+    from sqlalchemy import func, select, text
+
+    from app.models import Email
+
+    async with engine.connect() as conn:
+        existing = await conn.scalar(select(func.count()).select_from(Email).where(Email.user_id == user_ids[0]))
+    if existing >= rows:
+        print(f"{existing} logs already seeded")
+        return
+    for user_id in user_ids:
+        for start in range(1, rows + 1, batch):
+            stop = min(rows, start + batch - 1)
+            async with engine.begin() as conn:
+                await conn.execute(text(SEED_SQL), {"user_id": user_id, "start": start, "stop": stop})
+            print(f"  user {user_id}: {stop}/{rows}", end="\r")
+    print()
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE emails"))
+        await conn.execute(text("ANALYZE privilege_logs"))
+
+
+async def bench_user(client, username: str) -> dict:
+    password = "bench-password"
+    response = await client.post("/api/v1/auth/login", data={"username": username, "password": password})
+    if response.status_code != 200:
+        response = await client.post("/api/v1/auth/signup", json={
+            "username": username, "email": f"{username}@bench.local", "password": password
+        })
+        response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def run(args: argparse.Namespace) -> None:
+    import httpx
+    from sqlalchemy import event, select
+
+    from app.database import engine
+    from app.main import app
+    from app.models import User
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            headers = await bench_user(client, BENCH_USERNAME)
+            await bench_user(client, BENCH_USERNAME + "-other")
+            async with engine.connect() as conn:
+                user_ids = list(await conn.scalars(
+                    select(User.id).where(User.username.in_([BENCH_USERNAME, BENCH_USERNAME + "-other"])).order_by(User.username)
+                ))
+            await seed(engine, user_ids, args.rows, args.seed_batch)
+
+            # Last SQL statement of each request, for --explain
+            statements = []
+
+            @event.listens_for(engine.sync_engine, "before_cursor_execute")
+            def capture(conn, cursor, statement, parameters, context, executemany):
+                statements.append((statement, parameters))
+
+            async def deep_cursor(params: dict) -> str:
+                cursor = None
+                for _ in range(args.deep_pages):
+                    page = (await client.get("/api/v1/logs", params={**params, **({"cursor": cursor} if cursor else {})}, headers=headers)).json()
+                    cursor = page["next_cursor"]
+                return cursor
+
+            base = {"limit": args.page_size}
+            cases = [
+                ("first page, by id", base),
+                ("first page, newest by date", {**base, "sort": "date", "order": "desc"}),
+                ("date range", {**base, "date_from": "2022-03-01", "date_to": "2022-03-31", "sort": "date"}),
+                ("privilege type", {**base, "privilege_type": "Attorney-Client"}),
+                ("sender substring", {**base, "sender": "lawfirm.com"}),
+                ("full-text, common term", {**base, "q": "shipments budget"}),
+                ("full-text, rare term", {**base, "q": "indemnification"}),
+                ("full-text + date range", {**base, "q": "settle", "date_from": "2021-01-01", "date_to": "2021-12-31"}),
+            ]
+            deep = await deep_cursor(base)
+            if deep:
+                cases.append((f"page {args.deep_pages + 1} by cursor", {**base, "cursor": deep}))
+
+            print(f"{args.rows} logs per user, {args.page_size} rows per page\n")
+            print(f"{'case':<32} {'rows':>5} {'p50 ms':>8} {'max ms':>8}")
+            for label, params in cases:
+                samples = []
+                for _ in range(args.repeat):
+                    statements.clear()
+                    started = time.perf_counter()
+                    response = await client.get("/api/v1/logs", params=params, headers=headers)
+                    samples.append((time.perf_counter() - started) * 1000)
+                    response.raise_for_status()
+                rows = len(response.json()["items"])
+                print(f"{label:<32} {rows:>5} {statistics.median(samples):>8.1f} {max(samples):>8.1f}")
+                if args.explain and statements:
+                    statement, parameters = statements[-1]
+                    async with engine.connect() as conn:
+                        plan = await conn.exec_driver_sql(f"EXPLAIN ANALYZE {statement}", parameters)
+                        print("    " + "\n    ".join(line for (line,) in plan))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ.setdefault("LLM_PROVIDER", "fake")
+    os.environ.setdefault("JOB_WORKERS", "0")
+    os.environ.setdefault("TRIAGE_TRAIN_ON_STARTUP", "false")
+    sys.path.insert(0, str(BACKEND_DIR))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
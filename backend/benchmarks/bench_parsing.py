@@ -0,0 +1,90 @@
+"""
+Microbenchmark: header extraction on large emails.
+
+Compares the previous extract_metadata (four regex searches over the whole
+text) with the single-pass header-block parser, on bodies of a few
+megabytes. The legacy version is reproduced here verbatim for reference.
+
+    cd backend
+    python -m benchmarks.bench_parsing --sizes 1,4,16 --iterations 20
+"""
+import argparse
+import re
+import statistics
+import time
+
+from app.parsing import extract_metadata
+
+HEADERS = (
+    "Subject: Re: Strategy for Smith v. Jones Litigation\n"
+    "From: alex.attorney@lawfirm.com\n"
+    "To: sarah.generalcounsel@corp.com,\n"
+    "  deputy.counsel@corp.com\n"
+    "Cc: ceo@corp.com\n"
+    "Date: Mon, 06 Nov 2023 15:15:00 -0500\n"
+    "\n"
+)
+# Quoted reply material: the legacy parser matched headers in here too
+PARAGRAPH = (
+    "Following up on our call, I advise that we do not admit to any liability at this stage.\n"
+    "> -----Original Message-----\n"
+    "> Sender: someone.else@corp.com\n"
+    "> Re: earlier thread\n"
+)
+
+
+def legacy_extract_metadata(text: str) -> dict:
+    metadata = {}
+    date_match = re.search(r"(?:Date|Sent):\s*(.*)", text, re.IGNORECASE)
+    from_match = re.search(r"(?:From|Sender):\s*(.*)", text, re.IGNORECASE)
+    to_match = re.search(r"(?:To|Recipient):\s*(.*)", text, re.IGNORECASE)
+    subject_match = re.search(r"(?:Subject|Re):\s*(.*)", text, re.IGNORECASE)
+    if date_match:
+        metadata["Date"] = date_match.group(1).strip()
+    if from_match:
+        metadata["From"] = from_match.group(1).strip()
+    if to_match:
+        metadata["To"] = to_match.group(1).strip()
+    if subject_match:
+        metadata["Subject"] = subject_match.group(1).strip()
+    return metadata
+
+
+def make_email(megabytes: float, headers: bool = True) -> str:
+    body = PARAGRAPH * int(megabytes * 1024 * 1024 / len(PARAGRAPH))
+    return (HEADERS if headers else "") + body
+
+
+def time_ms(fn, text: str, iterations: int) -> float:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn(text)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,4,16", help="body sizes in MB")
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'case':<28} {'legacy ms':>10} {'single-pass ms':>15} {'speedup':>9}")
+    for size in (float(s) for s in args.sizes.split(",")):
+        for with_headers in (True, False):
+            text = make_email(size, with_headers)
+            legacy = time_ms(legacy_extract_metadata, text, args.iterations)
+            current = time_ms(extract_metadata, text, args.iterations)
+            label = f"{size:g} MB, {'headers' if with_headers else 'no headers'}"
+            print(f"{label:<28} {legacy:>10.3f} {current:>15.3f} {legacy / current:>8.0f}x")
+
+    sample = make_email(0.01)
+    print("\nlegacy:     ", legacy_extract_metadata(sample))
+    print("single-pass:", extract_metadata(sample))
+    print("headerless legacy:     ", legacy_extract_metadata(make_email(0.01, headers=False)))
+    print("headerless single-pass:", extract_metadata(make_email(0.01, headers=False)))
+
+
+if __name__ == "__main__":
+    main()
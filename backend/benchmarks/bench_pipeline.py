@@ -0,0 +1,300 @@
+"""
+End-to-end benchmark of the processing pipeline against the fake LLM.
+
+Drives /analyze, /upload and /export in-process (no network hop) with the
+test_examples/ corpus scaled up synthetically, at a fixed client concurrency,
+and reports latency percentiles, documents per second, database round trips
+per document and peak RSS. Results are written as JSON so runs can be
+compared with --compare.
+
+Needs DATABASE_URL pointing at a scratch Postgres database.
+
+    cd backend
+    python -m benchmarks.bench_pipeline --documents 500 --concurrency 16 --latency-ms 200
+    python -m benchmarks.bench_pipeline --compare benchmarks/results/<earlier run>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+EXAMPLES_DIR = BACKEND_DIR.parent / "test_examples"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# Headers prepended to the synthetic copies; every copy gets a reference line
+# unique to the run, so the result cache (which persists in the database
+# between runs) does not turn the run into a cache benchmark.
+_SENDERS = ["alex.attorney@lawfirm.com", "ceo@corp.com", "hr@corp.com", "it-support@corp.com", "cfo@corp.com"]
+_RECIPIENTS = ["sarah.generalcounsel@corp.com", "team@corp.com", "board@corp.com", "legal@corp.com"]
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=200, help="documents per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="fake LLM latency per call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of fake LLM calls that fail")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scenarios", default="analyze,upload,export", help="comma-separated subset to run")
+    parser.add_argument("--exports", type=int, default=5, help="number of /export requests")
+    parser.add_argument("--duplicates", type=float, default=0.0, help="share of documents that repeat an earlier one (cache hits)")
+    parser.add_argument("--label", default="", help="free-form tag stored with the results")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    """Must run before the app is imported: the LLM is chosen at import time."""
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["FAKE_LLM_ERROR_RATE"] = str(args.error_rate)
+    os.environ["FAKE_LLM_SEED"] = str(args.seed)
+    # Keep provider quota emulation and background work out of the measurement
+    os.environ.setdefault("LLM_RPM", "1e9")
+    os.environ.setdefault("LLM_TPM", "1e12")
+    os.environ.setdefault("JOB_WORKERS", "0")
+    os.environ.setdefault("PROMPTS_WATCH_INTERVAL", "0")
+
+
+def load_corpus() -> List[str]:
+    return [path.read_text() for path in sorted(EXAMPLES_DIR.glob("*.txt"))]
+
+
+def scale_corpus(corpus: List[str], count: int, duplicates: float, rng: random.Random, run_id: str) -> List[Dict[str, str]]:
+    documents = []
+    for i in range(count):
+        if documents and rng.random() < duplicates:
+            documents.append(rng.choice(documents))
+            continue
+        body = corpus[i % len(corpus)]
+        sender = rng.choice(_SENDERS)
+        recipient = rng.choice(_RECIPIENTS)
+        subject = f"Benchmark message {i}"
+        text = f"From: {sender}\nTo: {recipient}\nSubject: {subject}\n\n{body}\n\nRef: BENCH-{run_id}-{i:06d}\n"
+        documents.append({"name": f"doc_{i:06d}.txt", "text": text})
+    return documents
+
+
+class RoundTripCounter:
+    """Counts statements sent to Postgres (one per cursor execute, executemany counts once)."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *_: Any) -> None:
+        self.count += 1
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize(name: str, latencies: List[float], errors: int, elapsed: float, round_trips: int, documents: int) -> Dict[str, Any]:
+    return {
+        "scenario": name,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "docs_per_second": round(documents / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "mean": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+            "max": round(max(latencies), 2) if latencies else 0.0,
+        },
+        "db_round_trips": round_trips,
+        "db_round_trips_per_doc": round(round_trips / documents, 2) if documents else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 1)
+
+
+async def run_requests(send, items: List[Any], concurrency: int):
+    """Sends `items` with at most `concurrency` in flight; returns (latencies in ms, error count)."""
+    queue = list(reversed(items))
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while queue:
+            item = queue.pop()
+            started = time.perf_counter()
+            try:
+                response = await send(item)
+                ok = response.status_code < 400
+            except Exception as e:
+                print(f"Request failed: {e}")
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                errors += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+async def benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+
+    from app.database import engine
+    from app.main import app
+
+    rng = random.Random(args.seed)
+    run_id = f"{time.time_ns():x}"
+    corpus = load_corpus()
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    counter = RoundTripCounter(engine)
+    results = []
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            username = f"bench{int(time.time() * 1000)}"
+            response = await client.post("/api/v1/auth/signup", json={
+                "username": username, "email": f"{username}@bench.local", "password": "benchmark"
+            })
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            async def measure(name: str, send, items: List[Any], documents: Optional[int] = None):
+                before = counter.count
+                started = time.perf_counter()
+                latencies, errors = await run_requests(send, items, args.concurrency)
+                elapsed = time.perf_counter() - started
+                summary = summarize(name, latencies, errors, elapsed, counter.count - before, documents or len(items))
+                results.append(summary)
+                print(format_summary(summary))
+
+            if "analyze" in scenarios:
+                documents = scale_corpus(corpus, args.documents, args.duplicates, rng, run_id)
+                await measure("analyze", lambda doc: client.post(
+                    "/api/v1/analyze", json={"text": doc["text"]}, headers=headers
+                ), documents)
+
+            if "upload" in scenarios:
+                documents = scale_corpus(corpus, args.documents, args.duplicates, rng, run_id)
+                await measure("upload", lambda doc: client.post(
+                    "/api/v1/upload", files={"file": (doc["name"], doc["text"].encode())}, headers=headers
+                ), documents)
+
+            if "export" in scenarios:
+                rows = await count_log_rows()
+                await measure("export", lambda _: client.get(
+                    "/api/v1/export", headers=headers
+                ), list(range(args.exports)), documents=rows * args.exports)
+
+    return {
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "label": args.label,
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "config": {
+            "documents": args.documents,
+            "concurrency": args.concurrency,
+            "latency_ms": args.latency_ms,
+            "error_rate": args.error_rate,
+            "duplicates": args.duplicates,
+            "exports": args.exports,
+            "seed": args.seed,
+        },
+        "scenarios": results,
+    }
+
+
+async def count_log_rows() -> int:
+    from sqlalchemy import func, select
+
+    from app.database import SessionLocal
+    from app.models import PrivilegeLog
+
+    async with SessionLocal() as db:
+        return (await db.execute(select(func.count()).select_from(PrivilegeLog))).scalar_one()
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    latency = summary["latency_ms"]
+    return (
+        f"{summary['scenario']:<8} {summary['requests']:>6} req  {summary['errors']:>4} err  "
+        f"{summary['docs_per_second']:>9.1f} docs/s  "
+        f"p50 {latency['p50']:>8.1f}  p95 {latency['p95']:>8.1f}  p99 {latency['p99']:>8.1f} ms  "
+        f"{summary['db_round_trips_per_doc']:>5.2f} db/doc  rss {summary['peak_rss_mb']:.0f} MB"
+    )
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    print(f"\nCompared with {baseline.get('git_commit')} ({baseline.get('timestamp')}):")
+    previous = {s["scenario"]: s for s in baseline.get("scenarios", [])}
+    for summary in current["scenarios"]:
+        before = previous.get(summary["scenario"])
+        if not before:
+            continue
+        metrics = [
+            ("docs/s", summary["docs_per_second"], before["docs_per_second"]),
+            ("p95 ms", summary["latency_ms"]["p95"], before["latency_ms"]["p95"]),
+            ("db/doc", summary["db_round_trips_per_doc"], before["db_round_trips_per_doc"]),
+            ("rss MB", summary["peak_rss_mb"], before["peak_rss_mb"]),
+        ]
+        parts = []
+        for label, now, then in metrics:
+            change = f"{(now - then) / then * 100:+.1f}%" if then else "n/a"
+            parts.append(f"{label} {then} -> {now} ({change})")
+        print(f"  {summary['scenario']:<8} " + ", ".join(parts))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment(args)
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    print(f"{args.documents} documents, concurrency {args.concurrency}, "
+          f"fake LLM {args.latency_ms:g} ms / {args.error_rate:.0%} errors\n")
+    report = asyncio.run(benchmark(args))
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{datetime.utcnow():%Y%m%dT%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    main()
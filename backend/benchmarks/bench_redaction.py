@@ -0,0 +1,120 @@
+"""
+Benchmark: locating redaction passages in email bodies and rendering them.
+
+Builds synthetic bodies of --size characters (line-wrapped, with some
+doubled spaces) containing --passages redaction passages, each occurring
+several times and reflowed differently from the passage text. Then it times:
+
+- resolve_spans: whitespace collapsed once, then the passages located with
+  find_patterns (a str.find scan per passage, or the Aho-Corasick automaton
+  when use_automaton expects it to be faster)
+- the automaton and the str.find scans alone on the collapsed body, to check
+  the cost constants behind use_automaton
+- a per-passage regex search on the raw body with the same whitespace
+  tolerance, for comparison
+- render_redacted from the resolved spans
+
+It also checks that every search finds the same spans. No database or LLM
+is needed.
+
+    cd backend
+    python -m benchmarks.bench_redaction --size 1000000 --passages 20 500 1500
+"""
+import argparse
+import random
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+WORDS = (
+    "shipment budget quarterly vendor contract review office move schedule invoice meeting "
+    "counsel advised settlement claim indemnification draft agreement strategy exposure"
+).split()
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="body sizes in characters")
+    parser.add_argument("--passages", type=int, nargs="+", default=[10, 100, 500], help="distinct redaction passages per body")
+    parser.add_argument("--occurrences", type=int, default=3, help="times each passage occurs")
+    parser.add_argument("--repeat", type=int, default=5)
+    return parser.parse_args(argv)
+
+
+def make_document(rng: random.Random, size: int, passages: int, occurrences: int):
+    items = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))) + "." for _ in range(passages)]
+    words = []
+    while sum(len(w) + 1 for w in words) < size:
+        words.extend(rng.choice(WORDS) for _ in range(50))
+        if rng.random() < passages * occurrences * 2000 / size:
+            words.extend(rng.choice(items).split(" "))
+    for item in items:
+        for _ in range(occurrences):
+            position = rng.randrange(len(words))
+            words[position:position] = item.split(" ")
+    # Reflow: wrap lines and double some spaces, as mail clients do
+    pieces = []
+    line = 0
+    for word in words:
+        separator = "\n" if line > 72 else ("  " if rng.random() < 0.02 else " ")
+        line = 0 if separator == "\n" else line + len(word) + 1
+        pieces.append(word + separator)
+    return "".join(pieces)[:size], items
+
+
+def regex_spans(body: str, items):
+    spans = set()
+    for item in dict.fromkeys(items):
+        pattern = re.compile(r"\s+".join(re.escape(word) for word in item.split()))
+        start = 0
+        # Overlapping occurrences too, like the automaton
+        while True:
+            match = pattern.search(body, start)
+            if not match:
+                break
+            spans.add((item, match.start(), match.end()))
+            start = match.start() + 1
+    return spans
+
+
+def timed(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return value, statistics.median(samples)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.path.insert(0, str(BACKEND_DIR))
+    from app.redaction import CollapsedText, RedactionMatcher, _find_each, normalize_whitespace, render_redacted, resolve_spans, use_automaton
+
+    rng = random.Random(7)
+    print(f"{args.occurrences}+ occurrences per passage, median of {args.repeat} runs (ms)\n")
+    print(f"{'body chars':>11} {'passages':>9} {'spans':>6} {'resolve':>8} {'automaton':>10} {'str.find':>9} "
+          f"{'regex':>8} {'render':>7} {'agree':>6} {'picked':>10}")
+    for size in args.size:
+        for passages in args.passages:
+            body, items = make_document(rng, size, passages, args.occurrences)
+            patterns = list(dict.fromkeys(normalize_whitespace(item) for item in items))
+            collapsed = CollapsedText(body).text
+            spans, resolve_ms = timed(lambda: resolve_spans(body, items), args.repeat)
+            automaton, automaton_ms = timed(lambda: sorted(RedactionMatcher(patterns).find(collapsed)), args.repeat)
+            scans, find_ms = timed(lambda: sorted(_find_each(collapsed, patterns)), args.repeat)
+            expected, regex_ms = timed(lambda: regex_spans(body, items), args.repeat)
+            _, render_ms = timed(lambda: render_redacted(body, spans), args.repeat)
+            found = {(s["text"], s["start"], s["end"]) for s in spans if s["start"] is not None}
+            agree = found == expected and automaton == scans
+            print(f"{len(body):>11} {len(patterns):>9} {len(found):>6} {resolve_ms:>8.1f} {automaton_ms:>10.1f} "
+                  f"{find_ms:>9.1f} {regex_ms:>8.1f} {render_ms:>7.2f} {str(agree):>6} "
+                  f"{'automaton' if use_automaton(collapsed, patterns) else 'str.find':>10}")
+
+
+if __name__ == "__main__":
+    main()
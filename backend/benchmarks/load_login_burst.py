@@ -0,0 +1,117 @@
+"""
+Load test: /analyze latency while a burst of logins hits the same worker.
+
+A steady stream of /analyze requests (fake LLM) runs for a baseline period,
+then keeps running while --logins concurrent logins arrive. With bcrypt on
+the event loop, every login stalls all in-flight analyses; with the hashing
+pool (AUTH_HASH_WORKERS > 0) the analyze percentiles should barely move.
+
+Needs DATABASE_URL pointing at a scratch Postgres database.
+
+    cd backend
+    python -m benchmarks.load_login_burst --logins 200
+    AUTH_HASH_WORKERS=0 python -m benchmarks.load_login_burst --logins 200   # old inline behaviour
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=100, help="logins in the burst")
+    parser.add_argument("--login-concurrency", type=int, default=50)
+    parser.add_argument("--analyze-concurrency", type=int, default=4)
+    parser.add_argument("--baseline-seconds", type=float, default=3.0)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="fake LLM latency per call")
+    return parser.parse_args(argv)
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+def report(label: str, samples: List[float]) -> None:
+    print(f"{label:<24} {len(samples):>5} req  p50 {percentile(samples, 50):>8.1f}  "
+          f"p95 {percentile(samples, 95):>8.1f}  p99 {percentile(samples, 99):>8.1f}  max {max(samples, default=0):>8.1f} ms")
+
+
+async def run(args: argparse.Namespace) -> None:
+    import httpx
+
+    from app.auth_utils import password_hasher
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=None) as client:
+            username = f"load{int(time.time() * 1000)}"
+            password = "load-test-password"
+            response = await client.post("/api/v1/auth/signup", json={
+                "username": username, "email": f"{username}@load.local", "password": password
+            })
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            phase = "baseline"
+            latencies = {"baseline": [], "burst": []}
+            stop = asyncio.Event()
+            counter = 0
+
+            async def analyze_loop():
+                nonlocal counter
+                while not stop.is_set():
+                    counter += 1
+                    text = f"Subject: Load {counter}\n\nQuarterly numbers attached. Ref LOAD-{username}-{counter}"
+                    started = time.perf_counter()
+                    await client.post("/api/v1/analyze", json={"text": text}, headers=headers)
+                    latencies[phase].append((time.perf_counter() - started) * 1000)
+
+            analyzers = [asyncio.create_task(analyze_loop()) for _ in range(args.analyze_concurrency)]
+            await asyncio.sleep(args.baseline_seconds)
+
+            phase = "burst"
+            statuses: dict = {}
+            login_slots = asyncio.Semaphore(args.login_concurrency)
+
+            async def login():
+                async with login_slots:
+                    r = await client.post("/api/v1/auth/login", data={"username": username, "password": password})
+                    statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(login() for _ in range(args.logins)))
+            burst_seconds = time.perf_counter() - started
+
+            stop.set()
+            await asyncio.gather(*analyzers)
+
+    workers = password_hasher.workers
+    print(f"bcrypt workers: {workers or 'inline on the event loop'}, capacity {password_hasher.capacity}")
+    print(f"{args.logins} logins in {burst_seconds:.2f}s, status codes {statuses}\n")
+    report("analyze, baseline", latencies["baseline"])
+    report("analyze, during logins", latencies["burst"])
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.latency_ms)
+    os.environ.setdefault("LLM_RPM", "1e9")
+    os.environ.setdefault("LLM_TPM", "1e12")
+    os.environ.setdefault("JOB_WORKERS", "0")
+    sys.path.insert(0, str(BACKEND_DIR))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
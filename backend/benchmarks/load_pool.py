@@ -0,0 +1,152 @@
+"""
+Load test: concurrent /analyze requests against a small connection pool.
+
+Runs waves of --requests analyses at each --concurrency level with the fake
+LLM (--latency-ms per call) and a deliberately small pool (--pool-size,
+--max-overflow), and reports throughput, latency percentiles, the time spent
+waiting for a connection and how many requests were shed with a 503.
+
+--legacy restores the old behaviour, where the request's session touched the
+database before the LLM calls and so held its connection for the whole
+analysis; with it, concurrency beyond the pool size only queues on the pool.
+
+Needs DATABASE_URL pointing at a scratch Postgres database.
+
+    cd backend
+    python -m benchmarks.load_pool --pool-size 4 --concurrency 4 16 64
+    python -m benchmarks.load_pool --pool-size 4 --concurrency 4 16 64 --legacy
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 16, 64], help="in-flight requests per wave")
+    parser.add_argument("--requests", type=int, default=200, help="requests per wave")
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--max-overflow", type=int, default=0)
+    parser.add_argument("--pool-timeout", type=float, default=5.0, help="seconds before a checkout gives up (503)")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="fake LLM latency per call")
+    parser.add_argument("--legacy", action="store_true", help="hold the connection across the LLM calls, as before")
+    return parser.parse_args(argv)
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+def pool_wait_seconds() -> float:
+    from app.metrics import DB_POOL_WAIT
+
+    return sum(total for _, total, _ in DB_POOL_WAIT.values.values())
+
+
+def hold_connection_during_pipeline() -> None:
+    """
+    Checks the request's connection out before the pipeline runs and does the
+    cache lookup on it, like the session-threaded pipeline did.
+    """
+    import contextvars
+
+    from sqlalchemy import text
+
+    from app.routes import processing
+
+    request_session = contextvars.ContextVar("request_session")
+    process_and_save_email = processing.process_and_save_email
+
+    async def legacy_process_and_save_email(text_body, metadata_override, db, *args, **kwargs):
+        await db.execute(text("SELECT 1"))
+        request_session.set(db)
+        return await process_and_save_email(text_body, metadata_override, db, *args, **kwargs)
+
+    async def legacy_cached_result(cache_key):
+        return await processing.result_cache.get(request_session.get(), cache_key)
+
+    processing.process_and_save_email = legacy_process_and_save_email
+    processing._cached_result = legacy_cached_result
+
+
+async def run(args: argparse.Namespace) -> None:
+    import httpx
+
+    from app.main import app
+
+    if args.legacy:
+        hold_connection_during_pipeline()
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=None) as client:
+            username = f"pool{int(time.time() * 1000)}"
+            response = await client.post("/api/v1/auth/signup", json={
+                "username": username, "email": f"{username}@load.local", "password": "load-test-password"
+            })
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            print(f"pool {args.pool_size} + {args.max_overflow} overflow, timeout {args.pool_timeout}s, "
+                  f"LLM latency {args.latency_ms:.0f} ms, {'legacy (connection held)' if args.legacy else 'scoped connections'}\n")
+            print(f"{'concurrency':>11} {'ok':>5} {'503':>5} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'pool wait/req ms':>17}")
+            counter = 0
+            for concurrency in args.concurrency:
+                slots = asyncio.Semaphore(concurrency)
+                latencies: List[float] = []
+                statuses: dict = {}
+
+                async def analyze():
+                    nonlocal counter
+                    async with slots:
+                        counter += 1
+                        # Unique text, so every request misses the result cache and calls the LLM
+                        text = f"Subject: Pool {counter}\n\nQuarterly numbers attached. Ref POOL-{username}-{counter}"
+                        started = time.perf_counter()
+                        r = await client.post("/api/v1/analyze", json={"text": text}, headers=headers)
+                        statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+                        if r.status_code == 200:
+                            latencies.append((time.perf_counter() - started) * 1000)
+
+                waited = pool_wait_seconds()
+                started = time.perf_counter()
+                await asyncio.gather(*(analyze() for _ in range(args.requests)))
+                elapsed = time.perf_counter() - started
+                waited = pool_wait_seconds() - waited
+                ok = statuses.get(200, 0)
+                print(f"{concurrency:>11} {ok:>5} {statuses.get(503, 0):>5} {ok / elapsed:>7.1f} "
+                      f"{percentile(latencies, 50):>8.1f} {percentile(latencies, 95):>8.1f} "
+                      f"{waited * 1000 / args.requests:>17.1f}")
+                other = {code: n for code, n in statuses.items() if code not in (200, 503)}
+                if other:
+                    print(f"{'':>11} other status codes: {other}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["DB_POOL_SIZE"] = str(args.pool_size)
+    os.environ["DB_MAX_OVERFLOW"] = str(args.max_overflow)
+    os.environ["DB_POOL_TIMEOUT"] = str(args.pool_timeout)
+    os.environ["METRICS_ENABLED"] = "true"
+    os.environ.setdefault("LLM_RPM", "1e9")
+    os.environ.setdefault("LLM_TPM", "1e12")
+    os.environ.setdefault("LLM_MAX_CONCURRENCY", "1024")
+    os.environ.setdefault("JOB_WORKERS", "0")
+    os.environ.setdefault("TRIAGE_TRAIN_ON_STARTUP", "false")
+    sys.path.insert(0, str(BACKEND_DIR))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Load test: throughput of 1..N API worker processes on one host.
+
+For each --workers count, starts N uvicorn processes on consecutive ports
+from --port, in multi-worker mode (MULTI_WORKER=true) with the fake LLM, and
+spreads the requests over them round-robin, like a load balancer in front of
+N containers. --shared-socket starts one `uvicorn --workers N` instead. Then
+it measures:
+
+- analyze: --requests synchronous /analyze calls, --concurrency at a time,
+  with unique bodies so every one misses the result cache
+- jobs: --jobs queued /jobs/analyze submissions drained by the job workers
+  of every process (JOB_WORKERS each), claimed with SKIP LOCKED; it also
+  checks that no job was run twice
+
+and reports throughput, the speedup over one worker, and the LLM calls per
+minute next to what the shared LLM_RPM bucket allows (--rpm; its capacity
+plus the refill over the run). --local-limits runs without multi-worker mode,
+where every process has its own buckets and together they go over --rpm.
+
+Each process admits at most --llm-concurrency LLM calls at a time (calls of
+--latency-ms), so one worker's throughput is fixed and the test shows what
+coordination through Postgres costs as processes are added, even on a host
+with few cores. On a host with a core per worker, raise --llm-concurrency to
+measure CPU scaling instead.
+
+Needs DATABASE_URL pointing at a scratch Postgres database, and a free --port.
+
+    cd backend
+    python -m benchmarks.load_workers --workers 1 2 4
+    python -m benchmarks.load_workers --workers 1 4 --rpm 600 --requests 400
+    python -m benchmarks.load_workers --workers 4 --rpm 600 --requests 400 --local-limits
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="API processes per run")
+    parser.add_argument("--requests", type=int, default=300, help="synchronous /analyze calls per run")
+    parser.add_argument("--jobs", type=int, default=300, help="queued jobs per run (0 skips the job test)")
+    parser.add_argument("--concurrency", type=int, default=64, help="client requests in flight")
+    parser.add_argument("--llm-concurrency", type=int, default=4, help="LLM_MAX_CONCURRENCY of each process")
+    parser.add_argument("--job-workers", type=int, default=4, help="JOB_WORKERS of each process")
+    parser.add_argument("--latency-ms", type=float, default=250.0, help="fake LLM latency per call")
+    parser.add_argument("--rpm", type=float, default=1_000_000, help="LLM_RPM, shared by all processes")
+    parser.add_argument("--local-limits", action="store_true", help="run without multi-worker mode (per-process buckets)")
+    parser.add_argument("--port", type=int, default=8765, help="first port")
+    parser.add_argument("--shared-socket", action="store_true", help="one uvicorn --workers N on --port")
+    return parser.parse_args(argv)
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+def start_server(args: argparse.Namespace, workers: int, port: int, log) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "LLM_PROVIDER": "fake",
+        "FAKE_LLM_LATENCY_MS": str(args.latency_ms),
+        # A fixed limit, so the AIMD controller does not add noise
+        "LLM_MAX_CONCURRENCY": str(args.llm_concurrency),
+        "LLM_MIN_CONCURRENCY": str(args.llm_concurrency),
+        "LLM_RPM": str(args.rpm),
+        "MULTI_WORKER": "false" if args.local_limits else "true",
+        "JOB_WORKERS": str(args.job_workers),
+        # Every document goes to the LLM
+        "TRIAGE_ENABLED": "false",
+        "ATTACHMENT_WORKERS": "0",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--workers", str(workers),
+         "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+class RoundRobin:
+    """Spreads requests over the servers' base URLs."""
+
+    def __init__(self, client, urls: List[str]):
+        self.client = client
+        self.urls = itertools.cycle(urls)
+
+    async def post(self, path: str, **kwargs):
+        return await self.client.post(next(self.urls) + path, **kwargs)
+
+
+async def wait_ready(client, url: str, server: subprocess.Popen) -> None:
+    for _ in range(300):
+        if server.poll() is not None:
+            raise RuntimeError("the server exited")
+        try:
+            if (await client.get(url + "/")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("the server did not start")
+
+
+async def analyze_phase(client, headers, args, tag: str):
+    slots = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+    statuses: dict = {}
+    llm_calls = 0
+
+    async def analyze(i: int):
+        nonlocal llm_calls
+        async with slots:
+            text = f"Subject: Scale {tag} {i}\n\nPlease review the supplier contract before Friday. Ref SCALE-{tag}-{i}"
+            started = time.perf_counter()
+            r = await client.post("/api/v1/analyze", json={"text": text}, headers=headers)
+            statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+            if r.status_code == 200:
+                latencies.append((time.perf_counter() - started) * 1000)
+                llm_calls += (r.json().get("token_usage") or {}).get("calls", 0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(analyze(i) for i in range(args.requests)))
+    return time.perf_counter() - started, latencies, statuses, llm_calls
+
+
+async def jobs_phase(client, headers, args, tag: str):
+    from sqlalchemy import func, select
+
+    from app.database import SessionLocal
+    from app.models import AnalysisJob
+
+    slots = asyncio.Semaphore(args.concurrency)
+    job_ids: List[int] = []
+
+    async def submit(i: int):
+        async with slots:
+            text = f"Subject: Queued {tag} {i}\n\nMinutes of the facilities meeting. Ref JOB-{tag}-{i}"
+            r = await client.post("/api/v1/jobs/analyze", json={"text": text}, headers=headers)
+            r.raise_for_status()
+            job_ids.append(r.json()["job_id"])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(submit(i) for i in range(args.jobs)))
+    while True:
+        async with SessionLocal() as db:
+            rows = (await db.execute(
+                select(AnalysisJob.status, func.count(), func.max(AnalysisJob.attempts))
+                .where(AnalysisJob.id.in_(job_ids))
+                .group_by(AnalysisJob.status)
+            )).all()
+        counts = {status: count for status, count, _ in rows}
+        if counts.get("succeeded", 0) + counts.get("failed", 0) >= len(job_ids):
+            break
+        await asyncio.sleep(0.1)
+    return time.perf_counter() - started, counts, max(attempts for _, _, attempts in rows)
+
+
+async def run(args: argparse.Namespace) -> None:
+    import httpx
+
+    mode = "per-process limits" if args.local_limits else "multi-worker mode"
+    mode += ", uvicorn --workers" if args.shared_socket else ", a port per process"
+    print(f"{mode}, {args.llm_concurrency} LLM slots per process, {args.latency_ms:.0f} ms per call, "
+          f"LLM_RPM {args.rpm:g}, {os.cpu_count()} CPU(s)\n")
+    print(f"{'workers':>7} {'analyze/s':>10} {'speedup':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7} "
+          f"{'LLM calls/min':>14} {'allowed':>9} {'jobs/s':>8} {'speedup':>8} {'max attempts':>13}")
+    baseline = {}
+    for workers in args.workers:
+        with tempfile.TemporaryFile() as log:
+            ports = [args.port] if args.shared_socket else [args.port + i for i in range(workers)]
+            servers = [start_server(args, workers if args.shared_socket else 1, port, log) for port in ports]
+            try:
+                async with httpx.AsyncClient(timeout=None) as http:
+                    urls = [f"http://127.0.0.1:{port}" for port in ports]
+                    for url, server in zip(urls, servers):
+                        await wait_ready(http, url, server)
+                    client = RoundRobin(http, urls)
+                    tag = f"{workers}w{int(time.time() * 1000)}"
+                    response = await client.post("/api/v1/auth/signup", json={
+                        "username": f"scale{tag}", "email": f"scale{tag}@load.local", "password": "load-test-password"
+                    })
+                    response.raise_for_status()
+                    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+                    # Every process past its startup (tables, chains) before the clock starts
+                    await asyncio.gather(*(
+                        client.post("/api/v1/analyze", json={"text": f"Warm up {tag} {i}"}, headers=headers)
+                        for i in range(workers * 8)
+                    ))
+
+                    elapsed, latencies, statuses, llm_calls = await analyze_phase(client, headers, args, tag)
+                    ok = statuses.get(200, 0)
+                    rate = ok / elapsed
+                    baseline.setdefault("analyze", rate)
+                    # What the shared bucket lets through in this time: a full bucket plus the refill
+                    allowed = args.rpm + args.rpm * elapsed / 60
+                    allowed_per_minute = f"{allowed / elapsed * 60:.0f}" if args.rpm < 1_000_000 else "-"
+                    line = (f"{workers:>7} {rate:>10.1f} {rate / baseline['analyze']:>7.2f}x "
+                            f"{percentile(latencies, 50):>8.0f} {percentile(latencies, 95):>8.0f} {args.requests - ok:>7} "
+                            f"{llm_calls / elapsed * 60:>14.0f} {allowed_per_minute:>9}")
+                    if args.jobs:
+                        jobs_elapsed, counts, max_attempts = await jobs_phase(client, headers, args, tag)
+                        jobs_rate = counts.get("succeeded", 0) / jobs_elapsed
+                        baseline.setdefault("jobs", jobs_rate)
+                        line += f" {jobs_rate:>8.1f} {jobs_rate / baseline['jobs']:>7.2f}x {max_attempts:>13}"
+                    print(line)
+            except Exception:
+                log.seek(0)
+                print(log.read().decode(errors="replace")[-4000:])
+                raise
+            finally:
+                for server in servers:
+                    server.terminate()
+                for server in servers:
+                    server.wait(timeout=30)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.path.insert(0, str(BACKEND_DIR))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Read at import; the unit tests never connect to the database or call a model
+os.environ.setdefault("DATABASE_URL", "postgresql://postgres:@localhost/privilege_pipeline_test")
+os.environ.setdefault("LLM_PROVIDER", "fake")
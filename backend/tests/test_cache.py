@@ -0,0 +1,72 @@
+import asyncio
+from types import SimpleNamespace
+
+from app import cache, preprocessing
+from app.cache import current_pipeline_version, make_cache_key, normalize_body
+
+METADATA = {"From": "a@corp.com", "To": "b@corp.com", "Subject": "Plan", "Date": "Mon, 6 Nov 2023"}
+
+
+def key(body="Body", metadata=METADATA, **kwargs):
+    return make_cache_key(body, metadata, prompt_version="p1", model_name="m1", **kwargs)
+
+
+def test_copies_from_different_mailboxes_share_a_key():
+    assert normalize_body("Hi  \r\n\r\n\r\n\r\nBye\r\n") == "Hi\n\nBye"
+    assert key("Hi  \r\n\r\n\r\nBye") == key("Hi\n\nBye")
+    # The date is not sent to the chains
+    assert key(metadata={**METADATA, "Date": "Tue, 7 Nov 2023"}) == key()
+
+
+def test_key_changes_with_what_the_chains_see():
+    assert key("Other body") != key()
+    assert key(metadata={**METADATA, "To": "c@corp.com"}) != key()
+    assert make_cache_key("Body", METADATA, prompt_version="p2", model_name="m1") != key()
+    assert make_cache_key("Body", METADATA, prompt_version="p1", model_name="m2") != key()
+    assert key(pipeline_mode="fused") != key()
+
+
+def test_key_changes_with_the_preprocessing_settings(monkeypatch):
+    before, version = key(), current_pipeline_version()
+    monkeypatch.setattr(preprocessing, "LLM_CHUNK_TOKENS", preprocessing.LLM_CHUNK_TOKENS // 2)
+    assert current_pipeline_version() != version
+    assert key() != before
+
+
+def test_key_changes_with_the_parser_schema_version(monkeypatch):
+    before, version = key(), current_pipeline_version()
+    monkeypatch.setattr(cache, "PARSER_SCHEMA_VERSION", "next")
+    assert current_pipeline_version() != version
+    assert key() != before
+
+
+def test_pipeline_version_fits_its_column():
+    assert len(current_pipeline_version()) <= 32
+
+
+class FakeSession:
+    def __init__(self, row):
+        self.row = row
+
+    async def get(self, model, key):
+        return self.row
+
+
+def cache_row(**overrides):
+    values = dict(is_privileged=True, privilege_type="Attorney-Client", reasoning="r", log_description="d",
+                  redaction_items=["x"], stages=["judge", "writer", "redactor"])
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+def test_a_hit_carries_the_stages_that_produced_it():
+    result_cache = cache.ResultCache()
+    hit = asyncio.run(result_cache.get(FakeSession(cache_row()), "k"))
+    assert hit.stages == ("judge", "writer", "redactor")
+    assert result_cache.hits == 1
+
+
+def test_entries_without_stages_are_misses():
+    result_cache = cache.ResultCache()
+    assert asyncio.run(result_cache.get(FakeSession(cache_row(stages=None)), "k")) is None
+    assert result_cache.misses == 1
@@ -0,0 +1,109 @@
+import random
+
+import pytest
+
+from app.clustering import (
+    NUM_PERM,
+    RELATION_NEAR_DUPLICATE,
+    RELATION_THREAD,
+    cluster_documents,
+    containment,
+    estimated_jaccard,
+    minhash,
+    normalize_for_similarity,
+    parse_message_ids,
+    shingle_hashes,
+)
+
+WORDS = [f"word{i}" for i in range(400)]
+
+
+def prose(seed: int, length: int = 200) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+
+def test_normalization_drops_case_punctuation_and_reply_quoting():
+    assert normalize_for_similarity("> Hello, World!\n>> Re: a@b.com") == ["hello", "world", "re", "a@b.com"]
+
+
+def test_short_texts_still_get_a_shingle():
+    assert len(shingle_hashes("two words")) == 1
+    assert shingle_hashes("") == set()
+
+
+def test_minhash_of_identical_texts_match_exactly():
+    shingles = shingle_hashes(prose(1))
+    assert estimated_jaccard(minhash(shingles), minhash(set(shingles))) == 1.0
+
+
+def test_minhash_estimates_jaccard_similarity():
+    a = set(range(0, 2000))
+    b = set(range(500, 2500))  # Jaccard 1500 / 2500 = 0.6
+    # Spread the values over the bins like real hashes
+    scramble = lambda values: {v * 0x9E3779B97F4A7C15 % (1 << 64) for v in values}
+    estimate = estimated_jaccard(minhash(scramble(a)), minhash(scramble(b)))
+    assert estimate == pytest.approx(0.6, abs=0.12)
+
+
+def test_densified_signature_fills_every_bin():
+    signature = minhash({7})
+    assert len(signature) == NUM_PERM
+    assert all(value >= 0 for value in signature)
+
+
+def test_empty_text_signature():
+    assert minhash(set()) == tuple([-1] * NUM_PERM)
+
+
+def test_containment():
+    assert containment({1, 2}, {1, 2, 3}) == 1.0
+    assert containment({1, 2, 3, 4}, {1, 2}) == 0.5
+    assert containment(set(), {1}) == 1.0
+
+
+def test_message_ids_are_parsed_from_headers():
+    assert parse_message_ids("<a@x> <b@y>") == ["<a@x>", "<b@y>"]
+    assert parse_message_ids(None) == []
+
+
+def test_near_duplicates_share_one_representative():
+    body = prose(2)
+    documents = [
+        (body, {}),
+        (prose(3), {}),
+        (body + " Sent from my phone", {}),
+    ]
+    clusters = cluster_documents(documents)
+    assert len(clusters) == 2
+    grouped = next(c for c in clusters if c.members)
+    assert {grouped.representative, grouped.members[0].index} == {0, 2}
+    assert grouped.members[0].relation == RELATION_NEAR_DUPLICATE
+
+
+def test_thread_reply_represents_the_messages_it_quotes():
+    question = prose(4, 60)
+    reply_text = prose(5, 60)
+    quoted = "\n".join("> " + line for line in question.split(". "))
+    documents = [
+        (question, {"Message-ID": "<q@x>"}),
+        (reply_text + "\n\n" + quoted, {"Message-ID": "<r@x>", "In-Reply-To": "<q@x>"}),
+    ]
+    [cluster] = cluster_documents(documents)
+    assert cluster.representative == 1
+    assert [(m.index, m.relation) for m in cluster.members] == [(0, RELATION_THREAD)]
+
+
+def test_thread_member_not_quoted_by_the_representative_is_reviewed_on_its_own():
+    documents = [
+        (prose(6), {"Message-ID": "<a@x>"}),
+        (prose(7, 300), {"Message-ID": "<b@x>", "References": "<a@x>"}),
+    ]
+    clusters = cluster_documents(documents)
+    assert [(c.representative, c.members) for c in clusters] == [(0, []), (1, [])]
+
+
+def test_unrelated_documents_stay_apart():
+    clusters = cluster_documents([(prose(seed), {}) for seed in range(10, 20)])
+    assert [c.representative for c in clusters] == list(range(10))
+    assert all(not c.members for c in clusters)
@@ -0,0 +1,407 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import Runnable
+
+from app.fake_llm import FakeChatModel, FakeRateLimitError
+from app.governor import (
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    GovernedLLM,
+    LLMGovernor,
+    TokenBucket,
+    is_rate_limit_error,
+)
+
+
+def make_governor(**overrides) -> LLMGovernor:
+    settings = dict(
+        rpm=1e9, tpm=1e12, max_concurrency=8, min_concurrency=1,
+        user_weights={}, user_max_concurrency=0, user_concurrency={}, user_tpm=0, user_tpm_overrides={},
+    )
+    settings.update(overrides)
+    return LLMGovernor(**settings)
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+class ScriptedLLM(Runnable):
+    """Raises the scripted errors in order, then answers."""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def invoke(self, input, config=None, **kwargs):
+        raise NotImplementedError
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return AIMessage(content="ok", usage_metadata={"input_tokens": 10, "output_tokens": 5, "total_tokens": 15})
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    sleep = asyncio.sleep
+    monkeypatch.setattr(asyncio, "sleep", lambda seconds: sleep(0))
+
+
+# --- Token bucket ---
+
+def test_bucket_starts_full_and_refills_at_its_rate():
+    bucket = TokenBucket(60)  # one token per second
+    assert bucket.wait_time(60) == 0.0
+    bucket.consume(60)
+    assert bucket.wait_time(30) == pytest.approx(30, abs=0.1)
+    # 10 seconds later
+    bucket.updated -= 10
+    assert bucket.wait_time(30) == pytest.approx(20, abs=0.1)
+
+
+def test_bucket_never_refills_past_capacity():
+    bucket = TokenBucket(60)
+    bucket.updated -= 3600
+    bucket.refund(100)
+    assert bucket.tokens == 60
+
+
+def test_bucket_lets_an_oversized_request_through_when_full():
+    bucket = TokenBucket(60)
+    assert bucket.wait_time(500) == 0.0
+    bucket.consume(500)
+    # The debt is paid back before the next call
+    assert bucket.wait_time(1) == pytest.approx(441, abs=0.1)
+
+
+def test_requests_bucket_holds_calls_back():
+    async def scenario():
+        governor = make_governor(rpm=60)
+        governor.requests.tokens = 1
+        first = await governor.acquire(10)
+        second = asyncio.ensure_future(governor.acquire(10))
+        await asyncio.sleep(0.05)
+        assert not second.done()
+        assert governor.stats()["waiting"][PRIORITY_INTERACTIVE] == 1
+        governor.requests.tokens = 1
+        governor.wake()
+        governor.release(first)
+        governor.release(await second)
+
+    asyncio.run(scenario())
+
+
+# --- AIMD concurrency ---
+
+def test_rate_limit_halves_the_limit_once_per_congestion_event():
+    governor = make_governor(max_concurrency=16)
+    governor.on_rate_limited()
+    assert governor.limit == 8
+    # 429s from calls that were already in flight do not halve it again
+    governor.on_rate_limited()
+    assert governor.limit == 8
+    governor._last_decrease -= 10
+    governor.on_rate_limited()
+    assert governor.limit == 4
+    assert governor.rate_limited == 3
+
+
+def test_limit_never_drops_below_the_minimum():
+    governor = make_governor(max_concurrency=4, min_concurrency=2)
+    for _ in range(5):
+        governor._last_decrease = 0.0
+        governor.on_rate_limited()
+    assert governor.limit == 2
+
+
+def test_success_grows_the_limit_additively_up_to_the_maximum():
+    governor = make_governor(max_concurrency=8)
+    governor.limit = 4.0
+    governor.on_success(0.1)
+    assert governor.limit == pytest.approx(4.25)
+    for _ in range(200):
+        governor.on_success(0.1)
+    assert governor.limit == 8
+
+
+def test_latency_spike_counts_as_congestion():
+    governor = make_governor(max_concurrency=8, latency_spike_factor=3.0)
+    governor.on_success(0.1)
+    governor.on_success(1.0)
+    assert governor.latency_spikes == 1
+    assert governor.limit == 4
+
+
+def test_concurrency_limit_holds_calls_back_until_a_release():
+    async def scenario():
+        governor = make_governor(max_concurrency=2)
+        held = [await governor.acquire(10), await governor.acquire(10)]
+        third = asyncio.ensure_future(governor.acquire(10))
+        await asyncio.sleep(0)
+        assert not third.done()
+        governor.release(held.pop())
+        held.append(await third)
+        assert governor.in_flight == 2
+
+    asyncio.run(scenario())
+
+
+def test_interactive_calls_go_before_queued_bulk_calls():
+    async def scenario():
+        governor = make_governor(max_concurrency=1)
+        held = await governor.acquire(10)
+        order = []
+
+        async def call(name, priority):
+            flow = await governor.acquire(10, priority=priority)
+            order.append(name)
+            governor.release(flow)
+
+        bulk = asyncio.ensure_future(call("bulk", PRIORITY_BULK))
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(call("interactive", PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+        governor.release(held)
+        await asyncio.gather(bulk, interactive)
+        assert order == ["interactive", "bulk"]
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_gives_its_place_up():
+    async def scenario():
+        governor = make_governor(max_concurrency=1)
+        held = await governor.acquire(10)
+        waiter = asyncio.ensure_future(governor.acquire(10))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        governor.release(held)
+        assert governor.in_flight == 0
+        governor.release(await governor.acquire(10))
+
+    asyncio.run(scenario())
+
+
+# --- Per-user fair queuing ---
+
+async def admission_order(governor, calls):
+    """Queues (user, cost) calls behind a held slot, then lets them through one at a time."""
+    held = await governor.acquire(1, user=0)
+    order = []
+
+    async def call(user, cost):
+        flow = await governor.acquire(cost, user=user)
+        order.append(user)
+        governor.release(flow)
+
+    tasks = []
+    for user, cost in calls:
+        tasks.append(asyncio.ensure_future(call(user, cost)))
+        await asyncio.sleep(0)
+    governor.release(held)
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_a_backlogged_user_does_not_starve_a_light_one():
+    async def scenario():
+        governor = make_governor(max_concurrency=1)
+        order = await admission_order(governor, [(1, 100)] * 6 + [(2, 100)] * 2)
+        assert order == [1, 2, 1, 2, 1, 1, 1, 1]
+
+    asyncio.run(scenario())
+
+
+def test_weights_set_each_users_share():
+    async def scenario():
+        governor = make_governor(max_concurrency=1, user_weights={"1": 3})
+        order = await admission_order(governor, [(1, 100)] * 8 + [(2, 100)] * 8)
+        assert order[:8].count(1) == 6
+
+    asyncio.run(scenario())
+
+
+def test_a_user_at_their_cap_is_passed_over():
+    async def scenario():
+        governor = make_governor(max_concurrency=4, user_concurrency={"1": 1})
+        first = await governor.acquire(10, user=1)
+        second = asyncio.ensure_future(governor.acquire(10, user=1))
+        await asyncio.sleep(0)
+        other = await governor.acquire(10, user=2)
+        assert not second.done()
+        governor.release(first)
+        governor.release(await second)
+        governor.release(other)
+
+    asyncio.run(scenario())
+
+
+def test_a_user_out_of_quota_waits_while_others_go():
+    async def scenario():
+        governor = make_governor(user_tpm_overrides={"1": 600})
+        first = await governor.acquire(600, user=1)
+        second = asyncio.ensure_future(governor.acquire(600, user=1))
+        await asyncio.sleep(0)
+        other = await governor.acquire(600, user=2)
+        assert not second.done()
+        # About 60 seconds until the quota has refilled
+        assert governor._next()[1] == pytest.approx(60, abs=0.5)
+        second.cancel()
+        await asyncio.gather(second, return_exceptions=True)
+        governor.release(first)
+        governor.release(other)
+
+    asyncio.run(scenario())
+
+
+def test_idle_users_are_forgotten():
+    async def scenario():
+        governor = make_governor(user_tpm_overrides={"2": 600})
+        governor.release(await governor.acquire(100, user=1))
+        governor.release(await governor.acquire(100, user=2))
+        queued = await governor.acquire(100, user=3)
+        # User 2's quota has not refilled and user 3 has a call running
+        assert governor.evict_idle_flows() == 1
+        assert set(governor._flows) == {"2", "3"}
+        governor._flows["2"].quota.updated -= 60
+        governor.release(queued)
+        assert governor.evict_idle_flows() == 2
+        assert governor._flows == {}
+
+    asyncio.run(scenario())
+
+
+def test_a_user_ahead_of_the_virtual_time_is_kept_while_others_wait():
+    async def scenario():
+        governor = make_governor(max_concurrency=1)
+        first = await governor.acquire(100, user=1)
+        waiting = [asyncio.ensure_future(governor.acquire(100, user=2)) for _ in range(2)]
+        await asyncio.sleep(0)
+        governor.release(first)
+        # User 1 went first: forgetting them would move them ahead of user 2's next call
+        assert governor.evict_idle_flows() == 0
+        for task in waiting:
+            governor.release(await task)
+        assert governor.evict_idle_flows() == 2
+
+    asyncio.run(scenario())
+
+
+def test_release_sweeps_idle_users_periodically():
+    async def scenario():
+        governor = make_governor()
+        governor.release(await governor.acquire(10, user=1))
+        assert "1" in governor._flows
+        governor._last_sweep -= 120
+        governor.release(await governor.acquire(10, user=2))
+        assert governor._flows == {}
+
+    asyncio.run(scenario())
+
+
+# --- 429 handling ---
+
+def test_rate_limit_errors_are_recognised():
+    assert is_rate_limit_error(RateLimited())
+    assert is_rate_limit_error(Exception("429 RESOURCE_EXHAUSTED"))
+    assert not is_rate_limit_error(ValueError("bad JSON"))
+
+
+def test_429_is_retried_with_the_same_ticket(no_backoff):
+    async def scenario():
+        governor = make_governor()
+        inner = ScriptedLLM([RateLimited(), RateLimited()])
+        output = await GovernedLLM(inner, governor, rate_limit_retries=3).ainvoke("prompt")
+        assert output.content == "ok"
+        assert inner.calls == 3
+        assert governor.retries == 2
+        assert governor.rate_limited == 2
+        assert governor.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_429_surfaces_once_the_retries_are_used_up(no_backoff):
+    async def scenario():
+        governor = make_governor()
+        inner = ScriptedLLM([RateLimited(), RateLimited(), RateLimited()])
+        with pytest.raises(RateLimited):
+            await GovernedLLM(inner, governor, rate_limit_retries=1).ainvoke("prompt")
+        assert inner.calls == 2
+        assert governor.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_other_errors_are_not_retried(no_backoff):
+    async def scenario():
+        governor = make_governor()
+        inner = ScriptedLLM([ValueError("bad JSON")])
+        with pytest.raises(ValueError):
+            await GovernedLLM(inner, governor).ainvoke("prompt")
+        assert inner.calls == 1
+        assert governor.retries == 0
+
+    asyncio.run(scenario())
+
+
+def test_token_estimate_is_corrected_with_the_real_usage():
+    async def scenario():
+        governor = make_governor(tpm=10_000)
+        llm = GovernedLLM(ScriptedLLM(), governor)
+        before = time.monotonic()
+        await llm.ainvoke("prompt")
+        # Only the 15 tokens reported by the model stay charged
+        assert governor.tokens.tokens == pytest.approx(10_000 - 15, abs=(time.monotonic() - before) * 200)
+
+    asyncio.run(scenario())
+
+
+def test_real_usage_also_corrects_the_users_quota():
+    async def scenario():
+        governor = make_governor(user_tpm=1000)
+        llm = GovernedLLM(ScriptedLLM(), governor)
+        await llm.ainvoke("prompt")
+        assert governor._flows["none"].quota.tokens == pytest.approx(1000 - 15, abs=1)
+
+    asyncio.run(scenario())
+
+
+class FlakyFakeLLM(FakeChatModel):
+    """The offline model, answering its first `failures` calls with a 429."""
+
+    failures: int = 0
+    attempts: int = 0
+
+    def _check_failures(self) -> None:
+        self.attempts += 1
+        if self.failures:
+            self.failures -= 1
+            raise FakeRateLimitError()
+
+
+def test_every_upstream_attempt_goes_through_the_governor(no_backoff):
+    async def scenario():
+        governor = make_governor()
+        acquire = governor.acquire
+        acquired = []
+
+        async def counting_acquire(*args, **kwargs):
+            acquired.append(args)
+            return await acquire(*args, **kwargs)
+
+        governor.acquire = counting_acquire
+        inner = FlakyFakeLLM(failures=2)
+        output = await GovernedLLM(inner, governor).ainvoke("Email Body: hello")
+        assert output.content
+        assert inner.attempts == 3
+        assert len(acquired) == 3
+        assert governor.rate_limited == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,76 @@
+import base64
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.future import select
+
+from app.models import Email
+from app.routes.logs import _decode_cursor, _encode_cursor, _keyset_page
+
+
+def sql(query) -> str:
+    return str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def row(id: int, date=None):
+    return SimpleNamespace(id=id, date=date)
+
+
+def test_id_cursor_round_trip():
+    cursor = _encode_cursor("id", row(42))
+    assert _decode_cursor(cursor, "id") == [42]
+
+
+def test_date_cursor_keeps_the_id_as_tie_breaker():
+    sent = datetime(2023, 11, 6, 15, 15, 0, 123456)
+    cursor = _encode_cursor("date", row(7, sent))
+    assert _decode_cursor(cursor, "date") == [sent, 7]
+
+
+def test_cursor_from_another_sort_order_is_rejected():
+    cursor = _encode_cursor("id", row(42))
+    with pytest.raises(HTTPException) as error:
+        _decode_cursor(cursor, "date")
+    assert error.value.status_code == 400
+
+
+def encoded(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+@pytest.mark.parametrize("sort, cursor", [
+    ("id", "not base64!"),
+    ("id", encoded({})),
+    ("id", encoded(["id"])),
+    ("date", encoded(["date", "yesterday", 1])),
+])
+def test_malformed_cursor_is_a_400(sort, cursor):
+    with pytest.raises(HTTPException) as error:
+        _decode_cursor(cursor, sort)
+    assert error.value.status_code == 400
+
+
+def test_first_page_is_only_ordered():
+    query = sql(_keyset_page(select(Email.id), "id", "asc", None))
+    assert "WHERE" not in query
+    assert query.endswith("ORDER BY emails.id ASC")
+
+
+def test_next_page_by_id_starts_after_the_cursor():
+    cursor = _encode_cursor("id", row(42))
+    assert "WHERE emails.id > 42" in sql(_keyset_page(select(Email.id), "id", "asc", cursor))
+    query = sql(_keyset_page(select(Email.id), "id", "desc", cursor))
+    assert "WHERE emails.id < 42" in query
+    assert query.endswith("ORDER BY emails.id DESC")
+
+
+def test_next_page_by_date_compares_date_and_id_together():
+    cursor = _encode_cursor("date", row(7, datetime(2023, 11, 6, 15, 15)))
+    query = sql(_keyset_page(select(Email.id), "date", "desc", cursor))
+    assert "(emails.date, emails.id) < ('2023-11-06 15:15:00', 7)" in query
+    assert "emails.date IS NOT NULL" in query
+    assert query.endswith("ORDER BY emails.date DESC, emails.id DESC")
@@ -0,0 +1,31 @@
+from app.metrics import Registry
+
+
+def test_counters_gauges_and_histograms_render_in_prometheus_format():
+    registry = Registry()
+    calls = registry.counter("calls_total", "Calls.")
+    calls.inc(chain="judge", outcome="ok")
+    calls.inc(2, chain="judge", outcome="ok")
+    registry.gauge("depth", "Depth.").set(3)
+    registry.histogram("wait_seconds", "Wait.", buckets=(0.1, 1.0)).observe(0.5)
+    lines = registry.render().splitlines()
+    assert 'calls_total{chain="judge",outcome="ok"} 3' in lines
+    assert "depth 3" in lines
+    assert 'wait_seconds_bucket{le="0.1"} 0' in lines
+    assert 'wait_seconds_bucket{le="1"} 1' in lines
+    assert 'wait_seconds_bucket{le="+Inf"} 1' in lines
+    assert "wait_seconds_count 1" in lines
+
+
+def test_a_disabled_registry_keeps_nothing():
+    registry = Registry(enabled=False)
+    calls = registry.counter("calls_total", "Calls.")
+    wait = registry.histogram("wait_seconds", "Wait.")
+    calls.inc(chain="judge")
+    wait.observe(0.5, priority="bulk")
+    registry.gauge("depth", "Depth.").set(3)
+    registry.collector(lambda: [("extra", "gauge", "Extra.", [({}, 1)])])
+    assert calls is wait
+    assert calls.samples() == []
+    assert registry.metrics == [] and registry.collectors == []
+    assert registry.render() == "\n"
@@ -0,0 +1,207 @@
+import io
+import zipfile
+from datetime import datetime
+from email.message import EmailMessage
+
+from app.parsing import (
+    extract_metadata,
+    header_block_end,
+    html_to_text,
+    iter_mailbox_documents,
+    iter_mbox,
+    parse_date,
+    parse_document,
+    parse_recipients,
+    parse_upload,
+)
+
+
+def make_message_with_attachments() -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = "alice@corp.com"
+    msg["To"] = "bob@corp.com"
+    msg["Subject"] = "Draft agreement"
+    msg.set_content("Please see the attached draft.\n")
+    msg.add_alternative("<p>Please see the <b>attached</b> draft.</p>", subtype="html")
+    msg.add_attachment("Clause 4 needs counsel's review.", filename="memo.txt")
+    forwarded = EmailMessage()
+    forwarded["Subject"] = "Advice"
+    forwarded.set_content("Privileged advice.\n")
+    msg.add_attachment(forwarded)
+    msg.add_attachment(b"\x89PNG" + b"\0" * 2000, maintype="image", subtype="png", filename="logo.png")
+    return msg
+
+
+def test_header_block_is_parsed():
+    text = (
+        "From: Alice <alice@corp.com>\n"
+        "To: bob@corp.com\n"
+        "Cc: carol@corp.com\n"
+        "Date: Mon, 6 Nov 2023 15:15:00 +0000\n"
+        "Subject: Contract\n"
+        "\n"
+        "Body text.\n"
+    )
+    assert extract_metadata(text) == {
+        "From": "Alice <alice@corp.com>",
+        "To": "bob@corp.com",
+        "Cc": "carol@corp.com",
+        "Date": "Mon, 6 Nov 2023 15:15:00 +0000",
+        "Subject": "Contract",
+    }
+
+
+def test_outlook_header_names_are_mapped():
+    text = "Sent: Monday, November 6, 2023 3:15 PM\nRecipient: bob@corp.com\nRe: Budget\n\nHi"
+    assert extract_metadata(text) == {
+        "Date": "Monday, November 6, 2023 3:15 PM",
+        "To": "bob@corp.com",
+        "Subject": "Budget",
+    }
+
+
+def test_headers_in_quoted_text_are_not_picked_up():
+    text = (
+        "From: alice@corp.com\n"
+        "Subject: Re: Plan\n"
+        "\n"
+        "Sounds good.\n"
+        "\n"
+        "-----Original Message-----\n"
+        "From: counsel@law.com\n"
+        "Subject: Legal advice\n"
+    )
+    assert extract_metadata(text) == {"From": "alice@corp.com", "Subject": "Re: Plan"}
+
+
+def test_text_without_headers_has_no_metadata():
+    assert extract_metadata("Just a note.\nFrom: someone") == {}
+
+
+def test_folded_and_repeated_recipient_headers_are_combined():
+    text = (
+        "To: a@corp.com,\n"
+        "  b@corp.com\n"
+        "To: c@corp.com\n"
+        "Subject: First\n"
+        "Subject: Second\n"
+        "\n"
+    )
+    metadata = extract_metadata(text)
+    assert metadata["To"] == "a@corp.com, b@corp.com, c@corp.com"
+    # The first Subject wins
+    assert metadata["Subject"] == "First"
+
+
+def test_forward_pasted_with_its_separator_keeps_its_headers():
+    text = "---------- Forwarded message ---------\nFrom: a@corp.com\nSubject: Fwd\n\nBody"
+    assert extract_metadata(text) == {"From": "a@corp.com", "Subject": "Fwd"}
+
+
+def test_unknown_and_empty_headers_are_skipped():
+    text = "X-Mailer: Outlook\nFrom: a@corp.com\nCc:\n\nBody"
+    assert extract_metadata(text) == {"From": "a@corp.com"}
+
+
+def test_header_block_end():
+    text = "From: a@corp.com\nSubject: Hi\n\nBody"
+    assert text[header_block_end(text):] == "Body"
+    assert header_block_end("No headers here\n\nBody") == 0
+
+
+def test_recipients_from_to_and_cc_without_duplicates():
+    metadata = {"To": "Bob <bob@corp.com>, carol@corp.com", "Cc": "bob@corp.com, dan@law.com"}
+    assert parse_recipients(metadata) == ["bob@corp.com", "carol@corp.com", "dan@law.com"]
+
+
+def test_dates_in_common_formats_are_parsed_to_naive_utc():
+    expected = datetime(2023, 11, 6, 15, 15)
+    assert parse_date("Mon, 6 Nov 2023 15:15:00 +0000") == expected
+    assert parse_date("Mon, 6 Nov 2023 10:15:00 -0500") == expected
+    assert parse_date("2023-11-06T15:15:00Z") == expected
+    assert parse_date("Monday, November 6, 2023 3:15 PM") == expected
+    assert parse_date("11/06/2023 3:15 PM") == expected
+    assert parse_date("November 6, 2023") == datetime(2023, 11, 6)
+
+
+def test_unrecognisable_dates_are_none():
+    assert parse_date("next Tuesday") is None
+    assert parse_date(None) is None
+
+
+def test_plain_text_document_uses_its_filename_as_subject():
+    assert parse_document("Notes.TXT", b"hello") == ("hello", {"Subject": "notes.txt"})
+
+
+def test_eml_document():
+    raw = b"From: a@corp.com\nTo: b@corp.com\nSubject: Hi\nMessage-ID: <m1@corp>\n\nBody text\n"
+    body, metadata = parse_document("mail.eml", raw)
+    assert body == "Body text\n"
+    assert metadata["Subject"] == "Hi"
+    assert metadata["Message-ID"] == "<m1@corp>"
+
+
+def test_mbox_messages_are_split_and_unescaped():
+    mbox = (
+        b"From alice@corp.com Mon Nov  6 15:15:00 2023\n"
+        b"Subject: One\n\nFirst\n>From the start\n"
+        b"From bob@corp.com Mon Nov  6 16:00:00 2023\n"
+        b"Subject: Two\n\nSecond\n"
+    )
+    messages = list(iter_mbox(io.BytesIO(mbox)))
+    assert [name for name, _ in messages] == ["message-000001.eml", "message-000002.eml"]
+    assert b"\nFrom the start\n" in messages[0][1]
+
+
+def test_zip_members_are_read_and_resource_forks_skipped():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("mail/a.eml", "Subject: A\n\nBody A\n")
+        archive.writestr("mail/b.txt", "Body B")
+        archive.writestr("__MACOSX/mail/._a.eml", "junk")
+        archive.writestr("mail/image.png", "junk")
+    buffer.seek(0)
+    documents = list(iter_mailbox_documents("upload.zip", buffer))
+    assert documents == [("Body A\n", {"Subject": "A", "From": "Unknown", "To": "Unknown", "Date": None}),
+                         ("Body B", {"Subject": "b.txt"})]
+
+
+def test_html_is_reduced_to_its_visible_text():
+    html = "<html><head><title>T</title><style>p {}</style></head><body><p>One  two</p><div>Three<br>Four</div></body></html>"
+    assert html_to_text(html) == "One two\n\nThree\nFour"
+
+
+def test_eml_upload_returns_the_plain_body_and_its_attachments():
+    raw = make_message_with_attachments().as_bytes()
+    body, metadata, attachments = parse_upload("mail.eml", io.BytesIO(raw))
+    assert body == "Please see the attached draft.\n"
+    assert metadata["Subject"] == "Draft agreement"
+    assert [(a.filename, a.content_type) for a in attachments] == [
+        ("memo.txt", "text/plain"), ("Advice.eml", "message/rfc822"), ("logo.png", "image/png"),
+    ]
+    assert attachments[0].payload == b"Clause 4 needs counsel's review.\n"
+    assert b"Privileged advice." in attachments[1].payload
+    assert all(a.skipped is None for a in attachments)
+
+
+def test_html_only_body_is_converted():
+    msg = EmailMessage()
+    msg["Subject"] = "HTML"
+    msg.set_content("<p>Hello <i>there</i></p>", subtype="html")
+    msg.add_attachment("notes", filename="a.txt")
+    body, _, attachments = parse_upload("mail.eml", io.BytesIO(msg.as_bytes()))
+    assert body == "Hello there"
+    assert len(attachments) == 1
+
+
+def test_oversized_attachments_are_skipped_without_their_payload():
+    raw = make_message_with_attachments().as_bytes()
+    _, _, attachments = parse_upload("mail.eml", io.BytesIO(raw), max_attachment_bytes=1000)
+    logo = attachments[-1]
+    assert logo.payload == b""
+    assert logo.skipped == "larger than 1000 bytes"
+    assert attachments[0].skipped is None
+
+
+def test_text_upload_has_no_attachments():
+    assert parse_upload("Notes.txt", io.BytesIO(b"hello")) == ("hello", {"Subject": "notes.txt"}, [])
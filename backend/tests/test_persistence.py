@@ -0,0 +1,10 @@
+from app.persistence import email_values
+
+
+def test_nul_characters_are_replaced_without_moving_offsets():
+    values = email_values("a\x00b counsel", {"Subject": "S\x00", "From": "x@corp.com"}, 7)
+    assert values["body"] == "a�b counsel"
+    assert values["body"].index("counsel") == "a\x00b counsel".index("counsel")
+    assert values["subject"] == "S�"
+    assert values["cc"] is None
+    assert values["user_id"] == 7
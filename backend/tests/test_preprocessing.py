@@ -0,0 +1,100 @@
+import pytest
+
+from app import preprocessing
+from app.preprocessing import (
+    prepare_body,
+    preprocess_fingerprint,
+    split_chunks,
+    strip_disclaimers,
+    strip_quoted_history,
+    strip_signature,
+)
+
+
+def test_quoted_history_after_a_reply_separator_is_cut():
+    text = "Please hold the filing.\n\nOn Mon, Nov 6, 2023 at 3:15 PM Bob <b@x.com> wrote:\n> earlier\n"
+    assert strip_quoted_history(text) == "Please hold the filing.\n\n"
+
+
+def test_outlook_style_forward_header_is_a_quote():
+    text = "See below.\n\nFrom: Bob <b@x.com>\nSent: Monday, November 6, 2023\nSubject: old\n\nold body"
+    assert strip_quoted_history(text) == "See below.\n\n"
+
+
+def test_quoted_lines_are_cut():
+    assert strip_quoted_history("Agreed.\n> You said\n> this\n") == "Agreed.\n"
+
+
+def test_the_messages_own_headers_are_not_a_quote():
+    text = "From: a@corp.com\nDate: Mon, 6 Nov 2023\nSubject: Hi\n\nBody only"
+    assert strip_quoted_history(text) == text
+
+
+def test_signature_and_mobile_footer_are_cut():
+    assert strip_signature("Thanks\n-- \nAlice\nCEO") == "Thanks\n"
+    assert strip_signature("Thanks\nSent from my iPhone") == "Thanks\n"
+
+
+def test_disclaimer_paragraphs_are_dropped():
+    text = "Real content.\n\nThis message is intended only for the named recipient. If you received this email in error, delete it."
+    assert strip_disclaimers(text) == "Real content."
+
+
+def test_short_text_is_one_chunk():
+    assert split_chunks("short", max_tokens=10) == ["short"]
+
+
+def test_chunks_follow_paragraphs_and_stay_under_the_limit():
+    paragraphs = [f"paragraph {i} " + "x" * 50 for i in range(10)]
+    chunks = split_chunks("\n\n".join(paragraphs), max_tokens=40)  # 160 characters
+    assert all(len(chunk) <= 160 for chunk in chunks)
+    assert "\n\n".join(chunks) == "\n\n".join(paragraphs)
+
+
+def test_overlong_paragraph_is_cut_at_spaces_then_characters():
+    words = " ".join(["word"] * 100)
+    chunks = split_chunks(words, max_tokens=10)
+    assert all(len(chunk) <= 40 for chunk in chunks)
+    assert " ".join(chunks).split() == words.split()
+    assert all(len(chunk) == 40 for chunk in split_chunks("y" * 200, max_tokens=10))
+
+
+def test_prepare_body_records_what_it_removed():
+    text = (
+        "Can we settle before trial?\n"
+        "-- \n"
+        "Alice\n"
+    )
+    prepared = prepare_body(text + "\nOn Mon, Bob wrote:\n> old\n")
+    assert prepared.text == "Can we settle before trial?"
+    assert prepared.removed == ["quoted", "signature"]
+    assert prepared.chunks == [prepared.text]
+    assert prepared.tokens < prepared.raw_tokens
+    assert not prepared.truncated
+
+
+def test_bare_forward_keeps_its_text():
+    text = "---------- Forwarded message ---------\nFrom: a@corp.com\n\nThe forwarded body"
+    assert prepare_body(text).text == text.strip()
+
+
+def test_chunks_beyond_the_cap_are_dropped(monkeypatch):
+    monkeypatch.setattr(preprocessing, "LLM_MAX_CHUNKS", 2)
+    paragraph = "z" * (preprocessing.LLM_CHUNK_TOKENS * 4 - 10)
+    prepared = prepare_body("\n\n".join([paragraph] * 3))
+    assert len(prepared.chunks) == 2
+    assert prepared.truncated
+
+
+def test_fingerprint_follows_the_settings(monkeypatch):
+    before = preprocess_fingerprint()
+    assert before == preprocess_fingerprint()
+    monkeypatch.setattr(preprocessing, "LLM_CHUNK_TOKENS", preprocessing.LLM_CHUNK_TOKENS + 1)
+    assert preprocess_fingerprint() != before
+
+
+@pytest.mark.parametrize("setting", ["PREPROCESS_VERSION", "PREPROCESS_STRIP_QUOTED", "LLM_MAX_CHUNKS"])
+def test_fingerprint_covers_every_setting(monkeypatch, setting):
+    before = preprocess_fingerprint()
+    monkeypatch.setattr(preprocessing, setting, "changed")
+    assert preprocess_fingerprint() != before
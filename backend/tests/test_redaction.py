@@ -0,0 +1,113 @@
+import random
+
+import pytest
+
+from app import redaction
+from app.redaction import (
+    CollapsedText,
+    RedactionMatcher,
+    find_patterns,
+    redaction_texts,
+    render_redacted,
+    resolve_spans,
+    unresolved_texts,
+    use_automaton,
+)
+
+
+def test_collapsed_text_maps_offsets_back_to_the_original():
+    original = "Settle  the\n\tclaim now.\r\n\r\nThanks"
+    collapsed = CollapsedText(original)
+    assert collapsed.text == "Settle the claim now. Thanks"
+    for offset, char in enumerate(collapsed.text):
+        mapped = collapsed.original_offset(offset)
+        if char == " ":
+            assert original[mapped].isspace()
+        else:
+            assert original[mapped] == char
+
+
+def test_collapsed_text_without_runs_is_unchanged():
+    collapsed = CollapsedText("one two three")
+    assert collapsed.text == "one two three"
+    assert [collapsed.original_offset(i) for i in (0, 4, 13)] == [0, 4, 13]
+
+
+def test_spans_point_into_the_original_body_whatever_the_whitespace():
+    body = "Hi team,\n\nCounsel advised we\n   settle the claim.\nCounsel advised we settle the claim!"
+    spans = resolve_spans(body, ["Counsel advised we settle the claim", "not in the body"])
+    resolved = [s for s in spans if s["start"] is not None]
+    assert [body[s["start"]:s["end"]] for s in resolved] == [
+        "Counsel advised we\n   settle the claim",
+        "Counsel advised we settle the claim",
+    ]
+    assert spans[-1] == {"text": "not in the body", "start": None, "end": None}
+    assert unresolved_texts(spans) == ["not in the body"]
+
+
+def test_items_that_differ_only_in_whitespace_share_their_spans():
+    spans = resolve_spans("a secret plan", ["secret  plan", "secret plan", " "])
+    assert spans == [{"text": "secret  plan", "start": 2, "end": 13}]
+    assert redaction_texts(spans) == ["secret  plan"]
+
+
+def test_no_items_no_spans():
+    assert resolve_spans("body", None) == []
+    assert redaction_texts([]) is None
+
+
+def test_render_merges_overlapping_and_adjacent_spans():
+    body = "0123456789"
+    spans = [
+        {"text": "a", "start": 1, "end": 3},
+        {"text": "b", "start": 2, "end": 5},
+        {"text": "c", "start": 5, "end": 6},
+        {"text": "d", "start": 8, "end": 9},
+        {"text": "e", "start": None, "end": None},
+        {"text": "f", "start": 7, "end": 42},  # out of range: ignored
+    ]
+    assert render_redacted(body, spans, "#") == ("0#67#9", 2)
+
+
+def test_render_without_spans_returns_the_body():
+    assert render_redacted("body", None) == ("body", 0)
+
+
+def test_automaton_finds_overlapping_occurrences():
+    matcher = RedactionMatcher(["he", "she", "hers", "his"])
+    found = sorted(matcher.find("ushers and his"))
+    assert found == [(0, 2, 4), (1, 1, 4), (2, 2, 6), (3, 11, 14)]
+
+
+def test_automaton_and_str_find_agree():
+    rng = random.Random(3)
+    words = ["claim", "settle", "counsel", "advice", "draft", "clai"]
+    text = " ".join(rng.choice(words) for _ in range(2000))
+    patterns = list(dict.fromkeys(" ".join(rng.choice(words) for _ in range(rng.randint(1, 3))) for _ in range(40)))
+    assert sorted(RedactionMatcher(patterns).find(text)) == sorted(redaction._find_each(text, patterns))
+
+
+def test_few_patterns_use_str_find():
+    assert not use_automaton("x" * 10_000_000, ["a pattern"] * (redaction.MATCHER_MIN_PATTERNS - 1))
+
+
+def test_many_patterns_on_a_short_body_use_str_find():
+    assert not use_automaton("x" * 10_000, ["a redacted passage of some length"] * 2000)
+
+
+def test_many_patterns_on_a_long_body_use_the_automaton():
+    assert use_automaton("x" * 2_000_000, ["a redacted passage of some length"] * 1000)
+
+
+@pytest.mark.parametrize("automaton", [True, False])
+def test_both_paths_resolve_the_same_spans(monkeypatch, automaton):
+    used = []
+    find_each, matcher_find = redaction._find_each, RedactionMatcher.find
+    monkeypatch.setattr(redaction, "use_automaton", lambda text, patterns: automaton)
+    monkeypatch.setattr(redaction, "_find_each", lambda *args: used.append("str.find") or find_each(*args))
+    monkeypatch.setattr(RedactionMatcher, "find", lambda *args: used.append("automaton") or matcher_find(*args))
+
+    body = "Please  keep\nthis quiet. Keep this quiet. keep this quiet"
+    spans = resolve_spans(body, ["keep this quiet", "Keep this quiet"])
+    assert [(s["start"], s["end"]) for s in spans] == [(8, 23), (25, 40), (42, 57)]
+    assert used == ["automaton" if automaton else "str.find"]
@@ -0,0 +1,18 @@
+from app.triage import join_recipients, legal_signals
+
+
+def test_recipients_join_to_and_cc():
+    assert join_recipients("a@corp.com", "b@corp.com") == "a@corp.com, b@corp.com"
+    assert join_recipients("a@corp.com", None) == "a@corp.com"
+    assert join_recipients(None, None) == ""
+
+
+def test_counsel_on_cc_is_a_legal_signal():
+    recipients = join_recipients("ops@corp.com", "jane@smithllp.com")
+    assert legal_signals("ceo@corp.com", recipients, "Q3 numbers", "See attached.") == [
+        "legal-looking address jane@smithllp.com"
+    ]
+
+
+def test_plain_business_email_has_no_legal_signal():
+    assert legal_signals("ceo@corp.com", join_recipients("ops@corp.com", None), "Q3 numbers", "See attached.") == []
@@ -0,0 +1,50 @@
+import asyncio
+
+from app.jobs import attachments_from_json, attachments_to_json
+from app.parsing import AttachmentPart
+from app.uploads import AttachmentExtractor, extract_attachment
+
+
+def test_text_and_html_attachments_are_extracted():
+    text = extract_attachment(AttachmentPart("memo.txt", "text/plain", "latin-1", "Café terms".encode("latin-1")))
+    assert text.text == "Café terms"
+    assert text.size == 10
+    assert text.sha256 is not None
+    html = extract_attachment(AttachmentPart("page.htm", "application/octet-stream", None, b"<p>Hi</p><script>x()</script>"))
+    assert html.text == "Hi"
+
+
+def test_attached_messages_are_parsed_with_their_attachments():
+    inner = (
+        b"Subject: Inner\nContent-Type: multipart/mixed; boundary=b\n\n"
+        b"--b\nContent-Type: text/plain\n\nInner body\n"
+        b"--b\nContent-Type: text/plain\nContent-Disposition: attachment; filename=n.txt\n\nNested note\n"
+        b"--b--\n"
+    )
+    extracted = extract_attachment(AttachmentPart("fwd.eml", "message/rfc822", None, inner))
+    assert extracted.text == "Inner body"
+    assert extracted.metadata["Subject"] == "Inner"
+    assert [(a.filename, a.text) for a in extracted.attachments] == [("n.txt", "Nested note")]
+
+
+def test_unsupported_empty_and_skipped_attachments_have_a_reason():
+    assert extract_attachment(AttachmentPart("logo.png", "image/png", None, b"\x89PNG")).skipped == "no text extraction for image/png"
+    assert extract_attachment(AttachmentPart("blank.txt", "text/plain", None, b" \n")).skipped == "no text"
+    big = extract_attachment(AttachmentPart("big.txt", "text/plain", None, b"", skipped="larger than 10 bytes"))
+    assert (big.size, big.sha256, big.skipped) == (0, None, "larger than 10 bytes")
+
+
+def test_extractor_without_workers_runs_in_a_thread():
+    parts = [AttachmentPart("a.txt", "text/plain", None, b"A"), AttachmentPart("b.bin", "application/zip", None, b"PK")]
+    results = asyncio.run(AttachmentExtractor(workers=0).extract(parts))
+    assert [r.text for r in results] == ["A", None]
+    assert results[1].skipped == "no text extraction for application/zip"
+
+
+def test_job_attachments_survive_a_json_round_trip():
+    parts = [
+        AttachmentPart("memo.txt", "text/plain", "utf-8", b"\x00\xffbytes"),
+        AttachmentPart("big.pdf", "application/pdf", None, b"", skipped="larger than 10 bytes"),
+    ]
+    assert attachments_from_json(attachments_to_json(parts)) == parts
+    assert attachments_from_json(None) == []